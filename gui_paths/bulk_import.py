@@ -0,0 +1,239 @@
+"""
+Bulk import of CV and state definitions from CSV, JSON, or YAML tables.
+
+Each record is a dict with a ``kind`` of either ``'cv'`` or ``'state'``.
+JSON and YAML files can instead give separate ``cvs`` and ``states`` lists,
+in which case ``kind`` is implied. CSV files need a ``kind`` column; empty
+cells are ignored.
+
+CV records take the same fields as the CV dialog: ``name``,
+``groupid_style_args``, and optionally ``extract_style``,
+``extract_type``, and ``class_name``. State records take ``name``, ``cv``
+(the name of the CV), ``lambda_min``, ``lambda_max``, and, for periodic
+CVs, ``period_min`` and ``period_max``. Any other field is an error.
+"""
+import csv
+import json
+
+from .code_writers import CVCodeWriter, VolumeCodeWriter, StringWrapper
+
+CV_DEFAULTS = {'class_name': "LAMMPSComputeCV",
+               'extract_style': 0,
+               'extract_type': 0}
+
+CV_FIELDS = set(['kind', 'name', 'groupid_style_args', 'extract_style',
+                 'extract_type', 'class_name'])
+STATE_FIELDS = set(['kind', 'name', 'cv', 'lambda_min', 'lambda_max',
+                    'period_min', 'period_max'])
+CV_CLASSES = set(['LAMMPSComputeCV'])
+
+
+def _load_yaml(stream):
+    try:
+        import yaml
+    except ImportError:  # pragma: no cover
+        raise RuntimeError("Importing YAML files requires PyYAML")
+    try:
+        return yaml.safe_load(stream)
+    except yaml.YAMLError as err:
+        raise ValueError("Invalid YAML: " + str(err))
+
+
+def _load_csv(stream):
+    try:
+        return [{key: value for key, value in row.items()
+                 if value not in (None, '')}
+                for row in csv.DictReader(stream, strict=True)]
+    except csv.Error as err:
+        raise ValueError("Invalid CSV: " + str(err))
+
+
+def _records_from_mapping(data):
+    if data is None:
+        return []  # empty file
+    if isinstance(data, list):
+        return data
+    if not isinstance(data, dict):
+        raise ValueError("Bulk import needs a list of records, or a "
+                         "mapping with 'cvs' and 'states' lists")
+    records = []
+    for key, kind in [('cvs', 'cv'), ('states', 'state')]:
+        section = data.get(key, [])
+        if not isinstance(section, list):
+            raise ValueError("'" + key + "' must be a list of records")
+        for record in section:
+            if isinstance(record, dict):
+                record = dict(record)
+                record.setdefault('kind', kind)
+            records.append(record)  # others are reported as errors
+    return records
+
+
+def load_records(filename):
+    """Read the records in a CSV, JSON, or YAML file.
+
+    Raises ValueError if the file can't be parsed, or isn't laid out as
+    records; problems in the records themselves are found by
+    :func:`.build_writers`.
+    """
+    ext = filename.rsplit('.', 1)[-1].lower()
+    with open(filename, mode='r') as f:
+        if ext == 'csv':
+            return _load_csv(f)
+        elif ext == 'json':
+            return _records_from_mapping(json.load(f))
+        elif ext in ('yml', 'yaml'):
+            return _records_from_mapping(_load_yaml(f))
+    raise ValueError("Unknown file type for bulk import: " + filename)
+
+
+def _float(record, key, errors, label):
+    try:
+        return float(record[key])
+    except KeyError:
+        errors.append(label + ": missing " + key)
+    except (TypeError, ValueError):
+        errors.append(label + ": " + key + " is not a number")
+
+
+def _check_fields(record, fields, errors, label):
+    unknown = sorted(str(key) for key in set(record) - fields)
+    if unknown:
+        errors.append(label + ": unknown field(s) " + ", ".join(unknown))
+
+
+def _check_cv(record, errors, label):
+    _check_fields(record, CV_FIELDS, errors, label)
+    kwargs = dict(CV_DEFAULTS)
+    kwargs.update({key: value for key, value in record.items()
+                   if key in CV_FIELDS and key != 'kind'})
+    if not kwargs.get('groupid_style_args'):
+        errors.append(label + ": missing groupid_style_args")
+    elif not isinstance(kwargs['groupid_style_args'], str):
+        errors.append(label + ": groupid_style_args must be a string")
+    if (not isinstance(kwargs['class_name'], str)
+            or kwargs['class_name'] not in CV_CLASSES):
+        errors.append(label + ": unknown class_name "
+                      + repr(kwargs['class_name']))
+    for key in ['extract_style', 'extract_type']:
+        try:
+            kwargs[key] = int(kwargs[key])
+        except (TypeError, ValueError):
+            kwargs[key] = None
+        if kwargs[key] not in (0, 1, 2):
+            errors.append(label + ": " + key + " must be 0, 1, or 2")
+    kwargs['engine'] = "engine"
+    return kwargs
+
+
+def _check_state(record, errors, label, cv_names):
+    _check_fields(record, STATE_FIELDS, errors, label)
+    cv_name = record.get('cv')
+    if not isinstance(cv_name, str) or cv_name not in cv_names:
+        errors.append(label + ": unknown CV " + repr(cv_name))
+    lambda_min = _float(record, 'lambda_min', errors, label)
+    lambda_max = _float(record, 'lambda_max', errors, label)
+    is_periodic = 'period_min' in record or 'period_max' in record
+    kwargs = {'cv': cv_name, 'name': record['name'],
+              'lambda_min': lambda_min, 'lambda_max': lambda_max}
+    if is_periodic:
+        kwargs['period_min'] = _float(record, 'period_min', errors, label)
+        kwargs['period_max'] = _float(record, 'period_max', errors, label)
+        bounds = (kwargs['period_min'], kwargs['period_max'])
+    else:
+        bounds = (lambda_min, lambda_max)
+    if None not in bounds and not bounds[0] < bounds[1]:
+        errors.append(label + ": minimum must be less than maximum")
+    return kwargs
+
+
+def _state_writer(kwargs, cvs):
+    periodic = 'Periodic' if 'period_min' in kwargs else ''
+    # explicit float calls are the same trick StateController uses for inf
+    writer_kwargs = dict(
+        class_name=periodic + "CVDefinedVolume",
+        is_state=True,
+        collectivevariable=cvs[kwargs['cv']].bound_name,
+        name=kwargs['name'],
+        lambda_min=StringWrapper("float('{}')".format(kwargs['lambda_min'])),
+        lambda_max=StringWrapper("float('{}')".format(kwargs['lambda_max']))
+    )
+    if periodic:
+        writer_kwargs.update(period_min=kwargs['period_min'],
+                             period_max=kwargs['period_max'])
+    return VolumeCodeWriter(**writer_kwargs)
+
+
+def build_writers(records, cvs=None, states=None):
+    """Validate records and create the code writers for them.
+
+    All records are checked before any writer is created, so either
+    everything is imported or nothing is.
+
+    Parameters
+    ----------
+    records : list of dict
+        the CV and state definitions
+    cvs : dict
+        existing CVs (name to writer); states may refer to these
+    states : dict
+        existing states (name to writer)
+
+    Returns
+    -------
+    new_cvs : list of (str, :class:`.CVCodeWriter`)
+    new_states : list of (str, :class:`.VolumeCodeWriter`)
+
+    Raises
+    ------
+    ValueError
+        listing every problem found in the records
+    """
+    cvs = cvs if cvs is not None else {}
+    states = states if states is not None else {}
+    errors = []
+    cv_kwargs = []
+    state_records = []
+    seen = {'cv': set(cvs), 'state': set(states)}
+    for num, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors.append("Record " + str(num + 1) + ": not a mapping")
+            continue
+        kind = record.get('kind')
+        name = record.get('name')
+        label = "Record " + str(num + 1) + " (" + str(name) + ")"
+        if kind not in seen:
+            errors.append(label + ": kind must be 'cv' or 'state'")
+            continue
+        if not name:
+            errors.append(label + ": missing name")
+            continue
+        if not isinstance(name, str):
+            errors.append(label + ": name must be a string")
+            continue
+        if name in seen[kind]:
+            errors.append(label + ": duplicate " + kind + " name")
+        seen[kind].add(name)
+        if kind == 'cv':
+            cv_kwargs.append(_check_cv(record, errors, label))
+        else:
+            state_records.append((record, label))
+
+    state_kwargs = [_check_state(record, errors, label, seen['cv'])
+                    for record, label in state_records]
+
+    if errors:
+        raise ValueError("\n".join(errors))
+
+    new_cvs = [(kwargs['name'], CVCodeWriter(**kwargs))
+               for kwargs in cv_kwargs]
+    all_cvs = dict(cvs)
+    all_cvs.update(new_cvs)
+    new_states = [(kwargs['name'], _state_writer(kwargs, all_cvs))
+                  for kwargs in state_kwargs]
+    return new_cvs, new_states
+
+
+def import_file(filename, cvs=None, states=None):
+    """Load and validate a table; see :func:`.build_writers`"""
+    return build_writers(load_records(filename), cvs, states)
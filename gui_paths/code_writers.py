@@ -1,8 +1,10 @@
 import sys
+import textwrap
 if sys.version_info > (3,):
     basestring = str
 
-from .snippets import OPS_LOAD_TRAJ
+from .snippets import (OPS_LOAD_TRAJ, OPS_LOAD_SNAPSHOTS, WALKERS_RUN,
+                       CONCURRENT_HALVES, RESUME_SETUP, RESUME_RUN)
 
 class StringWrapper(object):
     """Hack to allow special string to be printed correctly"""
@@ -121,22 +123,108 @@ class NamedObjectCodeWriter(object):
 
 
 class CVCodeWriter(NamedObjectCodeWriter):
+    """CV code writer.
+
+    If ``value_store`` is set to the filename of a
+    :class:`.cv_store.CVValueStore`, the CV is wrapped in a
+    ``paths.FunctionCV`` that looks values up in the store before
+    computing them, instead of using a disk cache of its own. The store key
+    combines the CV's definition with the LAMMPS script (``data``). CVs
+    fused by :class:`.FusedComputeCVsWriter` don't use the store.
+    """
     object_inputs = ['f', 'engine']
     bound_label = "cv"
     creation_counter = 0
-    def __init__(self, name, class_name, **kwargs):
+    def __init__(self, name, class_name, value_store=None, **kwargs):
         # special treatment of name, bc all OPS CVs must take names in
         # initialization
         super(CVCodeWriter, self).__init__(class_name, name=name, **kwargs)
         self.kwargs['name'] = self.name
         self.name = None
         self.base = "ops_lammps"  #TODO: modify this in the controller?
+        self.value_store = value_store
+
+    @property
+    def definition(self):
+        """The CV class and parameters, without its name"""
+        kwarg_str = ", ".join(self._make_kwarg_str(key, value)
+                              for key, value in sorted(self.kwargs.items())
+                              if key != 'name')
+        return self.class_name + "(" + kwarg_str + ")"
+
+    @property
+    def code(self):
+        if self.value_store is None:
+            code = super(CVCodeWriter, self).code + "\n"
+            code += self.bound_name + ".enable_diskcache()"
+            return code
+
+        # the wrapped CV is renamed, so the wrapper can take the user's name
+        name = self.kwargs['name']
+        inner_kwargs = dict(self.kwargs, name=name + " (computed)")
+        kwarg_str = ", ".join(self._make_kwarg_str(key, value)
+                              for key, value in inner_kwargs.items())
+        code = "{bound} = {base}.{class_name}({kwargs})\n"
+        code += "{bound} = paths.FunctionCV({name}, stored_cv_value, "
+        code += "cv={bound}, store_file={store},\n"
+        code += "    cv_key=cv_store_key({definition}, data))"
+        return code.format(bound=self.bound_name, base=self.base,
+                           class_name=self.class_name, kwargs=kwarg_str,
+                           name=repr(name), store=repr(self.value_store),
+                           definition=repr(self.definition))
+
+
+class FusedComputeCVsWriter(object):
+    """LAMMPS compute CVs on the same engine, evaluated in a single pass.
+
+    Replaces the code of each :class:`.CVCodeWriter` with a
+    ``paths.FunctionCV`` that reads its value from a
+    :class:`.FusedComputes` shared by the whole group. The CVs keep their
+    bound names, so volumes can refer to them as usual.
+
+    Parameters
+    ----------
+    cvs : list of :class:`.CVCodeWriter`
+        the CVs to fuse; all must be ``LAMMPSComputeCV`` on one engine
+    count : int or None
+        number used in the bound name; by default, the next one from the
+        creation counter
+    """
+    bound_label = "fused_computes"
+    creation_counter = 0
+    def __init__(self, cvs, count=None):
+        self.cvs = cvs
+        if count is None:
+            self.__class__.creation_counter += 1
+            count = self.__class__.creation_counter
+        self.count = count
+
+    @property
+    def bound_name(self):
+        return "{}_{}".format(self.bound_label, str(self.count))
+
+    @staticmethod
+    def fusable(cv):
+        return cv.class_name == "LAMMPSComputeCV"
 
     @property
     def code(self):
-        code = super(CVCodeWriter, self).code + "\n"
-        code += self.bound_name + ".enable_diskcache()"
-        return code
+        # compute IDs use bound names, since CV names may have spaces
+        computes = [[cv.bound_name, cv.kwargs['groupid_style_args'],
+                     cv.kwargs.get('extract_style', 0),
+                     cv.kwargs.get('extract_type', 0)]
+                    for cv in self.cvs]
+        lines = self.bound_name + " = [\n"
+        lines += "".join("    " + repr(compute) + ",\n"
+                         for compute in computes)
+        lines += "]\n"
+        for cv in self.cvs:
+            lines += cv.bound_name + " = paths.FunctionCV("
+            lines += repr(cv.kwargs['name']) + ", fused_compute, "
+            lines += "computes=" + self.bound_name + ", "
+            lines += "compute_id='" + cv.bound_name + "')\n"
+            lines += cv.bound_name + ".enable_diskcache()\n"
+        return lines[:-1]
 
 
 class VolumeCodeWriter(NamedObjectCodeWriter):
@@ -147,30 +235,345 @@ class VolumeCodeWriter(NamedObjectCodeWriter):
         super(VolumeCodeWriter, self).__init__(class_name, name, **kwargs)
         self.is_state = is_state
 
+class TransitionsWriter(object):
+    """Transitions (initial state, final state) to sample with TPS.
+
+    Parameters
+    ----------
+    pairs : list of (:class:`.VolumeCodeWriter`, :class:`.VolumeCodeWriter`)
+        the selected transitions; if None, every state is both initial and
+        final for more than two states, and for two states the transition
+        is from the first to the second
+    """
+    def __init__(self, pairs=None):
+        self.pairs = pairs
+
+    @property
+    def code(self):
+        if self.pairs is None:
+            lines = "if len(states) > 2:\n"
+            lines += "    transitions = [(initial, final)\n"
+            lines += "                   for initial in states\n"
+            lines += "                   for final in states\n"
+            lines += "                   if initial is not final]\n"
+            lines += "else:\n"
+            lines += "    transitions = [tuple(states)]"
+            return lines
+        pairs_str = ", ".join("({}, {})".format(initial.bound_name,
+                                                final.bound_name)
+                              for initial, final in self.pairs)
+        return "transitions = [" + pairs_str + "]"
+
+
+class InterfaceSetWriter(object):
+    """TIS interfaces out of one state, as a ``paths.InterfaceSet``.
+
+    Each interface is a :class:`.VolumeCodeWriter` for the region between
+    the state side and the interface's CV value.
+
+    Parameters
+    ----------
+    state : :class:`.VolumeCodeWriter`
+        the state the interfaces belong to
+    cv : str
+        bound name of the CV, e.g., ``cv_1``
+    lambdas : list of float
+        interface values, from the state outward
+    increasing : bool
+        whether the CV increases away from the state
+    """
+    bound_label = "interfaces"
+    creation_counter = 0
+    def __init__(self, state, cv, lambdas, increasing=True):
+        self.state = state
+        self.cv = cv
+        self.lambdas = lambdas
+        self.increasing = increasing
+        self.__class__.creation_counter += 1
+        self.count = self.__class__.creation_counter
+        self.volumes = [self._volume_writer(idx, lambda_)
+                        for idx, lambda_ in enumerate(lambdas)]
+
+    @property
+    def bound_name(self):
+        return "{}_{}".format(self.bound_label, str(self.count))
+
+    def _volume_writer(self, idx, lambda_):
+        bounds = ["float('-inf')", "float('{}')".format(float(lambda_))]
+        if not self.increasing:
+            bounds = ["float('{}')".format(float(lambda_)), "float('inf')"]
+        name = None
+        if self.state.name:
+            name = "{} interface {}".format(self.state.name, idx)
+        return VolumeCodeWriter(class_name="CVDefinedVolume",
+                                is_state=False,
+                                name=name,
+                                collectivevariable=self.cv,
+                                lambda_min=StringWrapper(bounds[0]),
+                                lambda_max=StringWrapper(bounds[1]))
+
+    @property
+    def code(self):
+        lines = "".join(volume.code + "\n" for volume in self.volumes)
+        volumes_str = ", ".join(volume.bound_name for volume in self.volumes)
+        lambdas_str = ", ".join(repr(float(l)) for l in self.lambdas)
+        lines += "{bound} = paths.InterfaceSet([{volumes}], cv={cv}, "
+        lines += "lambdas=[{lambdas}])"
+        return lines.format(bound=self.bound_name, volumes=volumes_str,
+                            cv=self.cv, lambdas=lambdas_str)
+
+
 class StorageWriter(object):
+    """Output storage; with ``filename`` None, nothing is saved to it
+    (e.g., when each TPS walker has its own storage).
+
+    With ``mode='a'``, an existing file is reopened to be appended to (see
+    :class:`.CheckpointWriter`), and a new one is created otherwise.
+    """
     def __init__(self, filename, mode):
         self.filename = filename
         self.mode = mode
 
     @property
     def code(self):
+        if self.filename is None:
+            return "storage = None"
         storage_str = "storage = paths.Storage('{filename}', mode='{mode}')"
+        if self.mode == 'a':
+            lines = "if os.path.exists('" + self.filename + "'):\n"
+            lines += "    " + storage_str.format(filename=self.filename,
+                                                 mode='a') + "\n"
+            lines += "else:\n"
+            lines += "    " + storage_str.format(filename=self.filename,
+                                                 mode='w')
+            return lines
         return storage_str.format(filename=self.filename, mode=self.mode)
 
 
+class CheckpointWriter(object):
+    """Path sampling that resumes from its storage if restarted.
+
+    The storage is synced every ``checkpoint_frequency`` MC steps. If the
+    storage already has steps (from a run that was killed), the setup is
+    skipped: the simulation is loaded from the last saved step, and
+    continues until the total number of steps is ``n_sim_steps``. Use
+    with a ``StorageWriter`` in mode 'a'.
+
+    Parameters
+    ----------
+    n_sim_steps : int
+        total number of MC steps, including those of earlier runs
+    checkpoint_frequency : int
+        MC steps between syncs of the storage; at most this many steps are
+        lost if the run is killed
+    """
+    def __init__(self, n_sim_steps, checkpoint_frequency=10):
+        self.n_sim_steps = n_sim_steps
+        self.checkpoint_frequency = checkpoint_frequency
+
+    def setup_code(self, setup, engines):
+        """code running ``setup`` only if the storage has no steps yet.
+
+        Parameters
+        ----------
+        setup : str
+            code building ``sim``
+        engines : list of str
+            names of the engines the setup makes; on resume, each is set
+            to the engine of that name in the storage
+        """
+        engine_lines = "".join(
+            "    " + name + " = storage.engines['" + name + "']\n"
+            for name in engines
+        )
+        return RESUME_SETUP.format(engines=engine_lines,
+                                   setup=textwrap.indent(setup, "    "))
+
+    @property
+    def code(self):
+        """code to run the simulation, in place of the usual main block"""
+        return RESUME_RUN.format(
+            n_sim_steps=self.n_sim_steps,
+            checkpoint_frequency=self.checkpoint_frequency
+        )
+
+
+class WalkersWriter(object):
+    """Run several independent TPS chains in a process pool.
+
+    Each walker starts from the same initial conditions, with its own
+    random seed (``seed + walker``, also used for the OPS random number
+    generator), storage file, and progress log. Each walker runs the full
+    number of MC steps. With ``resume``, a walker whose storage file
+    exists continues from its last saved step, like
+    :class:`.CheckpointWriter`.
+
+    Parameters
+    ----------
+    n_walkers : int
+        number of chains, and of processes in the pool
+    output_file : str
+        the single-chain storage filename; walker ``i`` saves to
+        ``<base>_walker_i.nc`` and logs to ``<base>_walker_i.log``
+    n_sim_steps : int
+        number of MC steps for each walker
+    seed : int
+        seed of the first walker
+    resume : bool
+        whether walkers continue from existing storage files
+    checkpoint_frequency : int
+        MC steps between syncs of each walker's storage
+    trial_length : :class:`.TrialLengthWriter` or None
+        adaptive trial length cap for each walker
+    """
+    def __init__(self, n_walkers, output_file, n_sim_steps, seed=12345,
+                 resume=False, checkpoint_frequency=1, trial_length=None):
+        self.n_walkers = n_walkers
+        self.output_file = output_file
+        self.n_sim_steps = n_sim_steps
+        self.seed = seed
+        self.resume = resume
+        self.checkpoint_frequency = checkpoint_frequency
+        self.trial_length = trial_length
+
+    @property
+    def file_base(self):
+        return self.output_file.rsplit('.', 1)[0] + "_walker_{}"
+
+    @property
+    def code(self):
+        """code to run the walkers, in place of the usual main block"""
+        resume = "False"
+        if self.resume:
+            resume = ('os.path.exists("' + self.file_base
+                      + '.nc".format(walker))')
+        walker_hooks = ""
+        walker_engines = ""
+        if self.trial_length is not None:
+            walker_hooks = self.trial_length.walker_code
+            # the hooks must cap the engines of the resumed scheme; each
+            # walker has its own process, so the module names can change
+            names = self.trial_length.engines
+            indent = " " * 12
+            walker_engines = indent + "global " + ", ".join(names) + "\n"
+            walker_engines += "".join(
+                indent + name + " = walker_storage.engines['" + name + "']\n"
+                for name in names
+            )
+        return WALKERS_RUN.format(seed=self.seed,
+                                  log_pattern=self.file_base + ".log",
+                                  storage_pattern=self.file_base + ".nc",
+                                  n_sim_steps=self.n_sim_steps,
+                                  n_walkers=self.n_walkers,
+                                  resume=resume,
+                                  walker_engines=walker_engines,
+                                  checkpoint_frequency=
+                                  self.checkpoint_frequency,
+                                  walker_hooks=walker_hooks)
+
+
+class ConcurrentHalvesWriter(object):
+    """Two-way shooting for TPS, running both halves at the same time.
+
+    This replaces the one-way shooting scheme with
+    :class:`.half_shots.ConcurrentTwoWayShootingMover`, using a second
+    engine, made from the same script, for the backward halves. The
+    shooting point is not modified, so the engine should be stochastic
+    (e.g., with a Langevin thermostat).
+
+    Parameters
+    ----------
+    engine : :class:`.EngineWriter`
+        writer for the (forward) engine
+    """
+    def __init__(self, engine):
+        self.engine = engine
+
+    @property
+    def code(self):
+        """code building the scheme, inserted into the TPS setup"""
+        return CONCURRENT_HALVES.format(options=str(self.engine.options))
+
+
+class TrialLengthWriter(object):
+    """Adaptive cap on TPS trial length, from accepted path lengths.
+
+    See :class:`.trial_length.AdaptiveMaxLength`; its summary lines go to
+    the output (or each walker's log).
+
+    Parameters
+    ----------
+    multiple : float
+        the cap is this multiple of the percentile
+    percentile : float
+        percentile of the accepted path lengths
+    min_samples : int
+        accepted paths needed before the cap is lowered
+    engines : list of str
+        names of the engines to cap, e.g., including the backward engine
+        for concurrent halves
+    """
+    def __init__(self, multiple=3.0, percentile=95.0, min_samples=20,
+                 engines=None):
+        self.multiple = multiple
+        self.percentile = percentile
+        self.min_samples = min_samples
+        if engines is None:
+            engines = ["engine"]
+        self.engines = engines
+
+    def _hook(self, extra=""):
+        return ("AdaptiveMaxLength([" + ", ".join(self.engines) + "], "
+                "multiple=" + str(self.multiple) + ", percentile="
+                + str(self.percentile) + ", min_samples="
+                + str(self.min_samples) + extra + ")")
+
+    @property
+    def code(self):
+        lines = "from gui_paths.trial_length import AdaptiveMaxLength\n"
+        lines += "sim.attach_hook(" + self._hook() + ")\n"
+        return lines
+
+    @property
+    def walker_code(self):
+        """lines attaching the hook in a walker, with the walker's log"""
+        indent = " " * 8
+        lines = indent + "from gui_paths.trial_length import "
+        lines += "AdaptiveMaxLength\n"
+        lines += indent + "walker_sim.attach_hook(\n"
+        lines += indent + "    " + self._hook(", stream=log") + "\n"
+        lines += indent + ")\n"
+        return lines
+
+
 class EngineWriter(object):
-    def __init__(self, script):
+    """LAMMPS engine from an input script.
+
+    Parameters
+    ----------
+    script : str
+        the LAMMPS input script
+    n_steps_per_frame : int
+        MD steps between saved frames
+    n_frames_max : int
+        maximum length of a trajectory, in frames
+
+    How the engine moves coordinates and velocities between LAMMPS and
+    snapshots can't be set here: the OPS LAMMPS engine has no options for
+    that, so it always copies the per-atom arrays at its own precision.
+    """
+    def __init__(self, script, n_steps_per_frame=200, n_frames_max=500000):
         self.script = script
-        # TODO: don't hard-code these
-        self.options = {'n_steps_per_frame': 200,
-                        'n_frames_max': 500000}
+        self.options = {'n_steps_per_frame': n_steps_per_frame,
+                        'n_frames_max': n_frames_max}
 
     @property
     def code(self):
         lines = "with open('" + self.script + "', 'r') as f:\n"
         lines += "    data = f.read()\n"
         lines += "engine = ops_lammps.Engine(inputs=data, options="
-        lines += str(self.options) + ")\n"
+        # named, so a resumed run can find it in the storage
+        lines += str(self.options) + ").named('engine')\n"
         return lines
 
 
@@ -189,5 +592,53 @@ class InitialTrajectoryWriter(object):
         }[ext]  # can add support for other things later
         return extract + "\n"
 
+class InitialSnapshotsWriter(object):
+    """Load committor initial snapshots from a snapshot file.
+
+    By default, the snapshots of every trajectory in the file are used,
+    since :func:`.snapshot_selection.write_snapshot_set` saves them in
+    chunks. With ``traj_num``, only that trajectory is used.
+    """
+    def __init__(self, snapshot_file, traj_num=None):
+        self.snapshot_file = snapshot_file
+        self.traj_num = traj_num
+
+    @property
+    def code(self):
+        if self.traj_num is None:
+            trajectories = "inp_snapshot_file.trajectories"
+        else:
+            trajectories = ("[inp_snapshot_file.trajectories["
+                            + str(self.traj_num) + "]]")
+        return OPS_LOAD_SNAPSHOTS.format(snapshot_file=self.snapshot_file,
+                                         trajectories=trajectories) + "\n"
+
 class RandomizerWriter(object):
-    pass
+    """Velocity randomizer for committor shots.
+
+    Parameters
+    ----------
+    temperature : float
+        temperature, in the units of the LAMMPS script
+    seed : int or None
+        random seed; if None, every run draws different velocities
+    in_engine : bool
+        if True, velocities are redrawn by LAMMPS itself (see
+        :class:`.randomizers.LAMMPSVelocityRandomizer`); otherwise they are
+        drawn in Python with NumPy
+    """
+    def __init__(self, temperature, seed=None, in_engine=True):
+        self.temperature = temperature
+        self.seed = seed
+        self.in_engine = in_engine
+
+    @property
+    def code(self):
+        class_name = {
+            True: "LAMMPSVelocityRandomizer",
+            False: "VectorizedVelocityRandomizer"
+        }[self.in_engine]
+        lines = "from gui_paths.randomizers import " + class_name + "\n"
+        lines += "randomizer = " + class_name + "(engine, temperature="
+        lines += str(self.temperature) + ", seed=" + str(self.seed) + ")"
+        return lines
@@ -1,15 +1,26 @@
+import os
+import sys
 from functools import partial
 
 from .views import (Ui_CVCreate, Ui_StateCreate, Ui_SimulationOverview,
-                   Ui_CVsAndStates, Ui_SimDetails)
+                   Ui_CVsAndStates, Ui_SimDetails, Ui_RunPanel)
 from .code_writers import (
     CVCodeWriter, VolumeCodeWriter, StorageWriter, EngineWriter,
-    StringWrapper, BlankLineCodeWriter, InitialTrajectoryWriter
+    StringWrapper, BlankLineCodeWriter, InitialTrajectoryWriter,
+    TransitionsWriter, InitialSnapshotsWriter, RandomizerWriter,
+    InterfaceSetWriter, WalkersWriter, ConcurrentHalvesWriter,
+    CheckpointWriter, TrialLengthWriter
 )
 from .output_run_py import RunPyFile
-from PyQt5.QtWidgets import QDialog, QDialogButtonBox
-
-from PyQt5.QtWidgets import QListWidget, QComboBox
+from .preflight import preflight
+from .lammps_scanner import scan_lammps_script
+from .models import NamedObjectListModel, filtered
+from .bulk_import import import_file
+from .progress import ProgressHistory, parse_progress
+from .widgets import ProgressPlot
+from PyQt5.QtCore import Qt, QProcess, QTimer
+from PyQt5.QtWidgets import (QDialog, QDialogButtonBox, QFileDialog,
+                             QMessageBox, QTableWidgetItem, QVBoxLayout)
 
 class AddObjectFromButton(object):
     """Extra methods for running another dialog to add objects to a dict
@@ -26,7 +37,7 @@ class AddObjectFromButton(object):
         method for obtaining the object's name from the object
     ui_elem :
         the UI element in the current view where the object will be listed;
-        must support ``.addItem`` (``QListWidget``, ``QComboBox``, ...)
+        must support ``.setModel`` (``QListView``, ``QComboBox``, ...)
     dct : dict
         the dictionary storing the result object for parent controllers
         (using names as keys)
@@ -34,9 +45,13 @@ class AddObjectFromButton(object):
         parent view/controller for the new controller
     modal : bool
         whether the dialog should be modal
+    model : :class:`.NamedObjectListModel`
+        model for ``dct``, which may be shared with other views; a new
+        model is created if not given
     """
     def __init__(self, controller, attribute, get_name, ui_elem, dct,
-                 parent=None, modal=False, hidden_ui_elems=None):
+                 parent=None, modal=False, hidden_ui_elems=None,
+                 model=None):
         self.controller = controller
         self.attribute = attribute
         self.get_name = get_name
@@ -47,6 +62,14 @@ class AddObjectFromButton(object):
         if hidden_ui_elems is None:
             hidden_ui_elems = []
         self.hidden_ui_elems = hidden_ui_elems
+        if model is None:
+            model = NamedObjectListModel(dct)
+        self.model = model
+        self.ui_elem.setModel(self.view_model())
+
+    def view_model(self):
+        """The model to set on ``ui_elem``"""
+        return self.model
 
     # TODO: abstract this to do different kinds; use a string input
     # 'modal_dialog', 'dialog', 'stack_page', ...
@@ -69,28 +92,32 @@ class AddObjectFromButton(object):
         name = None
         if result:
             name = self.get_name(result)
-            self.add_cv_name_to_ui(name)
-            self.dct[name] = result
+            self.model.add(name, result)
 
         if self.parent:
             self.parent.update_after_add()
         return {name: result}
 
-    def add_cv_name_to_ui(self, name):
-        self.ui_elem.addItem(name)
-
 
 class ObjectListWidgetController(AddObjectFromButton):
-    """
+    """List view of objects, with add/delete buttons and a filter.
+
+    The view shows a proxy of the model, filtered by the text in
+    ``filter_edit`` (if given).
     """
     def __init__(self, controller, attribute, get_name, ui_elem, dct,
-                 parent=None, modal=False, hidden_ui_elems=None):
+                 parent=None, modal=False, hidden_ui_elems=None,
+                 model=None, filter_edit=None):
+        self.filter_edit = filter_edit
         super(ObjectListWidgetController, self).__init__(
             controller, attribute, get_name, ui_elem, dct, parent, modal,
-            hidden_ui_elems
+            hidden_ui_elems, model
         )
         self.delete_button = None
 
+    def view_model(self):
+        return filtered(self.model, self.filter_edit, parent=self.ui_elem)
+
     def make_connections(self, add_button, delete_button=None):
         super(ObjectListWidgetController, self).make_connections(add_button)
         # TODO: add double-click to edit
@@ -98,14 +125,16 @@ class ObjectListWidgetController(AddObjectFromButton):
             self.delete_button = delete_button
             self.delete_button.clicked.connect(self.delete)
 
-        self.ui_elem.itemSelectionChanged.connect(self.toggle_buttons)
+        selection = self.ui_elem.selectionModel()
+        selection.selectionChanged.connect(self.toggle_buttons)
 
         # set defaults
         self.toggle_buttons()
 
     def toggle_buttons(self):
         if self.delete_button:
-            self.delete_button.setEnabled(bool(self.ui_elem.selectedItems()))
+            selection = self.ui_elem.selectionModel()
+            self.delete_button.setEnabled(selection.hasSelection())
 
     def delete(self):
         pass
@@ -171,13 +200,25 @@ class CVController(QDialogController, CreateObjectDialog):
         self.cv = cv
         self.engine = engine  # engine may be used in CV creation
         self.ui = self.setup_ui()
+        self.fill_parameter_choices()
 
         self.ui.name.textChanged.connect(self.toggle_enabled_ok)
-        self.ui.parameters.textChanged.connect(self.toggle_enabled_ok)
+        self.ui.parameters.editTextChanged.connect(self.toggle_enabled_ok)
 
         # defaults
         self.toggle_enabled_ok()
 
+    def fill_parameter_choices(self):
+        """Offer the groups and computes in the LAMMPS script as
+        parameters"""
+        index = getattr(self.parent(), 'lammps_index', None)
+        if index is not None:
+            choices = index.parameter_choices()
+        else:
+            choices = ["all "]
+        self.ui.parameters.addItems(choices)
+        self.ui.parameters.setEditText("")
+
     def _get_kwargs_from_ui(self):
         cv_class = self.comboBox_entries[str(self.ui.cv_type.currentText())]
         extract_style = int(self.ui.extract_style.currentText()[0])
@@ -187,11 +228,11 @@ class CVController(QDialogController, CreateObjectDialog):
                     extract_type=extract_type,
                     engine="engine",
                     class_name=cv_class,
-                    groupid_style_args=self.ui.parameters.text())
+                    groupid_style_args=self.ui.parameters.currentText())
 
     def toggle_enabled_ok(self):
         name = self.ui.name.text()
-        params = self.ui.parameters.text()
+        params = self.ui.parameters.currentText()
         is_filled = bool(name) and bool(params)
         parent = self.parent()
         name_not_taken = name not in parent.cvs if parent else True
@@ -219,14 +260,11 @@ class StateController(QDialogController, CreateObjectDialog):
             dct=self.cvs,
             get_name=lambda x: x.kwargs['name'],
             ui_elem=self.ui.collectivevariable,
-            modal=True
+            modal=True,
+            model=getattr(parent, 'cv_model', None)
         )
         self.add_cv_dialog.make_connections(self.ui.addCV)
 
-        # TODO: move this into the AddObjectFromButton
-        for cv_name in self.cvs:
-            self.add_cv_dialog.add_cv_name_to_ui(cv_name)
-
         # TODO: :test each default behavior
         self._default_nonperiodic()
         self.toggle_enabled_ok()
@@ -242,6 +280,11 @@ class StateController(QDialogController, CreateObjectDialog):
             sig.connect(self.toggle_enabled_ok)
 
 
+    @property
+    def lammps_index(self):
+        """Index of the LAMMPS script, for the CV dialog opened from here"""
+        return getattr(self.parent(), 'lammps_index', None)
+
     def _get_kwargs_from_ui(self):
         cv_name = self.ui.collectivevariable.currentText()
         is_periodic = self.ui.is_periodic.isChecked()
@@ -419,12 +462,33 @@ class SimDetailsController(QDialogController):
         change_runtype.connect(self.tmp_disable)
         self.tmp_disable()
 
+        self._transition_names = None
+        self.ui.transition_matrix.itemChanged.connect(self.toggle_enabled_ok)
+        change_runtype.connect(self.toggle_enabled_ok)
+
+        self.ui.tune_frames.clicked.connect(self.tune_frames)
+
+        self._interface_names = None
+        self.ui.interface_table.itemChanged.connect(self.toggle_enabled_ok)
+        self.ui.committor_temperature.textChanged.connect(
+            self.toggle_enabled_ok
+        )
+        self.ui.place_interfaces.clicked.connect(self.place_interfaces)
+
+    def showEvent(self, event):
+        # states can be added after this is created, so update on show
+        self.update_transition_matrix()
+        self.update_interface_table()
+        self.toggle_enabled_ok()
+        super(SimDetailsController, self).showEvent(event)
+
     def tmp_disable(self):
         self.ui.lammps_script.setText("script.lammps")
         self.ui.lammps_script.setEnabled(False)
         output_name = {
             'Transition trajectory': 'trajectory.nc',
             'Transition path sampling': 'tps.nc',
+            'Transition interface sampling': 'tis.nc',
             'Committor simulation': 'committor.nc'
         }[self.ui.run_type.currentText()]
         self.ui.output_file.setText(output_name)
@@ -435,20 +499,221 @@ class SimDetailsController(QDialogController):
         self.ui.tps_init_traj.setEnabled(False)
         self.ui.tps_traj_idx.setEnabled(False)
         self.ui.tps_top_file.setEnabled(False)
+        self.ui.tis_init_traj.setText("trajectory.nc")
+        self.ui.tis_init_traj.setEnabled(False)
+        self.ui.tis_traj_idx.setEnabled(False)
 
     def update_sim_parameters(self):
         page = {
             "Transition trajectory": self.ui.traj_params,
             "Transition path sampling": self.ui.tps_params,
+            "Transition interface sampling": self.ui.tis_params,
             "Committor simulation": self.ui.committor_params
         }[self.ui.run_type.currentText()]
         self.ui.sim_parameters.setCurrentWidget(page)
 
+    def update_transition_matrix(self):
+        """Fill the transition matrix (initial state rows, final columns).
+
+        By default every transition between different states is selected,
+        except with two states, where only first to second is selected. A
+        previous selection is kept as long as the states don't change.
+        """
+        names = list(self.states)
+        if names == self._transition_names:
+            return
+        self._transition_names = names
+
+        table = self.ui.transition_matrix
+        table.blockSignals(True)
+        table.clear()
+        table.setRowCount(len(names))
+        table.setColumnCount(len(names))
+        table.setVerticalHeaderLabels(names)
+        table.setHorizontalHeaderLabels(names)
+        for row, initial in enumerate(names):
+            for col, final in enumerate(names):
+                item = QTableWidgetItem()
+                if row == col:
+                    item.setFlags(Qt.NoItemFlags)
+                else:
+                    item.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled)
+                    selected = (row, col) == (0, 1) or len(names) > 2
+                    item.setCheckState(Qt.Checked if selected
+                                       else Qt.Unchecked)
+                table.setItem(row, col, item)
+        table.blockSignals(False)
+
+    def selected_transitions(self):
+        """List of (initial, final) state writers checked in the matrix"""
+        names = self._transition_names or []
+        table = self.ui.transition_matrix
+        return [(self.states[initial], self.states[final])
+                for row, initial in enumerate(names)
+                for col, final in enumerate(names)
+                if row != col
+                and table.item(row, col).checkState() == Qt.Checked]
+
+    def update_interface_table(self):
+        """One row per state, with its interfaces as comma-separated values.
+
+        Interfaces already entered are kept as long as the states don't
+        change.
+        """
+        names = list(self.states)
+        if names == self._interface_names:
+            return
+        self._interface_names = names
+
+        table = self.ui.interface_table
+        table.blockSignals(True)
+        table.clear()
+        table.setRowCount(len(names))
+        table.setColumnCount(2)
+        table.setHorizontalHeaderLabels(["State", "Interfaces"])
+        for row, name in enumerate(names):
+            state_item = QTableWidgetItem(name)
+            state_item.setFlags(Qt.ItemIsEnabled)
+            table.setItem(row, 0, state_item)
+            table.setItem(row, 1, QTableWidgetItem(""))
+        table.blockSignals(False)
+
+    def _interface_lambdas(self, row):
+        text = self.ui.interface_table.item(row, 1).text()
+        return [float(value) for value in text.split(",") if value.strip()]
+
+    @staticmethod
+    def _state_bound(state, key):
+        value = state.kwargs[key]
+        if isinstance(value, StringWrapper):
+            value = str(value)[7:-2]  # strip the float('...') wrapper
+        return float(value)
+
+    def _interface_direction(self, state):
+        """Edge of the state and whether the CV increases away from it"""
+        lambda_min = self._state_bound(state, 'lambda_min')
+        lambda_max = self._state_bound(state, 'lambda_max')
+        if lambda_max == float('inf'):
+            return lambda_min, False
+        return lambda_max, True
+
+    def _next_state_edge(self, state):
+        """Nearest edge of another state on the same CV, or None"""
+        lambda_state, increasing = self._interface_direction(state)
+        cv = state.kwargs['collectivevariable']
+        edges = []
+        for other in self.states.values():
+            if other is state or other.kwargs['collectivevariable'] != cv:
+                continue
+            if increasing:
+                edge = self._state_bound(other, 'lambda_min')
+                if edge > lambda_state:
+                    edges.append(edge)
+            else:
+                edge = self._state_bound(other, 'lambda_max')
+                if edge < lambda_state:
+                    edges.append(edge)
+        if not edges:
+            return None
+        return min(edges) if increasing else max(edges)
+
+    def interface_sets(self):
+        """List of :class:`.InterfaceSetWriter`, one per state"""
+        sets = []
+        for row, name in enumerate(self._interface_names or []):
+            state = self.states[name]
+            _, increasing = self._interface_direction(state)
+            sets.append(InterfaceSetWriter(
+                state=state,
+                cv=state.kwargs['collectivevariable'],
+                lambdas=self._interface_lambdas(row),
+                increasing=increasing
+            ))
+        return sets
+
+    def place_interfaces(self):
+        """Fill the interfaces from the initial trajectory file"""
+        # imported here so the GUI itself does not need OPS installed
+        from .interface_placement import maxima_from_file, place_interfaces
+        cv_names = {cv.bound_name: cv.kwargs['name']
+                    for cv in self.cvs.values()}
+        self.update_interface_table()
+        table = self.ui.interface_table
+        for row, name in enumerate(self._interface_names):
+            state = self.states[name]
+            lambda_state, increasing = self._interface_direction(state)
+            try:
+                maxima = maxima_from_file(
+                    traj_file=self.ui.tis_init_traj.text(),
+                    cv_name=cv_names[state.kwargs['collectivevariable']],
+                    lambda_state=lambda_state,
+                    increasing=increasing
+                )
+                lambdas = place_interfaces(
+                    maxima=maxima,
+                    lambda_state=lambda_state,
+                    n_interfaces=self.ui.n_interfaces.value(),
+                    lambda_final=self._next_state_edge(state),
+                    increasing=increasing
+                )
+            # missing OPS or file, unknown CV, or no excursions in the data
+            except (ImportError, IOError, KeyError, ValueError) as err:
+                QMessageBox.warning(self, "Placing interfaces failed",
+                                    name + ": " + str(err))
+                return
+            table.item(row, 1).setText(
+                ", ".join("{:.6g}".format(l) for l in lambdas)
+            )
+
+    def tune_frames(self):
+        """Fill the frame settings from the initial trajectory"""
+        # imported here so the GUI itself does not need OPS installed
+        from .frame_tuning import tune_from_file
+        try:
+            recommendation = tune_from_file(
+                traj_file=self.ui.tps_init_traj.text(),
+                state_names=list(self.states),
+                traj_num=self.ui.tps_traj_idx.value()
+            )
+        # missing OPS or file, unknown state, or bad trajectory number
+        except (ImportError, IOError, KeyError, IndexError,
+                ValueError) as err:
+            QMessageBox.warning(self, "Tuning failed", str(err))
+            return
+        self.ui.n_steps_per_frame.setValue(recommendation.n_steps_per_frame)
+        self.ui.n_frames_max.setValue(recommendation.n_frames_max)
+        QMessageBox.information(self, "Frame settings", str(recommendation))
+
+    def input_errors(self):
+        is_tps = self.ui.run_type.currentText() == "Transition path sampling"
+        if is_tps and not self.selected_transitions():
+            return "Select at least one transition"
+        is_tis = (self.ui.run_type.currentText()
+                  == "Transition interface sampling")
+        if is_tis:
+            for row, name in enumerate(self._interface_names or []):
+                try:
+                    lambdas = self._interface_lambdas(row)
+                except ValueError:
+                    return "Interfaces for " + name + " must be numbers"
+                if not lambdas:
+                    return "Enter interfaces for " + name
+        is_committor = self.ui.run_type.currentText() == "Committor simulation"
+        if is_committor:
+            try:
+                temperature = float(self.ui.committor_temperature.text())
+            except ValueError:
+                temperature = None
+            if temperature is None or not temperature > 0:
+                return "Temperature must be a positive number"
+        return False
+
     def accept(self):
         run_type_text = self.ui.run_type.currentText()
         run_type = {
             "Transition trajectory": "trajectory",
             "Transition path sampling": "TPS",
+            "Transition interface sampling": "TIS",
             "Committor simulation": "committor"
         }[run_type_text]
 
@@ -459,39 +724,128 @@ class SimDetailsController(QDialogController):
                 traj_num=self.ui.tps_traj_idx.value(),
                 top_file=self.ui.tps_top_file.text()
             ),
-            "Committor simulation": BlankLineCodeWriter()
+            "Transition interface sampling": InitialTrajectoryWriter(
+                trajectory_file=self.ui.tis_init_traj.text(),
+                traj_num=self.ui.tis_traj_idx.value()
+            ),
+            "Committor simulation": InitialSnapshotsWriter(
+                snapshot_file=self.ui.committor_init_snapshots.text()
+            )
         }[run_type_text]
 
         n_sim_steps = {
             "Transition trajectory": '',
-            "Transition path sampling": int(self.ui.n_steps.text()),
-            "Committor simulation": "TODO"
-        }[run_type_text]
+            "Committor simulation": self.ui.committor_n_shots.value()
+        }.get(run_type_text)
+        # only read the MC steps field of the page in use
+        n_steps_edit = {
+            "Transition path sampling": self.ui.n_steps,
+            "Transition interface sampling": self.ui.tis_n_steps
+        }.get(run_type_text)
+        if n_steps_edit is not None:
+            n_sim_steps = int(n_steps_edit.text())
         # TODO: protect against stupid values in n_steps (like non-int)
 
         extra_info_dict = {
             'n_sim_steps': n_sim_steps
         }
 
+        other_writers = [init_cond_writer]
+        if run_type == "committor":
+            other_writers.append(RandomizerWriter(
+                temperature=float(self.ui.committor_temperature.text()),
+                # 0 is shown as "random"
+                seed=self.ui.committor_seed.value() or None,
+                in_engine=self.ui.committor_in_engine.isChecked()
+            ))
+
+        # only path sampling runs can be resumed
+        resume = (self.ui.resume.isChecked()
+                  and run_type in ["TPS", "TIS"])
+        checkpoint_frequency = self.ui.checkpoint_frequency.value()
+        checkpoints = None
+        if resume:
+            checkpoints = CheckpointWriter(n_sim_steps, checkpoint_frequency)
         storage = StorageWriter(filename=self.ui.output_file.text(),
-                                mode='w')
-        engine = EngineWriter(self.ui.lammps_script.text())
+                                mode='a' if resume else 'w')
+        concurrent_halves = (run_type == "TPS"
+                             and self.ui.concurrent_halves.isChecked())
+        trial_length = None
+        if run_type == "TPS" and self.ui.adaptive_max_length.isChecked():
+            engines = ["engine"]
+            if concurrent_halves:
+                engines.append("backward_engine")
+            trial_length = TrialLengthWriter(
+                multiple=self.ui.max_length_multiple.value(),
+                engines=engines
+            )
+        walkers = None
+        if run_type == "TPS" and self.ui.n_walkers.value() > 1:
+            walkers = WalkersWriter(n_walkers=self.ui.n_walkers.value(),
+                                    output_file=self.ui.output_file.text(),
+                                    n_sim_steps=n_sim_steps,
+                                    resume=resume,
+                                    checkpoint_frequency=checkpoint_frequency,
+                                    trial_length=trial_length)
+            # each walker has its own storage
+            storage = StorageWriter(filename=None, mode='w')
+        engine = EngineWriter(
+            self.ui.lammps_script.text(),
+            n_steps_per_frame=self.ui.n_steps_per_frame.value(),
+            n_frames_max=self.ui.n_frames_max.value()
+        )
+        if concurrent_halves:
+            concurrent_halves = ConcurrentHalvesWriter(engine)
+        else:
+            concurrent_halves = None
+        value_store = None
+        if self.ui.cv_store.isChecked():
+            value_store = "cv_values.db"
+        for cv in self.cvs.values():
+            cv.value_store = value_store
+
+        self.update_transition_matrix()
+        transitions = TransitionsWriter(self.selected_transitions())
+        interface_sets = None
+        if run_type == "TIS":
+            self.update_interface_table()
+            interface_sets = self.interface_sets()
         run_py = RunPyFile(run_type=run_type,
                            engine=engine,
                            cvs=list(self.cvs.values()),
                            volumes=list(self.states.values()),
-                           other_writers=[storage, init_cond_writer],
-                           extra_info_dict=extra_info_dict)
+                           other_writers=[storage] + other_writers,
+                           extra_info_dict=extra_info_dict,
+                           transitions=transitions,
+                           fuse_cvs=self.ui.fuse_cvs.isChecked(),
+                           interface_sets=interface_sets,
+                           walkers=walkers,
+                           concurrent_halves=concurrent_halves,
+                           checkpoints=checkpoints,
+                           trial_length=trial_length)
+        code = run_py.code
+        problems = preflight(code)
+        if problems:
+            answer = QMessageBox.question(
+                self, "Preflight",
+                "Problems found in run.py:\n\n" + "\n".join(problems)
+                + "\n\nWrite it anyway?"
+            )
+            if answer != QMessageBox.Yes:
+                return
         with open("run.py", mode='w') as f:
-            run_py.write(f)
+            f.write(code)
 
         super(SimDetailsController, self).accept()
 
 
 class CVsAndStatesController(QDialogController):
     UIClass = Ui_CVsAndStates
-    def __init__(self, states=None, cvs=None, parent=None):
+    def __init__(self, states=None, cvs=None, parent=None,
+                 lammps_script="script.lammps"):
         super(CVsAndStatesController, self).__init__(parent)
+        self.lammps_script = lammps_script
+        self._lammps_index = None
         self.states = states
         if self.states is None:
             self.states = {}
@@ -502,6 +856,10 @@ class CVsAndStatesController(QDialogController):
 
         self.ui = self.setup_ui()
 
+        # shared with the dialogs opened from here
+        self.cv_model = NamedObjectListModel(self.cvs, parent=self)
+        self.state_model = NamedObjectListModel(self.states, parent=self)
+
         self.cv_list_controller = ObjectListWidgetController(
             controller=CVController,
             attribute='cv',
@@ -509,7 +867,9 @@ class CVsAndStatesController(QDialogController):
             ui_elem=self.ui.cv_list,
             dct=self.cvs,
             parent=self,
-            modal=True
+            modal=True,
+            model=self.cv_model,
+            filter_edit=self.ui.cv_filter
         )
         self.cv_list_controller.make_connections(
             add_button=self.ui.add_cv,
@@ -524,13 +884,17 @@ class CVsAndStatesController(QDialogController):
             dct=self.states,
             parent=self,
             modal=True,
-            hidden_ui_elems=['addCV']
+            hidden_ui_elems=['addCV'],
+            model=self.state_model,
+            filter_edit=self.ui.state_filter
         )
         self.state_list_controller.make_connections(
             add_button=self.ui.add_state,
             delete_button=self.ui.delete_state
         )
 
+        self.ui.import_table.clicked.connect(self.import_table)
+
         cancel = self.ui.buttonBox.button(QDialogButtonBox.Cancel)
         cancel.setDefault(False)
         cancel.setAutoDefault(False)
@@ -538,6 +902,38 @@ class CVsAndStatesController(QDialogController):
         self.toggle_add_state()
         cancel.clearFocus()
 
+    @property
+    def lammps_index(self):
+        """Index of the LAMMPS script, or None if there is no script"""
+        if self._lammps_index is None and os.path.exists(self.lammps_script):
+            self._lammps_index = scan_lammps_script(self.lammps_script)
+        return self._lammps_index
+
+    def import_table(self):
+        filename, _ = QFileDialog.getOpenFileName(
+            self, "Import CVs and states", "",
+            "Tables (*.csv *.json *.yml *.yaml)"
+        )
+        if filename:
+            try:
+                self.import_from_file(filename)
+            except (ValueError, RuntimeError, IOError) as err:
+                QMessageBox.warning(self, "Import failed", str(err))
+
+    def import_from_file(self, filename):
+        """Add all CVs and states in a table, in one update of each list"""
+        new_cvs, new_states = import_file(filename, self.cvs, self.states)
+        views = [self.ui.cv_list, self.ui.state_list]
+        for view in views:
+            view.setUpdatesEnabled(False)
+        try:
+            self.cv_model.add_many(new_cvs)
+            self.state_model.add_many(new_states)
+        finally:
+            for view in views:
+                view.setUpdatesEnabled(True)
+        self.update_after_add()
+
     def toggle_add_state(self):
         enabled = len(self.cvs) > 0
         self.ui.add_state.setEnabled(enabled)
@@ -553,3 +949,124 @@ class CVsAndStatesController(QDialogController):
         if enabled:
             ok_button.setDefault(True)
 
+
+
+class RunController(QDialogController):
+    """Run a generated script in the background and show its progress.
+
+    The script runs in a separate process, so the GUI stays responsive.
+    Its output is streamed into the log, except for progress lines (see
+    :mod:`.progress`), which update the labels and the path length plot.
+    Labels and plot are redrawn on a timer, at most once per
+    ``redraw_interval`` ms, however fast the output comes. The log keeps at
+    most ``max_log_lines`` lines.
+    """
+    UIClass = Ui_RunPanel
+    def __init__(self, script="run.py", parent=None, redraw_interval=1000,
+                 max_log_lines=10000):
+        super(RunController, self).__init__(parent)
+        self.script = script
+        self.ui = self.setup_ui()
+        self.ui.log.setMaximumBlockCount(max_log_lines)
+
+        self.history = ProgressHistory()
+        self.plot = ProgressPlot(self.history, label="path length vs. step")
+        QVBoxLayout(self.ui.plot_area).addWidget(self.plot)
+        self.latest = None
+        self._partial_line = ""
+        self._needs_redraw = False
+
+        self.process = QProcess(self)
+        self.process.setProcessChannelMode(QProcess.MergedChannels)
+        self.process.readyReadStandardOutput.connect(self.read_output)
+        self.process.finished.connect(self.process_finished)
+
+        self.redraw_timer = QTimer(self)
+        self.redraw_timer.setInterval(redraw_interval)
+        self.redraw_timer.timeout.connect(self.redraw)
+
+        # if the script doesn't stop when asked, kill it after a while
+        self.kill_timer = QTimer(self)
+        self.kill_timer.setSingleShot(True)
+        self.kill_timer.setInterval(10000)
+        self.kill_timer.timeout.connect(self.process.kill)
+
+        self.ui.start.clicked.connect(self.start)
+        self.ui.stop.clicked.connect(self.stop)
+
+    def is_running(self):
+        return self.process.state() != QProcess.NotRunning
+
+    def start(self):
+        script = os.path.abspath(self.script)
+        self.process.setWorkingDirectory(os.path.dirname(script))
+        # unbuffered, so output arrives as it is written
+        self.process.start(sys.executable, ['-u', script])
+        self.ui.start.setEnabled(False)
+        self.ui.stop.setEnabled(True)
+        self.ui.status.setText("Running " + script)
+        self.redraw_timer.start()
+
+    def stop(self):
+        # SIGTERM ends the script without any cleanup, so the storage only
+        # has what was last synced; kill it if that doesn't work either
+        self.process.terminate()
+        self.kill_timer.start()
+
+    def handle_output(self, text):
+        """Split output into log lines and progress updates"""
+        lines = (self._partial_line + text).replace("\r", "\n").split("\n")
+        self._partial_line = lines.pop()
+        log_lines = []
+        for line in lines:
+            progress = parse_progress(line)
+            if progress is not None:
+                self.latest = progress
+                self.history.append(progress['step'], progress['length'])
+                self._needs_redraw = True
+            elif line:
+                log_lines.append(line)
+        if log_lines:
+            self.ui.log.appendPlainText("\n".join(log_lines))
+
+    def read_output(self):
+        data = bytes(self.process.readAllStandardOutput())
+        self.handle_output(data.decode('utf-8', 'replace'))
+
+    def redraw(self):
+        if not self._needs_redraw:
+            return
+        self._needs_redraw = False
+        self.ui.step_label.setText("Step: " + str(self.latest['step']))
+        self.ui.rate_label.setText(
+            "Steps/s: {:.3g}".format(self.latest['rate'])
+        )
+        self.ui.length_label.setText(
+            "Path length: " + str(self.latest['length'])
+        )
+        self.plot.update()
+
+    def process_finished(self, exit_code, exit_status):
+        self.handle_output("\n")  # flush a last line without newline
+        self.redraw()
+        self.redraw_timer.stop()
+        self.kill_timer.stop()
+        if exit_status == QProcess.CrashExit:
+            self.ui.status.setText("Stopped")
+        else:
+            self.ui.status.setText("Finished with exit code "
+                                   + str(exit_code))
+        self.ui.start.setEnabled(True)
+        self.ui.stop.setEnabled(False)
+
+    def done(self, result):
+        if self.is_running():
+            answer = QMessageBox.question(
+                self, "Simulation running",
+                "Closing this stops the simulation. Close anyway?"
+            )
+            if answer != QMessageBox.Yes:
+                return
+            self.process.kill()
+            self.process.waitForFinished()
+        super(RunController, self).done(result)
@@ -0,0 +1,205 @@
+"""
+CV values shared between processes, in an SQLite database.
+
+Replicas, committor shards, and restarts of generated scripts often
+evaluate the same CVs on the same snapshots. With a
+:class:`.CVValueStore`, each value is computed once: values are keyed by
+the CV definition and the snapshot UUID, and any number of processes can
+read and write the same database file at once (SQLite's WAL mode lets
+readers work while a writer commits). New values are written in batches,
+one transaction per batch. When the store grows beyond ``max_entries``,
+the least recently used values are evicted.
+
+Generated scripts use this through :func:`.stored_cv_value` (see
+``CVCodeWriter``'s ``value_store``). Like the other modules used by
+generated scripts, this must not import anything from the GUI.
+"""
+import time
+import atexit
+import pickle
+import sqlite3
+import hashlib
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cv_values (
+    cv_key TEXT NOT NULL,
+    snapshot TEXT NOT NULL,
+    value BLOB,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (cv_key, snapshot)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cv_values_last_used ON cv_values (last_used);
+"""
+
+
+def cv_store_key(definition, *context):
+    """Key for a CV definition, e.g., class and parameters of the CV.
+
+    Anything else the values depend on (such as the LAMMPS input script
+    defining the groups a compute uses) should be given as ``context``.
+    """
+    digest = hashlib.sha1(definition.encode('utf-8'))
+    for item in context:
+        digest.update(b"\0" + str(item).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _snapshot_key(snapshot):
+    uuid = getattr(snapshot, '__uuid__', snapshot)
+    return format(uuid, 'x') if isinstance(uuid, int) else str(uuid)
+
+
+def _to_db(value):
+    # floats are stored as such; anything else (arrays, ...) is pickled
+    if isinstance(value, float):
+        return float(value)
+    return sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
+def _from_db(value):
+    if isinstance(value, bytes):
+        return pickle.loads(value)
+    return value
+
+
+class CVValueStore(object):
+    """CV values by (CV key, snapshot), shared between processes.
+
+    Parameters
+    ----------
+    filename : str
+        the SQLite database file; created if it does not exist
+    max_entries : int
+        the store is trimmed to ``evict_to`` times this when it grows
+        beyond it, dropping the least recently used values
+    batch_size : int
+        number of new values (and reads of existing values) kept in memory
+        before they are written in one transaction
+    evict_to : float
+        fraction of ``max_entries`` kept after eviction; evicting more than
+        needed keeps eviction from running on every batch
+    timeout : float
+        seconds to wait for another process holding the write lock
+    """
+    def __init__(self, filename, max_entries=1000000, batch_size=500,
+                 evict_to=0.9, timeout=60.0):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.evict_to = evict_to
+        self._pending = {}
+        self._used = set()
+        # autocommit mode; transactions are started explicitly
+        self._connection = sqlite3.connect(filename, timeout=timeout,
+                                           isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # with WAL, NORMAL is still safe against corruption
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+
+    def get(self, cv_key, snapshot):
+        """Stored value of a CV for a snapshot; KeyError if not stored"""
+        key = (cv_key, _snapshot_key(snapshot))
+        if key in self._pending:
+            return self._pending[key]
+        row = self._connection.execute(
+            "SELECT value FROM cv_values WHERE cv_key = ? AND snapshot = ?",
+            key
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        self._used.add(key)
+        self._flush_if_full()
+        return _from_db(row[0])
+
+    def put(self, cv_key, snapshot, value):
+        """Store a value; written with the next batch"""
+        self._pending[(cv_key, _snapshot_key(snapshot))] = value
+        self._flush_if_full()
+
+    def _flush_if_full(self):
+        if len(self._pending) + len(self._used) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Write pending values and usage times in one transaction"""
+        if not self._pending and not self._used:
+            return
+        now = time.time()
+        rows = [(cv_key, snapshot, _to_db(value), now)
+                for (cv_key, snapshot), value in self._pending.items()]
+        used = [(now, cv_key, snapshot) for cv_key, snapshot in self._used]
+        connection = self._connection
+        # take the write lock up front, instead of upgrading a read lock
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT OR REPLACE INTO cv_values VALUES (?, ?, ?, ?)", rows
+            )
+            connection.executemany(
+                "UPDATE cv_values SET last_used = ? "
+                "WHERE cv_key = ? AND snapshot = ?", used
+            )
+            self._evict()
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        self._pending.clear()
+        self._used.clear()
+
+    def _evict(self):
+        n_entries = len(self)
+        if n_entries <= self.max_entries:
+            return
+        n_evict = n_entries - int(self.evict_to * self.max_entries)
+        self._connection.execute(
+            "DELETE FROM cv_values WHERE (cv_key, snapshot) IN ("
+            "SELECT cv_key, snapshot FROM cv_values "
+            "ORDER BY last_used LIMIT ?)", (n_evict,)
+        )
+
+    def __len__(self):
+        """Number of values in the database (not counting pending ones)"""
+        return self._connection.execute(
+            "SELECT COUNT(*) FROM cv_values"
+        ).fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+
+# one store per database file in each process
+_open_stores = {}
+
+
+def open_store(filename, **kwargs):
+    """The :class:`.CVValueStore` for a file, opened once per process.
+
+    Stores opened this way are flushed and closed when the process exits.
+    """
+    if filename not in _open_stores:
+        _open_stores[filename] = CVValueStore(filename, **kwargs)
+    return _open_stores[filename]
+
+
+@atexit.register
+def close_stores():
+    while _open_stores:
+        _, store = _open_stores.popitem()
+        store.close()
+
+
+def stored_cv_value(snapshot, cv, store_file, cv_key):
+    """Value of ``cv`` for ``snapshot``, computed only if not yet stored.
+
+    Meant as the function of a ``paths.FunctionCV`` wrapping ``cv``.
+    """
+    store = open_store(store_file)
+    try:
+        return store.get(cv_key, snapshot)
+    except KeyError:
+        value = cv(snapshot)
+        store.put(cv_key, snapshot, value)
+        return value
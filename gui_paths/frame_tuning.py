@@ -0,0 +1,273 @@
+"""
+Choose ``n_steps_per_frame`` and ``n_frames_max`` from a reference
+trajectory, such as the one made by a "Transition trajectory" run.
+
+The CV values of the reference trajectory are read in chunks, and the
+analysis works on whole arrays. For the stride, three things are checked,
+all in frames of the reference trajectory. Two are upper bounds:
+
+* the shortest visit to a state: a longer stride could step over a visit,
+  missing a transition;
+* the shortest transit between states, which should still be resolved by
+  ``min_transit_frames`` frames.
+
+The third is a lower bound: frames closer together than the integrated
+autocorrelation time of the CVs are largely redundant, so a shorter stride
+only costs storage and CV evaluations.
+
+The largest stride within the upper bounds is recommended. If it is below
+the lower bound, the upper bound still wins, since missing transitions is
+worse than saving correlated frames. Without any transit in the reference
+trajectory, there is no upper bound, and the autocorrelation time is used.
+``n_frames_max`` is a safety factor times the longest transit, in frames
+of the new stride. Usage::
+
+    python -m gui_paths.frame_tuning trajectory.nc --states A B
+"""
+import argparse
+
+import numpy as np
+
+# criteria that give a minimum stride; the others give a maximum
+LOWER_LIMITS = ['CV autocorrelation']
+
+
+def autocorrelation(values, max_lag=None):
+    """Normalized autocorrelation function of a 1D series, using FFTs"""
+    values = np.asarray(values, dtype=float)
+    values = values - values.mean()
+    n_frames = len(values)
+    if max_lag is None:
+        max_lag = n_frames // 2
+    size = 2 ** int(np.ceil(np.log2(2 * n_frames)))
+    transform = np.fft.rfft(values, size)
+    acf = np.fft.irfft(transform * np.conjugate(transform))[:max_lag + 1]
+    if acf[0] == 0:
+        return np.ones_like(acf)
+    return acf / acf[0]
+
+
+def integrated_autocorrelation_time(values, max_lag=None):
+    """Sum of the autocorrelation function up to its first zero crossing"""
+    acf = autocorrelation(values, max_lag)
+    negative = np.flatnonzero(acf <= 0)
+    cutoff = negative[0] if len(negative) else len(acf)
+    return 0.5 + acf[1:cutoff].sum()
+
+
+def state_labels(in_state_masks):
+    """Index of the state each frame is in, or -1 for no state.
+
+    Parameters
+    ----------
+    in_state_masks : list of arrays of bool
+        for each state, whether each frame is in it
+    """
+    masks = np.asarray(in_state_masks, dtype=bool)
+    labels = np.where(masks.any(axis=0), masks.argmax(axis=0), -1)
+    return labels
+
+
+def _runs(labels):
+    """Start, length, and label of each run of equal labels"""
+    labels = np.asarray(labels)
+    if len(labels) == 0:
+        empty = np.array([], dtype=int)
+        return empty, empty, empty
+    starts = np.concatenate([[0], np.flatnonzero(np.diff(labels)) + 1])
+    lengths = np.diff(np.concatenate([starts, [len(labels)]]))
+    return starts, lengths, labels[starts]
+
+
+def residence_and_transit_times(labels):
+    """Lengths (in frames) of state visits and of transits between states.
+
+    Visits at the ends of the trajectory are cut off, and are not counted.
+    A transit is a run of frames outside all states that starts in one
+    state and ends in a different one.
+
+    Returns
+    -------
+    residences : array of int
+    transits : array of int
+    """
+    starts, lengths, run_labels = _runs(labels)
+    interior = np.zeros(len(run_labels), dtype=bool)
+    interior[1:-1] = True
+    residences = lengths[(run_labels >= 0) & interior]
+
+    outside = np.flatnonzero((run_labels == -1) & interior)
+    before, after = run_labels[outside - 1], run_labels[outside + 1]
+    # adjacent runs of states can't be -1, so these are always states
+    transits = lengths[outside][before != after]
+    # direct jumps between states count as transits of length 0
+    direct = np.flatnonzero((run_labels[:-1] >= 0) & (run_labels[1:] >= 0))
+    transits = np.concatenate([transits, np.zeros(len(direct), dtype=int)])
+    return residences, transits
+
+
+class FrameRecommendation(object):
+    """Result of :func:`.recommend_frames`.
+
+    Attributes
+    ----------
+    stride : int
+        recommended stride, in reference frames
+    n_steps_per_frame : int
+        recommended MD steps per frame
+    n_frames_max : int
+        recommended maximum path length, in frames of the new stride
+    limits : dict
+        the minimum (see ``LOWER_LIMITS``) or maximum stride from each
+        criterion (None if no data)
+    """
+    def __init__(self, stride, n_steps_per_frame, n_frames_max, limits):
+        self.stride = stride
+        self.n_steps_per_frame = n_steps_per_frame
+        self.n_frames_max = n_frames_max
+        self.limits = limits
+
+    def __str__(self):
+        lines = ["n_steps_per_frame: " + str(self.n_steps_per_frame),
+                 "n_frames_max: " + str(self.n_frames_max)]
+        lines += ["  {} stride from {}: {}".format(
+            "min" if name in LOWER_LIMITS else "max", name, limit
+        ) for name, limit in sorted(self.limits.items())]
+        return "\n".join(lines)
+
+
+def recommend_frames(cv_values, labels, ref_steps_per_frame,
+                     min_transit_frames=5, safety_factor=5.0,
+                     default_n_frames_max=500000):
+    """Recommend the frame stride and maximum path length.
+
+    Parameters
+    ----------
+    cv_values : list of arrays
+        values of each CV along the reference trajectory
+    labels : array of int
+        state label per frame, from :func:`.state_labels`
+    ref_steps_per_frame : int
+        MD steps per frame in the reference trajectory
+    min_transit_frames : int
+        number of frames the shortest transit should still have
+    safety_factor : float
+        ``n_frames_max`` is this times the longest transit
+    default_n_frames_max : int
+        used when the reference trajectory has no transit
+
+    Returns
+    -------
+    :class:`.FrameRecommendation`
+    """
+    residences, transits = residence_and_transit_times(labels)
+    limits = {
+        'state residence': (int(residences.min()) if len(residences)
+                            else None),
+        'transit length': (int(transits.min()) // min_transit_frames
+                           if len(transits) and transits.min() > 0
+                           else None),
+        'CV autocorrelation': (min(
+            int(integrated_autocorrelation_time(values))
+            for values in cv_values
+        ) if len(cv_values) else None),
+    }
+    upper = [limit for name, limit in limits.items()
+             if name not in LOWER_LIMITS and limit is not None]
+    lower = [limit for name, limit in limits.items()
+             if name in LOWER_LIMITS and limit is not None]
+    if upper:
+        stride = min(upper)
+    elif lower:
+        stride = max(lower)
+    else:
+        stride = 1
+    stride = max(1, stride)
+
+    if len(transits) and transits.max() > 0:
+        longest = transits.max() + 2  # a path includes one frame per state
+        n_frames_max = int(np.ceil(safety_factor * longest / stride))
+    else:
+        n_frames_max = default_n_frames_max
+
+    return FrameRecommendation(stride=stride,
+                               n_steps_per_frame=stride * ref_steps_per_frame,
+                               n_frames_max=n_frames_max,
+                               limits=limits)
+
+
+def _in_state_mask(state, values):
+    lambda_min, lambda_max = state.lambda_min, state.lambda_max
+    if lambda_min <= lambda_max:
+        return (values >= lambda_min) & (values < lambda_max)
+    return (values >= lambda_min) | (values < lambda_max)  # periodic wrap
+
+
+def load_reference(storage, state_names, traj_num=-1, chunk_size=1000):
+    """CV values and state labels of a reference trajectory in storage.
+
+    States must be (periodic) ``CVDefinedVolume``s; their CVs are evaluated
+    on chunks of ``chunk_size`` frames, with storage caches cleared between
+    chunks.
+
+    Returns
+    -------
+    cv_values : list of arrays
+    labels : array of int
+    """
+    from .storage_tools import clear_caches
+    traj = storage.trajectories[traj_num]
+    states = [storage.volumes[name] for name in state_names]
+    cvs = []
+    for state in states:
+        if state.collectivevariable not in cvs:
+            cvs.append(state.collectivevariable)
+
+    n_frames = len(traj)
+    values = [np.empty(n_frames) for cv in cvs]
+    for start in range(0, n_frames, chunk_size):
+        chunk = traj[start:start + chunk_size]
+        for cv, cv_values in zip(cvs, values):
+            cv_values[start:start + len(chunk)] = np.ravel(cv(chunk))
+        clear_caches(storage)
+
+    masks = [_in_state_mask(state, values[cvs.index(state.collectivevariable)])
+             for state in states]
+    return values, state_labels(masks)
+
+
+def tune_from_file(traj_file, state_names, traj_num=-1, **kwargs):
+    """Run :func:`.recommend_frames` on a trajectory in a storage file.
+
+    The steps per frame of the reference trajectory are taken from the
+    engine saved with it. Extra keyword arguments go to
+    :func:`.recommend_frames`.
+    """
+    from .storage_tools import open_storage
+    storage = open_storage(traj_file, mode='r')
+    try:
+        cv_values, labels = load_reference(storage, state_names, traj_num)
+        ref_steps = storage.engines[0].n_steps_per_frame
+    finally:
+        storage.close()
+    return recommend_frames(cv_values, labels, ref_steps, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Recommend n_steps_per_frame and n_frames_max"
+    )
+    parser.add_argument('traj_file')
+    parser.add_argument('--states', nargs='+', required=True,
+                        help="names of the state volumes")
+    parser.add_argument('--traj-num', type=int, default=-1)
+    parser.add_argument('--min-transit-frames', type=int, default=5)
+    parser.add_argument('--safety-factor', type=float, default=5.0)
+    opts = parser.parse_args()
+    print(tune_from_file(opts.traj_file, opts.states, opts.traj_num,
+                         min_transit_frames=opts.min_transit_frames,
+                         safety_factor=opts.safety_factor))
+
+
+if __name__ == "__main__":
+    main()
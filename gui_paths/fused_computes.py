@@ -0,0 +1,78 @@
+"""
+Fused evaluation of LAMMPS computes, used by generated ``run.py`` files.
+
+Separate ``LAMMPSComputeCV`` objects each load the snapshot into LAMMPS and
+extract their compute on their own. Here all the computes that share an
+engine are evaluated together: the snapshot is loaded once, and every
+compute is extracted into a single array for that frame. The individual
+CVs are ``FunctionCV`` objects returning views into that array.
+
+This module must not import anything from the GUI; it is imported by the
+generated scripts.
+"""
+import numpy as np
+
+
+class FusedComputes(object):
+    """Group of LAMMPS computes evaluated in one pass per snapshot.
+
+    Parameters
+    ----------
+    engine :
+        the OPS LAMMPS engine; the computes are defined in its LAMMPS
+        instance
+    computes : list
+        list of ``[compute_id, groupid_style_args, extract_style,
+        extract_type]`` for each compute
+    """
+    _instances = {}
+
+    def __init__(self, engine, computes):
+        self.engine = engine
+        self.computes = [tuple(compute) for compute in computes]
+        for compute_id, groupid_style_args, _, _ in self.computes:
+            engine.lammps.command(
+                "compute {} {}".format(compute_id, groupid_style_args)
+            )
+        self._snapshot = None
+        self._values = {}
+
+    @classmethod
+    def for_engine(cls, engine, computes):
+        """Get the shared instance for this engine and set of computes"""
+        key = (id(engine), tuple(tuple(compute) for compute in computes))
+        try:
+            fused = cls._instances[key]
+        except KeyError:
+            fused = cls._instances[key] = cls(engine, computes)
+        return fused
+
+    def _extract(self):
+        lmp = self.engine.lammps
+        lmp.command("run 0 post no")  # one evaluation for all computes
+        raw = [np.atleast_1d(lmp.numpy.extract_compute(compute_id, style,
+                                                       type_))
+               for compute_id, _, style, type_ in self.computes]
+        # a fresh buffer for each frame: values cached by OPS for earlier
+        # snapshots must not change when LAMMPS moves on
+        frame = np.concatenate([arr.ravel() for arr in raw])
+        values = {}
+        offset = 0
+        for (compute_id, _, style, type_), arr in zip(self.computes, raw):
+            view = frame[offset:offset + arr.size].reshape(arr.shape)
+            values[compute_id] = view[0] if type_ == 0 else view
+            offset += arr.size
+        return values
+
+    def value(self, snapshot, compute_id):
+        if snapshot is not self._snapshot:
+            self.engine.current_snapshot = snapshot
+            self._values = self._extract()
+            self._snapshot = snapshot
+        return self._values[compute_id]
+
+
+def fused_compute(snapshot, computes, compute_id):
+    """Function for ``paths.FunctionCV``; see :class:`.FusedComputes`"""
+    fused = FusedComputes.for_engine(snapshot.engine, computes)
+    return fused.value(snapshot, compute_id)
@@ -0,0 +1,195 @@
+"""
+Two-way shooting with both half-trajectories generated at the same time.
+
+A two-way shot normally runs the forward half, then the backward half, on
+a single engine. :class:`.ConcurrentTwoWayShootingMover` runs the halves
+in two threads, on a pair of engines (the LAMMPS library releases the GIL
+while it integrates, so the halves really run in parallel). As soon as
+one half has finished in a way that no valid path can end (or start)
+with, the other half is cancelled, and the trial is rejected.
+
+An engine holds a single state, and CVs such as ``LAMMPSComputeCV`` are
+evaluated by loading frames into their engine. So each half checks its
+frames with CVs on its own engine: the backward half uses a copy of the
+ensemble, made by :func:`.rebind_engine`.
+
+This must not import anything from the GUI; it is imported by the
+generated scripts.
+"""
+import copy
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from openpathsampling.netcdfplus import StorableObject, ObjectJSON
+from openpathsampling.pathmover import AbstractTwoWayShootingMover
+
+
+def generate_halves(snapshot, forward_engine, backward_engine,
+                    forward_running, backward_running, forward_ok=None,
+                    backward_ok=None, executor=None):
+    """Generate the forward and backward halves from a snapshot at once.
+
+    Parameters
+    ----------
+    snapshot :
+        the (modified) shooting point
+    forward_engine, backward_engine :
+        two independent engines
+    forward_running, backward_running : callable
+        continuation conditions, ``f(trajectory, trusted)``, for each half
+    forward_ok, backward_ok : callable or None
+        ``f(trajectory)``, whether a finished half can still be part of a
+        valid trial; if not, the other half is cancelled
+    executor : :class:`concurrent.futures.Executor` or None
+        runs the two halves; a new two-thread pool if None
+
+    Returns
+    -------
+    backward, forward : trajectories
+        the backward half ends with ``snapshot``, and the forward half
+        starts with it; these are partial if cancelled
+    cancelled : bool
+        whether either half failed
+    """
+    cancel = threading.Event()
+
+    def not_cancelled(trajectory, trusted=False):
+        return not cancel.is_set()
+
+    def run_half(engine, direction, running, is_ok):
+        # OPS engines delay Ctrl-C with a signal handler while making each
+        # frame, but a handler can only be set in the main thread
+        interrupter = getattr(engine, 'interrupter', None)
+        if interrupter is not None:
+            engine.interrupter = contextlib.nullcontext
+        try:
+            half = engine.generate(snapshot,
+                                   running=[running, not_cancelled],
+                                   direction=direction)
+        finally:
+            if interrupter is not None:
+                engine.interrupter = interrupter
+        if is_ok is not None and not cancel.is_set() and not is_ok(half):
+            cancel.set()
+        return half
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        forward = executor.submit(run_half, forward_engine, +1,
+                                  forward_running, forward_ok)
+        backward = executor.submit(run_half, backward_engine, -1,
+                                   backward_running, backward_ok)
+        return backward.result(), forward.result(), cancel.is_set()
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+
+def rebind_engine(obj, engine, new_engine):
+    """Copy of ``obj`` in which ``new_engine`` replaces ``engine``.
+
+    OPS objects that refer to ``engine``, directly or through the objects
+    they are made of, are rebuilt from their ``to_dict``, as storage would
+    load them; the others are shared. Other objects are deep-copied. For
+    an ensemble, this gives volumes and CVs that are evaluated on
+    ``new_engine``.
+    """
+    memo = {id(engine): new_engine}
+    json = ObjectJSON()
+
+    def rebind(obj):
+        if isinstance(obj, dict):
+            new = {key: rebind(value) for key, value in obj.items()}
+            changed = any(new[key] is not obj[key] for key in obj)
+        elif isinstance(obj, (list, tuple)):
+            new = type(obj)(rebind(value) for value in obj)
+            changed = any(a is not b for a, b in zip(new, obj))
+        elif id(obj) in memo:
+            return memo[id(obj)]
+        elif isinstance(obj, StorableObject):
+            # deepcopy fails on OPS objects, e.g., empty trajectories
+            dct = obj.to_dict()
+            new_dct = rebind(dct)
+            if new_dct is not dct:
+                # to_dict may give JSON forms, e.g., of a CV's function
+                memo[id(obj)] = obj.from_dict(json.build(new_dct))
+            else:
+                memo[id(obj)] = obj
+            return memo[id(obj)]
+        else:
+            return copy.deepcopy(obj, memo)
+        return new if changed else obj
+
+    return rebind(obj)
+
+
+class ConcurrentTwoWayShootingMover(AbstractTwoWayShootingMover):
+    """Two-way shooting with the halves run at the same time.
+
+    The forward half runs on ``engine`` and the backward half on
+    ``backward_engine``, which must be a separate instance of the same
+    engine. As in OPS's two-way shooting, the old path stands in for the
+    other half while checking whether a half can continue. The backward
+    half is checked with ``backward_ensemble``, a copy of the ensemble
+    with its CVs on ``backward_engine``, so the backward thread never uses
+    the forward engine while that is integrating.
+
+    Parameters
+    ----------
+    ensemble : :class:`openpathsampling.Ensemble`
+    selector : :class:`openpathsampling.ShootingPointSelector`
+    modifier : :class:`openpathsampling.SnapshotModifier`
+    engine :
+        engine for the forward half
+    backward_engine :
+        engine for the backward half
+    """
+    def __init__(self, ensemble, selector, modifier, engine=None,
+                 backward_engine=None):
+        super(ConcurrentTwoWayShootingMover, self).__init__(
+            ensemble=ensemble, selector=selector, modifier=modifier,
+            engine=engine
+        )
+        self.backward_engine = backward_engine
+        # made again on load, so it is private (not saved)
+        self._backward_ensemble = rebind_engine(ensemble, engine,
+                                                backward_engine)
+        self._executor = ThreadPoolExecutor(max_workers=2)
+
+    @property
+    def backward_ensemble(self):
+        return self._backward_ensemble
+
+    def _run(self, trajectory, shooting_index):
+        ensemble = self.target_ensemble
+        backward_ensemble = self._backward_ensemble
+        modified = self.modifier(trajectory[shooting_index])
+        before = trajectory[:shooting_index]
+        after = trajectory[shooting_index + 1:]
+
+        def forward_running(half, trusted=False):
+            return ensemble.can_append(before + half, trusted)
+
+        def backward_running(half, trusted=False):
+            return backward_ensemble.can_prepend(half + after, trusted)
+
+        # a finished forward half must be able to end a valid path, and a
+        # finished backward half must be able to start one
+        backward, forward, cancelled = generate_halves(
+            snapshot=modified,
+            forward_engine=self.engine,
+            backward_engine=self.backward_engine,
+            forward_running=forward_running,
+            backward_running=backward_running,
+            forward_ok=ensemble.strict_can_prepend,
+            backward_ok=backward_ensemble.strict_can_append,
+            executor=self._executor
+        )
+        # a cancelled trial is partial, so the ensemble check rejects it
+        trial = backward + forward[1:]
+        details = {'modified_shooting_snapshot': modified,
+                   'cancelled': cancelled}
+        return trial, details
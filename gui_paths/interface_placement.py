@@ -0,0 +1,160 @@
+"""
+Place TIS interfaces from CV values along existing trajectories.
+
+Every time a trajectory leaves a state, the largest CV value reached
+before returning (the excursion maximum) is recorded. A histogram of the
+excursion maxima gives the crossing probability ``P(lambda)``: the
+fraction of excursions reaching ``lambda``. Interfaces are placed at equal
+steps of ``ln P(lambda)``, so the conditional crossing probability between
+successive interfaces is roughly the same everywhere. For a fixed overall
+crossing probability this minimizes the total sampling cost. Usage::
+
+    python -m gui_paths.interface_placement trajectory.nc --cv dist \\
+        --state 0.3 --final 1.0 --n-interfaces 6
+"""
+import argparse
+
+import numpy as np
+
+
+def excursion_maxima(values, lambda_state, increasing=True):
+    """Largest CV value of each excursion out of a state.
+
+    The state is ``values < lambda_state`` (or ``values > lambda_state`` if
+    not ``increasing``). An excursion starts when the trajectory leaves the
+    state; the frames before the first visit to the state are not an
+    excursion. The last excursion may be cut off by the end of the
+    trajectory; it is kept, since a transition trajectory ends with one.
+    """
+    values = np.asarray(values, dtype=float)
+    if not increasing:
+        return -excursion_maxima(-values, -lambda_state)
+    outside = values >= lambda_state
+    if len(values) == 0 or outside.all():
+        return np.array([])
+    changes = np.flatnonzero(np.diff(outside.astype(int))) + 1
+    starts = np.concatenate([[0], changes])
+    maxima = np.maximum.reduceat(values, starts)
+    is_excursion = outside[starts]
+    is_excursion[0] = False  # not from the state (or is the state)
+    return maxima[is_excursion]
+
+
+def crossing_probability(maxima, edges):
+    """Fraction of the excursions that reach each of ``edges``"""
+    maxima = np.asarray(maxima, dtype=float)
+    if len(maxima) == 0:
+        return np.zeros(len(edges))
+    counts, _ = np.histogram(np.clip(maxima, edges[0], edges[-1]),
+                             bins=edges)
+    # excursions reaching an edge are those in the bins from there on; the
+    # last edge is only reached by excursions in the top bin that got there
+    reached = np.concatenate([np.cumsum(counts[::-1])[::-1],
+                              [np.count_nonzero(maxima >= edges[-1])]])
+    return reached / float(len(maxima))
+
+
+def place_interfaces(maxima, lambda_state, n_interfaces, lambda_final=None,
+                     increasing=True, bins=200):
+    """Interfaces with roughly equal crossing probability between them.
+
+    Parameters
+    ----------
+    maxima : array of float
+        excursion maxima, from :func:`.excursion_maxima`
+    lambda_state : float
+        edge of the state; this is the innermost interface
+    n_interfaces : int
+        number of interfaces, including the innermost one
+    lambda_final : float or None
+        where the crossing probability is taken to end, usually the edge
+        of the next state; if None (or beyond the data), the largest
+        excursion maximum is used
+    increasing : bool
+        whether the CV increases away from the state
+    bins : int
+        number of histogram bins between ``lambda_state`` and
+        ``lambda_final``
+
+    Returns
+    -------
+    list of float
+        interface values, from the state outward; fewer than
+        ``n_interfaces`` if the histogram is too coarse to separate them
+    """
+    sign = 1.0 if increasing else -1.0
+    maxima = sign * np.asarray(maxima, dtype=float)
+    lambda_state = sign * lambda_state
+    if len(maxima) == 0:
+        raise ValueError("No excursions out of the state in the data")
+    reached = maxima.max()
+    if lambda_final is None or sign * lambda_final > reached:
+        lambda_final = reached
+    else:
+        lambda_final = sign * lambda_final
+    if lambda_final <= lambda_state:
+        return [sign * lambda_state]
+
+    edges = np.linspace(lambda_state, lambda_final, bins + 1)
+    probability = crossing_probability(maxima, edges)
+    ln_prob = np.log(probability[probability > 0])
+    # the last step (last interface to lambda_final) is as hard as the rest
+    targets = ln_prob[-1] * np.arange(n_interfaces) / n_interfaces
+    indices = np.searchsorted(-ln_prob, -targets, side='left')
+    interfaces = np.unique(edges[indices])
+    # adding 0.0 turns -0.0 into 0.0
+    return [float(sign * interface) + 0.0 for interface in interfaces]
+
+
+def maxima_from_file(traj_file, cv_name, lambda_state, increasing=True,
+                     chunk_size=1000):
+    """Excursion maxima over all trajectories in a storage file.
+
+    The CV is evaluated on chunks of ``chunk_size`` frames, with storage
+    caches cleared between chunks.
+    """
+    from .storage_tools import clear_caches, open_storage
+    storage = open_storage(traj_file, mode='r')
+    maxima = []
+    try:
+        cv = storage.cvs[cv_name]
+        for traj_num in range(len(storage.trajectories)):
+            traj = storage.trajectories[traj_num]
+            values = np.empty(len(traj))
+            for start in range(0, len(traj), chunk_size):
+                chunk = traj[start:start + chunk_size]
+                values[start:start + len(chunk)] = np.ravel(cv(chunk))
+                clear_caches(storage)
+            maxima.append(excursion_maxima(values, lambda_state,
+                                           increasing))
+    finally:
+        storage.close()
+    return np.concatenate(maxima) if maxima else np.array([])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Place TIS interfaces from existing trajectories"
+    )
+    parser.add_argument('traj_file')
+    parser.add_argument('--cv', required=True, help="name of the CV")
+    parser.add_argument('--state', type=float, required=True,
+                        help="CV value at the edge of the state")
+    parser.add_argument('--final', type=float, default=None,
+                        help="CV value at the edge of the next state")
+    parser.add_argument('--n-interfaces', type=int, default=5)
+    parser.add_argument('--decreasing', action='store_true',
+                        help="the CV decreases away from the state")
+    parser.add_argument('--bins', type=int, default=200)
+    opts = parser.parse_args()
+    increasing = not opts.decreasing
+    maxima = maxima_from_file(opts.traj_file, opts.cv, opts.state,
+                              increasing)
+    interfaces = place_interfaces(maxima, opts.state, opts.n_interfaces,
+                                  opts.final, increasing, opts.bins)
+    print("Excursions: " + str(len(maxima)))
+    print("Interfaces: " + ", ".join(str(l) for l in interfaces))
+
+
+if __name__ == "__main__":
+    main()
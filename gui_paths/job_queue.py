@@ -0,0 +1,399 @@
+"""
+Local job queue for running generated scripts on a single machine.
+
+Jobs are run in a bounded pool: each job reserves a number of cores, and
+the scheduler never starts more jobs than the free cores allow. The queue
+is saved to a JSON file after every change, so it survives a restart of the
+scheduler, and jobs can be added while the scheduler runs. Usage::
+
+    python -m gui_paths.job_queue add queue.json sweep_dir/ --cores 4
+    python -m gui_paths.job_queue run queue.json --max-cores 32
+    python -m gui_paths.job_queue status queue.json
+"""
+import os
+import sys
+import json
+import time
+import fcntl
+import warnings
+import contextlib
+import argparse
+import subprocess
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# runs a script in this process, like ``python script``, and saves its exit
+# status, which is lost if the scheduler that started it has died
+EXIT_STATUS_WRAPPER = """
+import sys
+import runpy
+script, status_file = sys.argv[1:3]
+sys.argv = [script]
+status = 1
+try:
+    runpy.run_path(script, run_name="__main__")
+    status = 0
+except SystemExit as exc:
+    if exc.code is None:
+        status = 0
+    elif isinstance(exc.code, int):
+        status = exc.code
+    raise
+finally:
+    with open(status_file, mode='w') as f:
+        f.write(str(status))
+"""
+
+
+class Job(object):
+    """A single script to run.
+
+    Parameters
+    ----------
+    script : str
+        path to the Python script; it is run from its own directory
+    n_cores : int
+        number of cores reserved for this job
+    n_threads : int or None
+        number of OpenMP threads; defaults to ``n_cores``
+    """
+    def __init__(self, script, n_cores=1, n_threads=None, status=QUEUED,
+                 attempts=0, returncode=None, pid=None, cores=None):
+        self.script = os.path.abspath(script)
+        self.n_cores = n_cores
+        if n_threads is None:
+            n_threads = n_cores
+        self.n_threads = n_threads
+        self.status = status
+        self.attempts = attempts
+        self.returncode = returncode
+        self.pid = pid
+        self.process = None
+        if cores is None:
+            cores = []
+        self.cores = cores
+
+    @property
+    def directory(self):
+        return os.path.dirname(self.script)
+
+    @property
+    def log_file(self):
+        return os.path.splitext(self.script)[0] + ".log"
+
+    @property
+    def status_file(self):
+        return os.path.splitext(self.script)[0] + ".returncode"
+
+    def exit_status(self):
+        """Exit status saved by the last run, or None if it didn't save one
+        (because it was killed, or is still running)"""
+        try:
+            with open(self.status_file, mode='r') as f:
+                return int(f.read())
+        except (IOError, ValueError):
+            return None
+
+    def to_dict(self):
+        return {'script': self.script,
+                'n_cores': self.n_cores,
+                'n_threads': self.n_threads,
+                'status': self.status,
+                'attempts': self.attempts,
+                'returncode': self.returncode,
+                'pid': self.pid,
+                'cores': self.cores}
+
+    @classmethod
+    def from_dict(cls, dct):
+        return cls(**dct)
+
+    def environment(self):
+        env = dict(os.environ)
+        env['OMP_NUM_THREADS'] = str(self.n_threads)
+        return env
+
+    def start(self, cores, pin=False):
+        """Start the script; if ``pin``, restrict it to the CPUs ``cores``
+        """
+        self.cores = cores
+        self.attempts += 1
+        self.status = RUNNING
+
+        def pin_cores():
+            os.sched_setaffinity(0, cores)
+
+        if os.path.exists(self.status_file):
+            os.remove(self.status_file)
+        log = open(self.log_file, mode='a')
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', EXIT_STATUS_WRAPPER, self.script,
+             self.status_file],
+            cwd=self.directory,
+            env=self.environment(),
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            preexec_fn=pin_cores if pin else None
+        )
+        self.pid = self.process.pid
+        log.close()  # the child has its own handle
+
+    def poll(self):
+        """Return the return code if the job has finished, else None"""
+        return self.process.poll()
+
+    def is_alive(self):
+        """Whether the process with our PID is still running this script.
+
+        Used for jobs started by an earlier scheduler, which we can't
+        ``poll``. The command line is checked where possible, in case the
+        PID has been reused.
+        """
+        if self.pid is None:
+            return False
+        try:
+            os.kill(self.pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass  # exists, but belongs to someone else
+        cmdline_file = "/proc/" + str(self.pid) + "/cmdline"
+        if os.path.exists(cmdline_file):
+            with open(cmdline_file, mode='rb') as f:
+                cmdline = f.read().split(b"\0")
+            return os.fsencode(self.script) in cmdline
+        return True
+
+
+def allowed_cpus():
+    """CPUs this process may run on, or None if that can't be known"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return None
+
+
+def find_scripts(path, script_name="run.py"):
+    """Scripts to run for ``path``: the file itself, or a sweep directory.
+
+    For a directory, every ``script_name`` below it is returned, sorted.
+    """
+    if os.path.isfile(path):
+        return [path]
+    scripts = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        if script_name in filenames:
+            scripts.append(os.path.join(dirpath, script_name))
+    return sorted(scripts)
+
+
+class JobQueue(object):
+    """Persistent queue of jobs, run in a bounded process pool.
+
+    Parameters
+    ----------
+    queue_file : str
+        JSON file where the queue is saved; loaded if it exists. Other
+        processes may add jobs to it while the queue runs.
+    max_cores : int or None
+        number of cores the scheduler may use; defaults to all cores this
+        process may run on. Jobs are pinned to the first ``max_cores`` of
+        those, if there are enough of them.
+    max_retries : int
+        number of times a crashed job is restarted before it is marked as
+        failed
+    """
+    def __init__(self, queue_file, max_cores=None, max_retries=2):
+        self.queue_file = queue_file
+        cpus = allowed_cpus()
+        if max_cores is None:
+            max_cores = len(cpus) if cpus else (os.cpu_count() or 1)
+        self.max_cores = max_cores
+        self.pin = cpus is not None and len(cpus) >= max_cores
+        if self.pin:
+            self.cores = cpus[:max_cores]
+        else:
+            if cpus is not None:
+                warnings.warn("Not pinning jobs to cores: max_cores is "
+                              + str(max_cores) + ", but this process may "
+                              + "only use CPUs " + str(cpus))
+            self.cores = list(range(max_cores))
+        self.max_retries = max_retries
+        self.jobs = []
+        if os.path.exists(queue_file):
+            self.load()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """Lock the queue file while reading and rewriting it"""
+        with open(self.queue_file + ".lock", mode='a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read(self):
+        if not os.path.exists(self.queue_file):
+            return []
+        with open(self.queue_file, mode='r') as f:
+            return [Job.from_dict(dct) for dct in json.load(f)]
+
+    def _write(self):
+        tmp_file = self.queue_file + ".tmp"
+        with open(tmp_file, mode='w') as f:
+            json.dump([job.to_dict() for job in self.jobs], f, indent=2)
+        os.replace(tmp_file, self.queue_file)
+
+    def _merge(self):
+        """Add jobs that other processes saved to the file; for jobs we
+        know, our state is newer. Must be called with the file locked."""
+        known = set(job.script for job in self.jobs)
+        new_jobs = [job for job in self._read() if job.script not in known]
+        self.jobs.extend(new_jobs)
+        return new_jobs
+
+    def load(self):
+        with self._locked():
+            self.jobs = self._read()
+        # anything "running" belonged to a scheduler that died; its job
+        # may still be running, in which case it keeps its cores
+        for job in self.jobs:
+            if job.status == RUNNING and not job.is_alive():
+                self._finish(job, job.exit_status())
+
+    def save(self):
+        with self._locked():
+            self._merge()
+            self._write()
+
+    def add(self, path, n_cores=1, n_threads=None):
+        """Add a script or all scripts in a sweep directory"""
+        if n_cores > self.max_cores:
+            raise ValueError("Job needs " + str(n_cores) + " cores; only "
+                             + str(self.max_cores) + " available")
+        with self._locked():
+            self._merge()
+            known = set(job.script for job in self.jobs)
+            new_jobs = [Job(script, n_cores, n_threads)
+                        for script in find_scripts(path)
+                        if os.path.abspath(script) not in known]
+            self.jobs.extend(new_jobs)
+            self._write()
+        return new_jobs
+
+    def _with_status(self, status):
+        return [job for job in self.jobs if job.status == status]
+
+    def _free_cores(self):
+        used = set(core for job in self._with_status(RUNNING)
+                   for core in job.cores)
+        return [core for core in self.cores if core not in used]
+
+    def _finish(self, job, returncode):
+        job.returncode = returncode
+        job.process = None
+        job.pid = None
+        job.cores = []
+        if returncode == 0:
+            job.status = DONE
+        elif job.attempts <= self.max_retries:
+            job.status = QUEUED
+        else:
+            job.status = FAILED
+
+    def step(self):
+        """Check running jobs and start queued jobs that fit.
+
+        Returns True while there is still work to do.
+        """
+        with self._locked():
+            self._merge()
+        changed = False
+        for job in self._with_status(RUNNING):
+            if job.process is None:
+                # started by an earlier scheduler, so we can't poll it; its
+                # exit status is in its status file, unless it was killed
+                if not job.is_alive():
+                    self._finish(job, job.exit_status())
+                    changed = True
+                continue
+            returncode = job.poll()
+            if returncode is not None:
+                self._finish(job, returncode)
+                changed = True
+
+        free = self._free_cores()
+        for job in self._with_status(QUEUED):
+            if job.n_cores > self.max_cores:
+                job.status = FAILED  # can never fit in this pool
+                changed = True
+            elif job.n_cores <= len(free):
+                cores, free = free[:job.n_cores], free[job.n_cores:]
+                job.start(cores, pin=self.pin)
+                changed = True
+
+        if changed:
+            self.save()
+        return bool(self._with_status(QUEUED) or self._with_status(RUNNING))
+
+    def run(self, poll_interval=1.0):
+        """Run until every job is done or has failed"""
+        while self.step():
+            time.sleep(poll_interval)
+
+    def status_table(self):
+        lines = ["{:<8} {:>5} {:>8}  {}".format("status", "cores",
+                                                "attempts", "script")]
+        for job in self.jobs:
+            lines.append("{:<8} {:>5} {:>8}  {}".format(
+                job.status, job.n_cores, job.attempts, job.script
+            ))
+        counts = {status: len(self._with_status(status))
+                  for status in [QUEUED, RUNNING, DONE, FAILED]}
+        lines.append(", ".join("{}: {}".format(status, count)
+                               for status, count in counts.items()))
+        return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run generated scripts in a local job queue"
+    )
+    subparsers = parser.add_subparsers(dest='command')
+    add = subparsers.add_parser('add', help="add scripts to the queue")
+    add.add_argument('queue_file')
+    add.add_argument('paths', nargs='+',
+                     help="scripts, or directories with run.py files")
+    add.add_argument('--cores', type=int, default=1)
+    add.add_argument('--threads', type=int, default=None,
+                     help="OpenMP threads per job (default: --cores)")
+    run = subparsers.add_parser('run', help="run the queued jobs")
+    run.add_argument('queue_file')
+    run.add_argument('--max-cores', type=int, default=None)
+    run.add_argument('--max-retries', type=int, default=2)
+    run.add_argument('--poll-interval', type=float, default=1.0)
+    status = subparsers.add_parser('status', help="show the queue")
+    status.add_argument('queue_file')
+    opts = parser.parse_args()
+
+    if opts.command == 'add':
+        queue = JobQueue(opts.queue_file)
+        for path in opts.paths:
+            queue.add(path, n_cores=opts.cores, n_threads=opts.threads)
+    elif opts.command == 'run':
+        queue = JobQueue(opts.queue_file, max_cores=opts.max_cores,
+                         max_retries=opts.max_retries)
+        queue.run(poll_interval=opts.poll_interval)
+    elif opts.command == 'status':
+        queue = JobQueue(opts.queue_file)
+    else:
+        parser.print_help()
+        return
+    print(queue.status_table())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Index of the groups, computes, fixes, and atom counts in a LAMMPS setup.
+
+The input script (and anything it includes) is scanned line by line, and
+for data files only the header is read. Everything goes through ``mmap``,
+so nothing ever loads a whole file; the cost of scanning does not depend on
+the number of atoms. The index is cached in a JSON file, and is only
+rebuilt when one of the files it was built from has changed.
+"""
+import os
+import mmap
+import copy
+import json
+import hashlib
+
+# first word of the line that starts the body of a data file
+DATA_SECTIONS = set(['Atoms', 'Velocities', 'Masses', 'Ellipsoids', 'Lines',
+                     'Triangles', 'Bodies', 'Bonds', 'Angles', 'Dihedrals',
+                     'Impropers', 'Pair', 'PairIJ', 'Bond', 'Angle',
+                     'Dihedral', 'Improper', 'BondBond', 'BondAngle',
+                     'MiddleBondTorsion', 'EndBondTorsion', 'AngleTorsion',
+                     'AngleAngleTorsion', 'BondBond13', 'AngleAngle'])
+
+# never read more than this much looking for the end of a data file header
+MAX_HEADER_BYTES = 1 << 20
+
+
+def _mapped_lines(filename, max_bytes=None):
+    """Iterate over the decoded lines of a file, using a memory map"""
+    with open(filename, mode='rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            line = mm.readline()
+            while line:
+                yield line.decode('utf-8', errors='replace')
+                if max_bytes is not None and mm.tell() > max_bytes:
+                    break
+                line = mm.readline()
+        finally:
+            mm.close()
+
+
+def _commands(filename):
+    """LAMMPS commands in a script, as lists of words.
+
+    Comments are removed and ``&`` continuation lines are joined.
+    """
+    pending = ""
+    for line in _mapped_lines(filename):
+        line = line.split('#', 1)[0].rstrip()
+        if line.endswith('&'):
+            pending += line[:-1] + " "
+            continue
+        words = (pending + line).split()
+        pending = ""
+        if words:
+            yield words
+
+
+def _file_key(filename, hash_bytes=None):
+    """Record used to check whether a cached index is still valid"""
+    stat = os.stat(filename)
+    sha = hashlib.sha1()
+    with open(filename, mode='rb') as f:
+        sha.update(f.read(hash_bytes) if hash_bytes else f.read())
+    return {'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha1': sha.hexdigest()}
+
+
+def scan_data_header(filename):
+    """Counts from the header of a LAMMPS data file.
+
+    Returns a dict with keys like ``'atoms'`` and ``'atom types'``.
+    """
+    counts = {}
+    lines = _mapped_lines(filename, max_bytes=MAX_HEADER_BYTES)
+    next(lines, None)  # first line of a data file is always a title
+    for line in lines:
+        words = line.split('#', 1)[0].split()
+        if not words:
+            continue
+        if words[0] in DATA_SECTIONS:
+            break
+        try:
+            value = int(words[0])
+        except ValueError:
+            continue  # box bounds and tilt factors are floats
+        counts[" ".join(words[1:])] = value
+    return counts
+
+
+class LAMMPSIndex(object):
+    """Information extracted from a LAMMPS input script.
+
+    Attributes
+    ----------
+    groups : list of str
+        group IDs, including the implicit ``all``
+    computes : dict
+        compute ID to the rest of its definition, ``"group style args"``,
+        which is the form CV parameters take
+    fixes : dict
+        fix ID to the rest of its definition, ``"group style args"``
+    data_files : list of str
+        data files read by the script
+    n_atoms : int or None
+        number of atoms in the data files, if any were read
+    files : dict
+        file name to the key (mtime, size, hash) it had when scanned
+    """
+    def __init__(self, groups=None, computes=None, fixes=None,
+                 data_files=None, n_atoms=None, files=None):
+        self.groups = groups if groups is not None else ['all']
+        self.computes = computes if computes is not None else {}
+        self.fixes = fixes if fixes is not None else {}
+        self.data_files = data_files if data_files is not None else []
+        self.n_atoms = n_atoms
+        self.files = files if files is not None else {}
+
+    def to_dict(self):
+        return {'groups': self.groups,
+                'computes': self.computes,
+                'fixes': self.fixes,
+                'data_files': self.data_files,
+                'n_atoms': self.n_atoms,
+                'files': self.files}
+
+    @classmethod
+    def from_dict(cls, dct):
+        for key in ['computes', 'fixes']:
+            if not all(isinstance(definition, str)
+                       for definition in dct[key].values()):
+                raise ValueError("Outdated format for " + key)
+        return cls(**dct)
+
+    def parameter_choices(self):
+        """CV parameters to offer: each group, then each compute's
+        definition. Fixes aren't offered: a LAMMPS compute CV can only
+        extract a compute."""
+        return ([group + " " for group in self.groups]
+                + sorted(set(self.computes.values())))
+
+    def is_current(self):
+        """Whether all the files scanned are unchanged.
+
+        Files that were only touched get their new mtime and size recorded,
+        so they aren't hashed again next time.
+        """
+        for filename, key in self.files.items():
+            if not os.path.exists(filename):
+                return False
+            stat = os.stat(filename)
+            if (stat.st_mtime_ns, stat.st_size) != (key['mtime'],
+                                                    key['size']):
+                # touched, but maybe not changed
+                new_key = _file_key(filename, key.get('hash_bytes'))
+                if new_key['sha1'] != key['sha1']:
+                    return False
+                key.update(mtime=new_key['mtime'], size=new_key['size'])
+        return True
+
+    def _scan_script(self, filename, including=()):
+        # scripts that include this one; LAMMPS would include forever
+        including = set(including) | {os.path.realpath(filename)}
+        self.files[filename] = _file_key(filename)
+        directory = os.path.dirname(filename)
+        for words in _commands(filename):
+            command, args = words[0], words[1:]
+            if command == 'group' and args:
+                if len(args) > 1 and args[1] == 'delete':
+                    if args[0] in self.groups:
+                        self.groups.remove(args[0])
+                elif args[0] not in self.groups:
+                    self.groups.append(args[0])
+            elif command == 'compute' and len(args) >= 3:
+                self.computes[args[0]] = " ".join(args[1:])
+            elif command == 'uncompute' and args:
+                self.computes.pop(args[0], None)
+            elif command == 'fix' and len(args) >= 3:
+                self.fixes[args[0]] = " ".join(args[1:])
+            elif command == 'unfix' and args:
+                self.fixes.pop(args[0], None)
+            elif command == 'read_data' and args:
+                self._scan_data(os.path.join(directory, args[0]))
+            elif command == 'include' and args:
+                included = os.path.join(directory, args[0])
+                if (os.path.exists(included)
+                        and os.path.realpath(included) not in including):
+                    self._scan_script(included, including)
+
+    def _scan_data(self, filename):
+        self.data_files.append(filename)
+        if not os.path.exists(filename):
+            return  # e.g., a name built from LAMMPS variables
+        key = _file_key(filename, hash_bytes=MAX_HEADER_BYTES)
+        key['hash_bytes'] = MAX_HEADER_BYTES
+        self.files[filename] = key
+        n_atoms = scan_data_header(filename).get('atoms')
+        if n_atoms is not None:
+            self.n_atoms = (self.n_atoms or 0) + n_atoms
+
+    @classmethod
+    def from_script(cls, filename):
+        index = cls()
+        index._scan_script(os.path.abspath(filename))
+        return index
+
+
+def default_cache_file(script):
+    directory, name = os.path.split(os.path.abspath(script))
+    return os.path.join(directory, "." + name + ".index.json")
+
+
+def scan_lammps_script(script, cache_file=None):
+    """Get the :class:`.LAMMPSIndex` for a script, using the cache if valid.
+
+    Parameters
+    ----------
+    script : str
+        LAMMPS input script
+    cache_file : str or None
+        JSON file for the cached index; by default, a hidden file next to
+        the script
+
+    Returns
+    -------
+    :class:`.LAMMPSIndex`
+    """
+    if cache_file is None:
+        cache_file = default_cache_file(script)
+
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, mode='r') as f:
+                index = LAMMPSIndex.from_dict(json.load(f))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            index = None  # corrupt or outdated cache format; just rescan
+        if index is not None:
+            keys = copy.deepcopy(index.files)
+            if index.is_current():
+                if index.files != keys:
+                    _write_cache(index, cache_file)  # new mtimes
+                return index
+
+    index = LAMMPSIndex.from_script(script)
+    _write_cache(index, cache_file)
+    return index
+
+
+def _write_cache(index, cache_file):
+    try:
+        with open(cache_file, mode='w') as f:
+            json.dump(index.to_dict(), f)
+    except (IOError, OSError):
+        pass  # read-only directory: index still works, just not cached
@@ -15,9 +15,11 @@ def main_gui():
         states=cv_states.states,
         previous=cv_states
     )
+    run_panel = controllers.RunController(script="run.py")
     cv_states.accepted.connect(sim_details.show)
+    sim_details.accepted.connect(run_panel.show)
     cv_states.show()
-    return cv_states, sim_details
+    return cv_states, sim_details, run_panel
 
 def alt_gui():
     window = controllers.SimController()
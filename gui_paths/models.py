@@ -0,0 +1,113 @@
+"""
+Qt item models over the dicts of code writers held by the controllers.
+
+The controllers keep their CVs and states in plain dicts (name to
+``CodeWriter``); :class:`.NamedObjectListModel` exposes such a dict to Qt
+views. Several views can share one model, so opening a dialog that lists
+the CVs is just a ``setModel``, no matter how many CVs there are.
+"""
+from PyQt5.QtCore import (Qt, QAbstractListModel, QModelIndex,
+                          QSortFilterProxyModel)
+
+
+class NamedObjectListModel(QAbstractListModel):
+    """List model for a dict of named objects.
+
+    The model does not copy the objects; it wraps ``dct`` and all changes
+    should go through the model so that views are notified.
+
+    Parameters
+    ----------
+    dct : dict
+        the dictionary of objects, using names as keys
+    parent : QObject
+        Qt parent of the model
+    """
+    def __init__(self, dct=None, parent=None):
+        super(NamedObjectListModel, self).__init__(parent)
+        if dct is None:
+            dct = {}
+        self.dct = dct
+        self._names = list(dct)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._names)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self._names):
+            return None
+        name = self._names[index.row()]
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return name
+        if role == Qt.UserRole:
+            return self.dct[name]
+        return None
+
+    def name(self, row):
+        return self._names[row]
+
+    def add(self, name, obj):
+        """Add (or replace) a single object"""
+        self.add_many([(name, obj)])
+
+    def add_many(self, items):
+        """Add many objects with a single change notification.
+
+        Parameters
+        ----------
+        items : iterable of (str, object)
+            pairs of name and object; objects with names already in the
+            model replace the existing object
+        """
+        new_names = []
+        replaced = set()
+        for name, obj in items:
+            if name in self.dct:
+                replaced.add(name)
+            else:
+                new_names.append(name)
+            self.dct[name] = obj
+
+        if new_names:
+            first = len(self._names)
+            self.beginInsertRows(QModelIndex(), first,
+                                 first + len(new_names) - 1)
+            self._names.extend(new_names)
+            self.endInsertRows()
+
+        # names added earlier in this batch are new rows, not replacements
+        replaced.difference_update(new_names)
+        if replaced:
+            rows = [row for row, name in enumerate(self._names)
+                    if name in replaced]
+            # one signal covers all replaced objects
+            self.dataChanged.emit(self.index(min(rows)),
+                                  self.index(max(rows)))
+
+    def remove(self, name):
+        row = self._names.index(name)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._names[row]
+        del self.dct[name]
+        self.endRemoveRows()
+
+    def refresh(self):
+        """Resynchronize after the dict was changed outside the model"""
+        self.beginResetModel()
+        self._names = list(self.dct)
+        self.endResetModel()
+
+
+def filtered(model, filter_edit=None, parent=None):
+    """Proxy model for ``model``, filtered by the text in ``filter_edit``.
+
+    Matching is a case-insensitive substring search on the name.
+    """
+    proxy = QSortFilterProxyModel(parent)
+    proxy.setSourceModel(model)
+    proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+    if filter_edit is not None:
+        filter_edit.textChanged.connect(proxy.setFilterFixedString)
+    return proxy
@@ -1,45 +1,149 @@
-from .snippets import TPS_SETUP, COMMITTOR_SETUP, TRAJECTORY_SETUP, MAIN_RUN
+import hashlib
+
+from .code_writers import TransitionsWriter, FusedComputeCVsWriter
+from .snippets import (SETUP_CACHE, TPS_SETUP, TIS_SETUP, COMMITTOR_SETUP,
+                       TRAJECTORY_SETUP, PROGRESS_HOOK, MAIN_RUN)
 
 class RunPyFile(object):
     def __init__(self, run_type, cvs, volumes, engine, other_writers=None,
-                 extra_info_dict=None):
+                 extra_info_dict=None, transitions=None, fuse_cvs=False,
+                 interface_sets=None, walkers=None, concurrent_halves=None,
+                 checkpoints=None, trial_length=None):
         self.run_type = run_type
         self.cvs = cvs
         self.engine = engine
         self.volumes = volumes
+        if other_writers is None:
+            other_writers = []
         self.other_writers = other_writers
+        if extra_info_dict is None:
+            extra_info_dict = {}
         self.extra_info_dict = extra_info_dict
+        if transitions is None:
+            transitions = TransitionsWriter()
+        self.transitions = transitions
+        self.fuse_cvs = fuse_cvs
+        if interface_sets is None:
+            interface_sets = []
+        self.interface_sets = interface_sets
+        self.walkers = walkers
+        self.concurrent_halves = concurrent_halves
+        self.checkpoints = checkpoints
+        self.trial_length = trial_length
 
     @property
     def code(self):
         sim_setup = {
             'TPS': TPS_SETUP,
+            'TIS': TIS_SETUP,
             'committor': COMMITTOR_SETUP,
             'trajectory': TRAJECTORY_SETUP
         }[self.run_type]
-        run_py = "import openpathsampling as paths\n"
+        run_py = "import os\n"
+        run_py += "import openpathsampling as paths\n"
         run_py += "import openpathsampling.engines.lammps as ops_lammps\n"
-        for writer in [self.engine] + self.cvs + self.volumes:
+        cv_writers = self.cv_writers()
+        is_fused = any(isinstance(w, FusedComputeCVsWriter)
+                       for w in cv_writers)
+        if is_fused:
+            run_py += "from gui_paths.fused_computes import fused_compute\n"
+        is_stored = any(getattr(w, 'value_store', None) for w in cv_writers)
+        if is_stored:
+            run_py += ("from gui_paths.cv_store import stored_cv_value, "
+                       "cv_store_key\n")
+        if is_fused or is_stored:
+            # OPS won't save CVs using gui_paths functions otherwise
+            run_py += ("from gui_paths.storage_tools import trust_gui_paths\n"
+                       "trust_gui_paths()\n")
+        for writer in [self.engine] + cv_writers + self.volumes:
             run_py += writer.code + "\n"
 
         states = [writer for writer in self.volumes if writer.is_state]
         states_str = "[" + ", ".join(s.bound_name for s in states) + "]"
         run_py += "states = {states}\n".format(states=states_str)
+        if self.run_type == 'TPS':
+            run_py += self.transitions.code + "\n"
+        if self.run_type == 'TIS':
+            run_py += self.tis_transitions_code() + "\n"
 
         for writer in self.other_writers:
             run_py += writer.code + "\n"
 
         # TODO: get initial conditions
-        # TODO: get randomizer for committor (just take it from temperature)
         # TODO: get storage file
         # TODO: get engine
         # TODO: get n_sim_steps
         n_sim_steps = ""
 
-        run_py += sim_setup.format(**self.extra_info_dict)
-        run_py += MAIN_RUN.format(**self.extra_info_dict)
+        info = dict(self.extra_info_dict)
+        info['setup_hash'] = self.setup_hash(run_py + sim_setup)
+        info['setup_inputs'] = repr(self.setup_inputs())
+        if self.run_type in ['TPS', 'TIS']:
+            run_py += SETUP_CACHE + "\n\n"
+        info['shooting'] = ""
+        if self.run_type == 'TPS' and self.concurrent_halves is not None:
+            info['shooting'] = self.concurrent_halves.code
+        setup = sim_setup.format(**info)
+        if (self.run_type in ['TPS', 'TIS'] and self.walkers is None
+                and self.checkpoints is not None):
+            engines = ["engine"]
+            if info['shooting']:
+                engines.append("backward_engine")
+            setup = self.checkpoints.setup_code(setup, engines)
+        run_py += setup
+        if self.run_type != 'trajectory':
+            run_py += PROGRESS_HOOK
+        if self.run_type == 'TPS' and self.trial_length is not None:
+            run_py += self.trial_length.code
+        if self.run_type == 'TPS' and self.walkers is not None:
+            run_py += self.walkers.code
+        elif (self.run_type in ['TPS', 'TIS']
+              and self.checkpoints is not None):
+            run_py += self.checkpoints.code
+        else:
+            run_py += MAIN_RUN.format(**info)
 
         return run_py
 
+    def cv_writers(self):
+        """Writers for the CVs, grouping compute CVs by engine if fusing"""
+        if not self.fuse_cvs:
+            return list(self.cvs)
+        writers = []
+        by_engine = {}
+        for cv in self.cvs:
+            if FusedComputeCVsWriter.fusable(cv):
+                engine = cv.kwargs.get('engine')
+                if engine not in by_engine:
+                    by_engine[engine] = []
+                by_engine[engine].append(cv)
+            else:
+                writers.append(cv)
+        # numbered here, so the same CVs always give the same code
+        writers += [FusedComputeCVsWriter(cvs, count=num + 1)
+                    for num, cvs in enumerate(by_engine.values())]
+        return writers
+
+    def setup_inputs(self):
+        """Files the cached setup depends on: the LAMMPS script and the
+        initial trajectory"""
+        inputs = [self.engine.script]
+        inputs += [writer.trajectory_file for writer in self.other_writers
+                   if hasattr(writer, 'trajectory_file')]
+        return inputs
+
+    def tis_transitions_code(self):
+        """Interface sets, and the (state, interfaces) list for MSTIS"""
+        lines = "".join(writer.code + "\n" for writer in self.interface_sets)
+        pairs_str = ", ".join("({}, {})".format(writer.state.bound_name,
+                                                writer.bound_name)
+                              for writer in self.interface_sets)
+        return lines + "tis_transitions = [" + pairs_str + "]"
+
+    @staticmethod
+    def setup_hash(setup_code):
+        """Short hash identifying the code that sets up a simulation"""
+        return hashlib.sha1(setup_code.encode('utf-8')).hexdigest()[:16]
+
     def write(self, stream):
         stream.write(self.code)
@@ -0,0 +1,440 @@
+"""
+Path-density histograms and free-energy projections over TPS output.
+
+Two histograms over one or two CVs are accumulated in a single pass over
+the MC steps of a storage file:
+
+* the path density: for each bin, the (weighted) number of paths that
+  visit it at least once;
+* the frame histogram: all frames of all paths, from which
+  :meth:`.PathHistogram.free_energy` gives the free-energy projection.
+
+Each MC step counts its active path, so a path that stays active over
+several steps (rejected trials) counts once per step; CVs are still only
+evaluated once per path. Steps are read in batches, with caches cleared in
+between, and CVs are evaluated on chunks of frames, so memory use is fixed
+by the bins and batch sizes, not by the file. CV values saved in the file
+are used instead of recomputing. For CVs of a run that used a value store
+(``cv_values.db``), give that store with ``--value-store``: stored values
+are used, and new ones added to it.
+
+Histograms record which MC steps they cover. Histograms of disjoint step
+ranges can be merged, which is how the work is split over a process pool,
+and how a saved result is updated with steps added since. Usage::
+
+    python -m gui_paths.path_density tps.nc tps_hist --cv x y \\
+        --bins 50 50 --range 0 1 --range -1 1 --workers 4
+    # later, after more steps have been run:
+    python -m gui_paths.path_density tps.nc tps_hist --cv x y \\
+        --bins 50 50 --range 0 1 --range -1 1 --workers 4 --update
+
+With ``--update``, ``--bins`` and ``--range`` must match the saved
+histograms.
+"""
+import os
+import argparse
+
+import numpy as np
+
+
+class PathHistogram(object):
+    """Fixed-bin histogram of paths, in one or two CVs.
+
+    Parameters
+    ----------
+    edges : list of array-like
+        bin edges for each CV; values outside the edges are not counted
+    per_path : bool
+        if True, each path counts at most once per bin (path density);
+        otherwise every frame counts
+    """
+    def __init__(self, edges, per_path=True):
+        self.edges = [np.asarray(e, dtype=float) for e in edges]
+        self.per_path = per_path
+        self.counts = np.zeros([len(e) - 1 for e in self.edges])
+        self.n_paths = 0.0
+        self.step_ranges = []
+
+    @property
+    def n_steps(self):
+        return sum(stop - start for start, stop in self.step_ranges)
+
+    def _bin_indices(self, values):
+        values = np.asarray(values, dtype=float).reshape(len(values), -1)
+        if values.shape[1] != len(self.edges):
+            raise ValueError("Expected values of {} CVs, got {}".format(
+                len(self.edges), values.shape[1]
+            ))
+        in_range = np.ones(len(values), dtype=bool)
+        indices = []
+        for dim, edges in enumerate(self.edges):
+            idx = np.searchsorted(edges, values[:, dim], side='right') - 1
+            # the last edge belongs to the last bin
+            idx[values[:, dim] == edges[-1]] = len(edges) - 2
+            in_range &= (idx >= 0) & (idx < len(edges) - 1)
+            indices.append(idx)
+        indices = [idx[in_range] for idx in indices]
+        return np.ravel_multi_index(indices, self.counts.shape)
+
+    def add_path(self, values, weight=1.0):
+        """Add a path, given the CV values of its frames.
+
+        ``values`` has shape ``(n_frames,)`` for one CV, or ``(n_frames,
+        n_cvs)``; ``weight`` is the number of MC steps the path counts for.
+        """
+        flat = self._bin_indices(values)
+        if self.per_path:
+            flat = np.unique(flat)
+        counts = np.bincount(flat, minlength=self.counts.size)
+        self.counts += weight * counts.reshape(self.counts.shape)
+        self.n_paths += weight
+
+    def add_steps(self, start, stop):
+        """Record that MC steps ``start`` to ``stop - 1`` are included"""
+        self._check_disjoint([(start, stop)])
+        self.step_ranges = _coalesce(self.step_ranges + [(start, stop)])
+
+    def _check_disjoint(self, ranges):
+        for start, stop in ranges:
+            for other_start, other_stop in self.step_ranges:
+                if start < other_stop and other_start < stop:
+                    raise ValueError(
+                        "Steps {}-{} are already included".format(
+                            max(start, other_start),
+                            min(stop, other_stop) - 1
+                        )
+                    )
+
+    def __iadd__(self, other):
+        same_edges = (len(self.edges) == len(other.edges)
+                      and all(np.array_equal(e1, e2) for e1, e2
+                              in zip(self.edges, other.edges)))
+        if not same_edges or self.per_path != other.per_path:
+            raise ValueError("Can only merge histograms of the same kind, "
+                             "with the same bins")
+        self._check_disjoint(other.step_ranges)
+        self.counts += other.counts
+        self.n_paths += other.n_paths
+        self.step_ranges = _coalesce(self.step_ranges + other.step_ranges)
+        return self
+
+    def __add__(self, other):
+        merged = PathHistogram(self.edges, self.per_path)
+        merged += self
+        merged += other
+        return merged
+
+    def density(self):
+        """Counts per path: for a path density, the fraction of paths
+        visiting each bin"""
+        if self.n_paths == 0:
+            return np.zeros_like(self.counts)
+        return self.counts / self.n_paths
+
+    def free_energy(self, kT=1.0):
+        """``-kT ln p`` of the bins, shifted so the minimum is 0.
+
+        Empty bins are ``inf``. This is the free-energy projection for a
+        frame histogram (``per_path=False``).
+        """
+        with np.errstate(divide='ignore'):
+            energy = -kT * np.log(self.counts)
+        finite = np.isfinite(energy)
+        if finite.any():
+            energy[finite] -= energy[finite].min()
+        return energy
+
+    def save(self, filename):
+        arrays = {'edges_' + str(dim): edges
+                  for dim, edges in enumerate(self.edges)}
+        np.savez(filename, counts=self.counts, n_paths=self.n_paths,
+                 per_path=self.per_path,
+                 step_ranges=np.array(self.step_ranges,
+                                      dtype=int).reshape(-1, 2),
+                 **arrays)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            n_dims = len([key for key in data.files
+                          if key.startswith('edges_')])
+            hist = cls([data['edges_' + str(dim)] for dim in range(n_dims)],
+                       per_path=bool(data['per_path']))
+            hist.counts = data['counts']
+            hist.n_paths = float(data['n_paths'])
+            hist.step_ranges = [tuple(int(i) for i in step_range)
+                                for step_range in data['step_ranges']]
+        return hist
+
+
+def _coalesce(ranges):
+    """Sorted step ranges, with adjacent ranges joined"""
+    coalesced = []
+    for start, stop in sorted(ranges):
+        if coalesced and coalesced[-1][1] == start:
+            coalesced[-1] = (coalesced[-1][0], stop)
+        else:
+            coalesced.append((start, stop))
+    return coalesced
+
+
+def _uuid(obj):
+    return getattr(obj, '__uuid__', id(obj))
+
+
+def active_path_weights(steps):
+    """Active paths of MC steps, each with the number of steps it lasted.
+
+    Yields ``(trajectory, weight)`` for each run of consecutive steps with
+    the same active path in an ensemble.
+    """
+    current = {}  # ensemble UUID: [trajectory, weight]
+    for step in steps:
+        for sample in step.active:
+            ensemble = _uuid(sample.ensemble)
+            entry = current.get(ensemble)
+            if entry is not None and _uuid(entry[0]) == _uuid(
+                    sample.trajectory):
+                entry[1] += 1
+                continue
+            if entry is not None:
+                yield tuple(entry)
+            current[ensemble] = [sample.trajectory, 1]
+    for entry in current.values():
+        yield tuple(entry)
+
+
+def _store_key(cv):
+    """Value store key of a CV written with ``value_store``, or None"""
+    return (getattr(cv, 'kwargs', None) or {}).get('cv_key')
+
+
+def _stored_values(store, cv_key, cv, chunk):
+    """Values of ``cv`` for ``chunk``, computing only those not stored"""
+    values = [None] * len(chunk)
+    missing = []
+    for idx, snapshot in enumerate(chunk):
+        try:
+            values[idx] = store.get(cv_key, snapshot)
+        except KeyError:
+            missing.append(idx)
+    if missing:
+        computed = np.ravel(cv([chunk[idx] for idx in missing]))
+        for idx, value in zip(missing, computed):
+            store.put(cv_key, chunk[idx], value)
+            values[idx] = value
+    return np.ravel(values)
+
+
+def cv_values(cvs, trajectory, chunk_size=1000, store=None):
+    """Values of the CVs for all frames, shape ``(n_frames, n_cvs)``.
+
+    CVs are evaluated on chunks of ``chunk_size`` frames. With a
+    :class:`.cv_store.CVValueStore` ``store``, CVs wrapped for a value
+    store by the generated script are looked up there first; missing
+    values are computed by the wrapped CV, and added to the store.
+    """
+    values = np.empty((len(trajectory), len(cvs)))
+    for start in range(0, len(trajectory), chunk_size):
+        chunk = trajectory[start:start + chunk_size]
+        for col, cv in enumerate(cvs):
+            cv_key = _store_key(cv) if store is not None else None
+            if cv_key is None:
+                chunk_values = np.ravel(cv(chunk))
+            else:
+                chunk_values = _stored_values(store, cv_key,
+                                              cv.kwargs['cv'], chunk)
+            values[start:start + len(chunk), col] = chunk_values
+    return values
+
+
+def histogram_steps(storage, cvs, edges, start, stop, batch_size=100,
+                    chunk_size=1000, store=None):
+    """Path density and frame histogram for MC steps ``start:stop``.
+
+    ``store`` is passed to :func:`.cv_values`.
+
+    Returns
+    -------
+    density, frames : :class:`.PathHistogram`
+    """
+    from .storage_tools import clear_caches
+    density = PathHistogram(edges, per_path=True)
+    frames = PathHistogram(edges, per_path=False)
+
+    def steps():
+        for batch_start in range(start, stop, batch_size):
+            for idx in range(batch_start, min(batch_start + batch_size,
+                                              stop)):
+                yield storage.steps[idx]
+            clear_caches(storage)
+
+    for trajectory, weight in active_path_weights(steps()):
+        values = cv_values(cvs, trajectory, chunk_size, store)
+        density.add_path(values, weight)
+        frames.add_path(values, weight)
+    density.add_steps(start, stop)
+    frames.add_steps(start, stop)
+    return density, frames
+
+
+def _histogram_task(task):
+    from .cv_store import open_store
+    from .storage_tools import open_storage
+    (filename, cv_names, edges, start, stop, batch_size, chunk_size,
+     value_store) = task
+    store = open_store(value_store) if value_store is not None else None
+    storage = open_storage(filename, mode='r')
+    try:
+        cvs = [storage.cvs[name] for name in cv_names]
+        return histogram_steps(storage, cvs, edges, start, stop,
+                               batch_size, chunk_size, store)
+    finally:
+        storage.close()
+        # pool workers exit without running atexit handlers
+        if store is not None:
+            store.flush()
+
+
+def step_chunks(start, stop, n_chunks):
+    """Split ``start:stop`` into at most ``n_chunks`` contiguous ranges"""
+    bounds = np.linspace(start, stop, n_chunks + 1).astype(int)
+    return [(int(lo), int(hi)) for lo, hi in zip(bounds[:-1], bounds[1:])
+            if hi > lo]
+
+
+def histograms_from_file(tps_file, cv_names, edges, start=0, stop=None,
+                         n_workers=1, n_chunks=None, batch_size=100,
+                         chunk_size=1000, value_store=None):
+    """Path density and frame histogram over MC steps of a TPS file.
+
+    Parameters
+    ----------
+    tps_file : str
+        the TPS storage file
+    cv_names : list of str
+        names of the (one or two) CVs in the file
+    edges : list of array-like
+        bin edges for each CV
+    start, stop : int
+        range of MC steps; ``stop`` None means up to the last step
+    n_workers : int
+        number of processes; each reads the file on its own
+    n_chunks : int or None
+        number of step ranges to split the work into; by default, four
+        per worker so that workers finish at about the same time
+    batch_size : int
+        steps read between clearing caches
+    chunk_size : int
+        frames per CV evaluation
+    value_store : str or None
+        :class:`.cv_store.CVValueStore` file with CV values of the run
+
+    Returns
+    -------
+    density, frames : :class:`.PathHistogram`
+    """
+    if stop is None:
+        from .storage_tools import open_storage
+        storage = open_storage(tps_file, mode='r')
+        stop = len(storage.steps)
+        storage.close()
+    if n_chunks is None:
+        n_chunks = 4 * n_workers
+    tasks = [(tps_file, cv_names, edges, lo, hi, batch_size, chunk_size,
+              value_store)
+             for lo, hi in step_chunks(start, stop, n_chunks)]
+    density = PathHistogram(edges, per_path=True)
+    frames = PathHistogram(edges, per_path=False)
+    if n_workers > 1:
+        import multiprocessing
+        pool = multiprocessing.get_context("spawn").Pool(n_workers)
+        results = pool.imap_unordered(_histogram_task, tasks)
+    else:
+        pool = None
+        results = map(_histogram_task, tasks)
+    try:
+        for chunk_density, chunk_frames in results:
+            density += chunk_density
+            frames += chunk_frames
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return density, frames
+
+
+def update_histograms(tps_file, density, frames, cv_names, **kwargs):
+    """Add the steps of ``tps_file`` not yet in the histograms.
+
+    The histograms must cover steps from 0 without gaps; only the steps
+    after those are read. ``kwargs`` are passed to
+    :func:`.histograms_from_file`.
+    """
+    ranges = density.step_ranges
+    start = ranges[0][1] if ranges else 0
+    if ranges != frames.step_ranges or ranges not in [[], [(0, start)]]:
+        raise ValueError("Histograms must cover the same steps, from 0 "
+                         "without gaps")
+    new_density, new_frames = histograms_from_file(
+        tps_file, cv_names, density.edges, start=start, **kwargs
+    )
+    density += new_density
+    frames += new_frames
+    return density, frames
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Path density and free energy from TPS output"
+    )
+    parser.add_argument('tps_file')
+    parser.add_argument('output', help="writes OUTPUT_density.npz and "
+                        "OUTPUT_frames.npz")
+    parser.add_argument('--cv', nargs='+', required=True,
+                        help="names of one or two CVs")
+    parser.add_argument('--bins', nargs='+', type=int, required=True,
+                        help="number of bins for each CV")
+    parser.add_argument('--range', nargs=2, type=float, action='append',
+                        required=True, metavar=('MIN', 'MAX'),
+                        help="histogram range; once for each CV")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--update', action='store_true',
+                        help="add new steps to existing output")
+    parser.add_argument('--value-store', default=None,
+                        help="CV value store of the run, e.g., "
+                        "cv_values.db")
+    opts = parser.parse_args()
+    if not len(opts.cv) == len(opts.bins) == len(opts.range):
+        parser.error("give --bins and --range for each CV")
+    edges = [np.linspace(lo, hi, n_bins + 1)
+             for (lo, hi), n_bins in zip(opts.range, opts.bins)]
+    density_file = opts.output + "_density.npz"
+    frames_file = opts.output + "_frames.npz"
+    if opts.update and os.path.exists(density_file):
+        density = PathHistogram.load(density_file)
+        same_edges = (len(density.edges) == len(edges)
+                      and all(saved.shape == new.shape
+                              and np.allclose(saved, new)
+                              for saved, new in zip(density.edges, edges)))
+        if not same_edges:
+            parser.error("--bins and --range differ from the histograms "
+                         "in " + density_file)
+        density, frames = update_histograms(
+            opts.tps_file, density, PathHistogram.load(frames_file),
+            opts.cv, n_workers=opts.workers, batch_size=opts.batch_size,
+            value_store=opts.value_store
+        )
+    else:
+        density, frames = histograms_from_file(
+            opts.tps_file, opts.cv, edges, n_workers=opts.workers,
+            batch_size=opts.batch_size, value_store=opts.value_store
+        )
+    density.save(density_file)
+    frames.save(frames_file)
+    print("{} steps, {} paths".format(density.n_steps, density.n_paths))
+
+
+if __name__ == "__main__":
+    main()
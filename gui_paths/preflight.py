@@ -0,0 +1,564 @@
+"""
+Preflight check of generated scripts, without OPS or LAMMPS.
+
+Mistakes in a generated ``run.py`` usually only show up once the job has
+waited in the queue. :func:`.preflight` runs the setup part of a script
+(everything outside ``if __name__ == "__main__":``) against lightweight
+stand-ins for ``openpathsampling``, ``openpathsampling.engines.lammps``,
+and the ``gui_paths`` helpers, which takes milliseconds. It reports:
+
+* names that are never defined (anywhere in the script, including the
+  main block);
+* input files that don't exist;
+* parameters the stand-ins can check: arguments that don't match the
+  OPS/LAMMPS signatures, empty volumes, engine options, and compute
+  groups that the LAMMPS script doesn't define.
+
+Nothing is written to disk: files the script creates (storages, logs,
+the setup cache) only exist in memory during the check.
+"""
+import io
+import os
+import ast
+import sys
+import types
+import errno
+import inspect
+import argparse
+import builtins
+import symtable
+import traceback
+
+from .lammps_scanner import LAMMPSIndex
+
+SCRIPT_NAME = "<run.py>"
+
+# stand-in OPS API: name to the parameters of the constructor or function
+OPS_API = {
+    'Storage': "filename, mode=None, template=None, fallback=None",
+    'CVDefinedVolume': "collectivevariable, lambda_min=0.0, lambda_max=1.0",
+    'PeriodicCVDefinedVolume': ("collectivevariable, lambda_min=0.0, "
+                                "lambda_max=1.0, period_min=None, "
+                                "period_max=None"),
+    'FunctionCV': ("name, f, cv_time_reversible=False, "
+                   "cv_requires_lists=False, cv_wrap_numpy_array=False, "
+                   "cv_scalarize_numpy_singletons=False, **kwargs"),
+    'InterfaceSet': "volumes, cv=None, lambdas=None, cv_max=None, "
+                    "direction=None",
+    'TPSNetwork': "initial_states, final_states, "
+                  "allow_self_transitions=False",
+    'TPSNetwork.from_state_pairs': "state_pairs, "
+                                   "allow_self_transitions=False",
+    'MSTISNetwork': "trans_info, ms_outers=None",
+    'OneWayShootingMoveScheme': "network, selector=None, ensembles=None, "
+                                "engine=None",
+    'DefaultScheme': "network, engine=None",
+    'LockedMoveScheme': "root_mover, network=None, root_accepted=None",
+    'RandomChoiceMover': "movers, weights=None",
+    'UniformSelector': "pad_start=1, pad_end=1",
+    'NoModification': "subset_mask=None",
+    'TwoWayShootingMover': "ensemble, selector, modifier, engine=None",
+    'Trajectory': "trajectory=None",
+    'Sample': "replica=None, trajectory=None, ensemble=None, bias=1.0, "
+              "parent=None, mover=None",
+    'SampleSet': "samples, movepath=None",
+    'PathSimulator': "storage",
+    'PathSampling': "storage, move_scheme=None, sample_set=None, "
+                    "initialize=True",
+    'CommittorSimulation': "storage, engine=None, states=None, "
+                           "randomizer=None, initial_snapshots=None, "
+                           "direction=None",
+    'SequentialEnsemble': "ensembles, min_overlap=0, max_overlap=0, "
+                          "greedy=False",
+    'AllOutXEnsemble': "volume, trusted=True",
+    'AllInXEnsemble': "volume, trusted=True",
+    'LengthEnsemble': "length",
+    'join_volumes': "volume_list, name=None",
+    'join_ensembles': "ensemble_list",
+}
+
+OPS_LAMMPS_API = {
+    'Engine': "inputs, options=None",
+    'LAMMPSComputeCV': "name, groupid_style_args, extract_style=0, "
+                       "extract_type=0, engine=None",
+}
+
+# engine options the GUI writes; both are positive integers
+ENGINE_OPTIONS = ['n_steps_per_frame', 'n_frames_max']
+
+
+class StandIn(object):
+    """Any object from the stand-in modules.
+
+    Every attribute, call, item, and operator gives another stand-in, so
+    code using the results of OPS calls runs without checks of its own.
+    """
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return StandIn()
+
+    def __call__(self, *args, **kwargs):
+        return StandIn()
+
+    def __getitem__(self, key):
+        return StandIn()
+
+    def __iter__(self):
+        return iter([])
+
+    def __len__(self):
+        return 0
+
+    def __bool__(self):
+        return True
+
+    def named(self, name):
+        return self
+
+    def __and__(self, other):
+        return StandIn()
+
+    __or__ = __sub__ = __xor__ = __rand__ = __ror__ = __and__
+
+    def __invert__(self):
+        return StandIn()
+
+
+def _signature(params, names=None):
+    """Signature from a parameter list, like ``"a, b=1, **kwargs"``.
+
+    Names in default values that aren't builtins are looked up in
+    ``names``, and are stand-ins otherwise.
+    """
+    class Names(dict):
+        def __missing__(self, key):
+            return StandIn()
+
+    lookup = Names(names or {})
+    return inspect.signature(eval("lambda " + params + ": None",
+                                  {'__builtins__': builtins}, lookup))
+
+
+def _ast_params(args):
+    """Parameter list of a function definition's ``ast.arguments``.
+
+    Defaults become the name ``_default``, a stand-in for
+    :func:`._signature`: only which arguments have defaults matters when
+    checking a call. (``ast.unparse`` would keep them, but needs Python
+    3.9.)
+    """
+    positional = getattr(args, 'posonlyargs', []) + args.args
+    n_required = len(positional) - len(args.defaults)
+    params = [arg.arg + ("=_default" if num >= n_required else "")
+              for num, arg in enumerate(positional)]
+    if getattr(args, 'posonlyargs', []):
+        params.insert(len(args.posonlyargs), "/")
+    if args.vararg is not None:
+        params.append("*" + args.vararg.arg)
+    elif args.kwonlyargs:
+        params.append("*")
+    params += [arg.arg + ("" if default is None else "=_default")
+               for arg, default in zip(args.kwonlyargs, args.kw_defaults)]
+    if args.kwarg is not None:
+        params.append("**" + args.kwarg.arg)
+    return ", ".join(params)
+
+
+def _script_line():
+    """Line of the checked script running now, or None"""
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename == SCRIPT_NAME:
+            return frame.lineno
+    return None
+
+
+class Preflight(object):
+    """State of one preflight check: problems, and files in memory.
+
+    Parameters
+    ----------
+    directory : str
+        directory the script will run in; relative file names are taken
+        from here
+    """
+    def __init__(self, directory="."):
+        self.directory = directory
+        self.problems = []
+        self.created = set()
+        self._read = {}  # contents of files read, to their names
+        self.lammps_script = None
+        self.lammps_groups = None
+
+    def problem(self, message, line=None):
+        if line is None:
+            line = _script_line()
+        if line is not None:
+            message = "line " + str(line) + ": " + message
+        if message not in self.problems:
+            self.problems.append(message)
+
+    def path(self, filename):
+        return os.path.normpath(os.path.join(self.directory, filename))
+
+    def exists(self, filename):
+        path = self.path(filename)
+        return path in self.created or os.path.exists(path)
+
+    def open(self, file, mode='r', *args, **kwargs):
+        """``open``, but writing only to memory"""
+        path = self.path(file)
+        new_file = io.BytesIO if 'b' in mode else io.StringIO
+        if any(flag in mode for flag in "wax+"):
+            self.created.add(path)
+            return new_file()
+        if path in self.created:
+            return new_file()
+        if not os.path.exists(path):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT),
+                                    file)
+        with io.open(path, mode, *args, **kwargs) as f:
+            content = f.read()
+        if isinstance(content, str):
+            self._read[content] = path
+        return new_file(content)
+
+    def file_with_content(self, content):
+        """Name of a file that was read with this content, or None"""
+        return self._read.get(content)
+
+    def checked(self, qualname, params, check=None, names=None):
+        """Stand-in function that checks its arguments.
+
+        The arguments must match ``params``; then ``check(self,
+        arguments)`` can look at their values.
+        """
+        signature = _signature(params, names)
+
+        def stand_in(*args, **kwargs):
+            try:
+                bound = signature.bind(*args, **kwargs)
+            except TypeError as err:
+                self.problem(qualname + ": " + str(err))
+                return StandIn()
+            bound.apply_defaults()
+            if check is not None:
+                check(self, bound.arguments)
+            return StandIn()
+
+        stand_in.__name__ = qualname.rsplit('.', 1)[-1]
+        return stand_in
+
+    def checked_class(self, qualname, params, check=None, names=None):
+        """Stand-in class whose constructor checks its arguments"""
+        check_init = self.checked(qualname, params, check, names)
+
+        def __init__(obj, *args, **kwargs):
+            check_init(*args, **kwargs)
+
+        return type(qualname.rsplit('.', 1)[-1], (StandIn,),
+                    {'__init__': __init__})
+
+    def _api_module(self, name, api, checks):
+        module = types.ModuleType(name)
+        for api_name, params in api.items():
+            qualname = name + "." + api_name
+            check = checks.get(api_name)
+            if "." in api_name:
+                class_name, method = api_name.split(".")
+                setattr(getattr(module, class_name), method,
+                        staticmethod(self.checked(qualname, params, check)))
+            elif api_name[0].isupper():
+                setattr(module, api_name,
+                        self.checked_class(qualname, params, check))
+            else:
+                setattr(module, api_name,
+                        self.checked(qualname, params, check))
+        return module
+
+    def ops_modules(self):
+        """Stand-ins for openpathsampling and its LAMMPS engine, by name"""
+        paths = self._api_module('openpathsampling', OPS_API, OPS_CHECKS)
+        ops_lammps = self._api_module('openpathsampling.engines.lammps',
+                                      OPS_LAMMPS_API, OPS_LAMMPS_CHECKS)
+        engines = types.ModuleType('openpathsampling.engines')
+        engines.lammps = ops_lammps
+        paths.engines = engines
+        return {module.__name__: module
+                for module in [paths, engines, ops_lammps]}
+
+    def helper_module(self, name):
+        """Stand-in for a ``gui_paths`` module, from its source.
+
+        Classes and functions check their arguments against the real
+        signatures; nothing from the real module is run.
+        """
+        filename = os.path.join(os.path.dirname(__file__),
+                                *name.split(".")[1:]) + ".py"
+        if not os.path.exists(filename):
+            raise ImportError("No module named " + repr(name))
+        with io.open(filename) as f:
+            tree = ast.parse(f.read(), filename)
+        module = types.ModuleType(name)
+        for node in tree.body:
+            qualname = name + "." + getattr(node, 'name', "")
+            if isinstance(node, ast.FunctionDef):
+                setattr(module, node.name,
+                        self.checked(qualname, _ast_params(node.args)))
+            elif isinstance(node, ast.ClassDef):
+                inits = [item for item in node.body
+                         if isinstance(item, ast.FunctionDef)
+                         and item.name == '__init__']
+                params = "*args, **kwargs"
+                if inits:
+                    # drop ``self``
+                    args = inits[0].args
+                    args.args = args.args[1:]
+                    params = _ast_params(args)
+                setattr(module, node.name,
+                        self.checked_class(qualname, params))
+            elif isinstance(node, ast.Assign):
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        setattr(module, target.id, StandIn())
+        return module
+
+    def importer(self):
+        """``__import__`` using the stand-ins"""
+        stand_ins = self.ops_modules()
+        stand_ins['os'] = _OSStandIn(self)
+        real_import = builtins.__import__
+
+        def stand_in_import(name, globals=None, locals=None, fromlist=(),
+                            level=0):
+            if name.startswith('gui_paths.') and name not in stand_ins:
+                stand_ins[name] = self.helper_module(name)
+            if name not in stand_ins:
+                return real_import(name, globals, locals, fromlist, level)
+            if fromlist:
+                return stand_ins[name]
+            return stand_ins[name.split(".")[0]]
+
+        return stand_in_import
+
+    def run(self, code):
+        """Run the setup part of a script; the namespace it leaves"""
+        stand_in_builtins = dict(vars(builtins))
+        stand_in_builtins['__import__'] = self.importer()
+        stand_in_builtins['open'] = self.open
+        namespace = {'__name__': "__preflight__",
+                     '__builtins__': stand_in_builtins}
+        try:
+            exec(compile(code, SCRIPT_NAME, 'exec'), namespace)
+        except Exception as err:
+            line = None
+            for frame in traceback.extract_tb(err.__traceback__):
+                if frame.filename == SCRIPT_NAME:
+                    line = frame.lineno
+            if isinstance(err, OSError) and err.filename is not None:
+                message = "file not found: " + str(err.filename)
+            else:
+                message = type(err).__name__ + ": " + str(err)
+            self.problem(message, line=line)
+        return namespace
+
+    def check_names(self, code, namespace):
+        """Report global names used anywhere, but defined nowhere"""
+        table = symtable.symtable(code, SCRIPT_NAME, 'exec')
+        defined = set(namespace) | set(vars(builtins))
+        defined.update(symbol.get_name() for symbol in table.get_symbols()
+                       if symbol.is_assigned() or symbol.is_imported())
+        used = []
+        tables = [table]
+        while tables:
+            scope = tables.pop()
+            tables.extend(scope.get_children())
+            is_top = scope is table
+            for symbol in scope.get_symbols():
+                if not symbol.is_referenced():
+                    continue
+                if is_top or symbol.is_global():
+                    used.append(symbol.get_name())
+        for name in sorted(set(used) - defined):
+            self.problem("name " + repr(name) + " is never defined")
+
+
+class _OSPathStandIn(object):
+    def __init__(self, preflight):
+        self._preflight = preflight
+
+    def __getattr__(self, name):
+        return getattr(os.path, name)
+
+    def exists(self, path):
+        return self._preflight.exists(path)
+
+
+class _OSStandIn(object):
+    """``os``, with files only created in memory"""
+    def __init__(self, preflight):
+        self._preflight = preflight
+        self.path = _OSPathStandIn(preflight)
+
+    def __getattr__(self, name):
+        return getattr(os, name)
+
+    def stat(self, path, *args, **kwargs):
+        return os.stat(self._preflight.path(path), *args, **kwargs)
+
+    def getpid(self):
+        return os.getpid()
+
+    def replace(self, src, dst):
+        if not self._preflight.exists(src):
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT),
+                                    src)
+        self._preflight.created.add(self._preflight.path(dst))
+
+    rename = replace
+
+    def remove(self, path):
+        self._preflight.created.discard(self._preflight.path(path))
+
+    unlink = remove
+
+    def makedirs(self, path, *args, **kwargs):
+        pass
+
+    mkdir = makedirs
+
+
+def _check_storage(preflight, args):
+    mode = args['mode']
+    if mode is None:
+        mode = 'a'  # as in OPS; the file must exist
+    if mode not in ['r', 'w', 'a']:
+        preflight.problem("Storage: invalid mode " + repr(mode))
+    elif mode == 'w':
+        preflight.created.add(preflight.path(args['filename']))
+    elif not preflight.exists(args['filename']):
+        preflight.problem("file not found: " + str(args['filename']))
+
+
+def _check_volume(preflight, args):
+    try:
+        is_empty = not args['lambda_min'] < args['lambda_max']
+    except TypeError:
+        return  # not numbers we know here
+    if is_empty:
+        preflight.problem("volume is empty: lambda_min ({}) is not less "
+                          "than lambda_max ({})".format(args['lambda_min'],
+                                                        args['lambda_max']))
+
+
+def _check_state_pairs(preflight, args):
+    if len(list(args['state_pairs'])) == 0:
+        preflight.problem("TPSNetwork: no transitions")
+
+
+def _check_interface_set(preflight, args):
+    lambdas = args['lambdas']
+    if lambdas is not None and len(lambdas) != len(args['volumes']):
+        preflight.problem("InterfaceSet: {} volumes but {} lambdas".format(
+            len(args['volumes']), len(lambdas)
+        ))
+
+
+def _check_committor(preflight, args):
+    if args['engine'] is None:
+        preflight.problem("CommittorSimulation: no engine to run the shots")
+
+
+def _check_engine(preflight, args):
+    inputs = args['inputs']
+    if not isinstance(inputs, str) or not inputs.strip():
+        preflight.problem("Engine: LAMMPS input script is empty")
+    else:
+        preflight.lammps_script = preflight.file_with_content(inputs)
+        if preflight.lammps_script is not None:
+            index = LAMMPSIndex.from_script(preflight.lammps_script)
+            preflight.lammps_groups = index.groups
+    for key, value in (args['options'] or {}).items():
+        if key not in ENGINE_OPTIONS:
+            preflight.problem("Engine: unknown option " + repr(key))
+        elif not (isinstance(value, int) and value > 0):
+            preflight.problem("Engine: " + key + " must be a positive "
+                              "integer, not " + repr(value))
+
+
+def _check_compute_cv(preflight, args):
+    words = str(args['groupid_style_args']).split()
+    name = "LAMMPSComputeCV " + repr(args['name'])
+    if len(words) < 2:
+        preflight.problem(name + ": groupid_style_args needs a group ID and "
+                          "a compute style, not "
+                          + repr(args['groupid_style_args']))
+    elif (preflight.lammps_groups is not None
+          and words[0] not in preflight.lammps_groups):
+        preflight.problem(name + ": group " + repr(words[0]) + " is not "
+                          "defined in " + preflight.lammps_script)
+    for key in ['extract_style', 'extract_type']:
+        if args[key] not in [0, 1, 2]:
+            preflight.problem(name + ": " + key + " must be 0, 1, or 2, "
+                              "not " + repr(args[key]))
+
+
+OPS_CHECKS = {
+    'Storage': _check_storage,
+    'CVDefinedVolume': _check_volume,
+    'PeriodicCVDefinedVolume': _check_volume,
+    'TPSNetwork.from_state_pairs': _check_state_pairs,
+    'InterfaceSet': _check_interface_set,
+    'CommittorSimulation': _check_committor,
+}
+
+OPS_LAMMPS_CHECKS = {
+    'Engine': _check_engine,
+    'LAMMPSComputeCV': _check_compute_cv,
+}
+
+
+def preflight(code, directory="."):
+    """Problems found by running the setup part of a generated script.
+
+    Parameters
+    ----------
+    code : str
+        the script, e.g., ``RunPyFile(...).code``
+    directory : str
+        directory the script will run in
+
+    Returns
+    -------
+    list of str
+        the problems found, each prefixed with its line in the script where
+        known; empty if none were found
+    """
+    check = Preflight(directory)
+    namespace = check.run(code)
+    check.check_names(code, namespace)
+    return check.problems
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check a generated script without running OPS"
+    )
+    parser.add_argument('script', nargs='?', default="run.py")
+    opts = parser.parse_args()
+    with open(opts.script) as f:
+        code = f.read()
+    directory = os.path.dirname(os.path.abspath(opts.script))
+    problems = preflight(code, directory)
+    for problem in problems:
+        print(problem)
+    if problems:
+        sys.exit(1)
+    print("No problems found")
+
+
+if __name__ == "__main__":
+    main()
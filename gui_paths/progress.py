@@ -0,0 +1,119 @@
+"""
+Lightweight progress channel between generated ``run.py`` files and the
+GUI run panel.
+
+The generated script attaches a :class:`.ProgressHook` to its simulation,
+which writes one short line per step (at most one per ``min_interval``
+seconds) to stdout::
+
+    #progress step=120 rate=0.53 length=245
+
+The run panel picks these lines out of the output with
+:func:`.parse_progress`; everything else goes to the log. Like the other
+modules used by generated scripts, this must not import anything from the
+GUI (or OPS, so that the GUI can parse progress without it).
+"""
+import sys
+import time
+
+PROGRESS_TAG = "#progress"
+
+
+def format_progress(step, rate, path_length):
+    """Progress line for a step; ``rate`` is in steps per second"""
+    return "{tag} step={step} rate={rate:.4g} length={length}".format(
+        tag=PROGRESS_TAG, step=step, rate=rate, length=path_length
+    )
+
+
+def parse_progress(line):
+    """Dict with step, rate and length from a progress line, or None"""
+    if not line.startswith(PROGRESS_TAG + " "):
+        return None
+    try:
+        fields = dict(field.split("=", 1) for field in line.split()[1:])
+        return {'step': int(fields['step']),
+                'rate': float(fields['rate']),
+                'length': int(fields['length'])}
+    except (KeyError, ValueError):
+        return None
+
+
+def _path_length(results):
+    """Length of the longest trial path of a step (or active path if none)"""
+    samples = list(getattr(results.change, 'trials', []))
+    if not samples:
+        samples = list(results.active)
+    if not samples:
+        return 0
+    return max(len(sample.trajectory) for sample in samples)
+
+
+class ProgressHook(object):
+    """OPS path simulator hook writing progress lines.
+
+    Parameters
+    ----------
+    stream : file-like or None
+        where to write; default is ``sys.stdout`` at the time of writing
+    min_interval : float
+        minimum number of seconds between progress lines; steps in between
+        are counted in the next line's rate
+    """
+    implemented_for = ['before_simulation', 'after_step']
+
+    def __init__(self, stream=None, min_interval=1.0):
+        self.stream = stream
+        self.min_interval = min_interval
+        self._start_time = None
+        self._n_steps = 0
+        self._last_write = None
+
+    def before_simulation(self, sim, **kwargs):
+        self._start_time = time.time()
+        self._n_steps = 0
+        self._last_write = None
+
+    def after_step(self, sim, step_number, step_info, state, results,
+                   hook_state):
+        self._n_steps += 1
+        now = time.time()
+        if (self._last_write is not None
+                and now - self._last_write < self.min_interval):
+            return
+        self._last_write = now
+        elapsed = now - self._start_time
+        rate = self._n_steps / elapsed if elapsed > 0 else 0.0
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write(format_progress(step_number, rate,
+                                     _path_length(results)) + "\n")
+        stream.flush()
+
+
+class ProgressHistory(object):
+    """Bounded history of progress values, for plotting.
+
+    When there are more than ``max_points`` points, every other point is
+    dropped, and from then on only every other new point is kept. This
+    keeps memory use and redraw time fixed over long runs.
+    """
+    def __init__(self, max_points=2000):
+        self.max_points = max_points
+        self.steps = []
+        self.values = []
+        self.stride = 1
+        self._n_seen = 0
+
+    def append(self, step, value):
+        self._n_seen += 1
+        if (self._n_seen - 1) % self.stride:
+            return
+        self.steps.append(step)
+        self.values.append(value)
+        if len(self.steps) > self.max_points:
+            self.steps = self.steps[::2]
+            self.values = self.values[::2]
+            self.stride *= 2
+
+    def __len__(self):
+        return len(self.steps)
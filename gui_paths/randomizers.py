@@ -0,0 +1,103 @@
+"""
+Velocity randomizers for LAMMPS engines, used by generated ``run.py`` files.
+
+:class:`.LAMMPSVelocityRandomizer` redraws velocities inside LAMMPS with the
+``velocity`` command, so no per-atom work is done in Python.
+:class:`.VectorizedVelocityRandomizer` is the Python-side fallback; it draws
+all velocities with a single NumPy call.
+
+This module must not import anything from the GUI; it is imported by the
+generated scripts.
+"""
+import numpy as np
+
+from openpathsampling.snapshot_modifier import SnapshotModifier
+
+
+class LAMMPSVelocityRandomizer(SnapshotModifier):
+    """Draw Maxwell-Boltzmann velocities with LAMMPS' ``velocity`` command.
+
+    The ``velocity`` command works on the state LAMMPS holds, and OPS needs
+    a snapshot back, so each shot still loads the snapshot into LAMMPS and
+    reads the result back out. Those are the engine's usual array copies,
+    the same ones it does at the start of every trajectory, so a shot costs
+    about as much as starting one more trajectory: O(N_atoms) memory
+    copies, but no per-atom Python code.
+
+    Parameters
+    ----------
+    engine :
+        the OPS LAMMPS engine
+    temperature : float
+        temperature, in the units of the LAMMPS script
+    seed : int or None
+        seed for the generator that picks each shot's LAMMPS seed; if None,
+        fresh entropy is used, so restarted and parallel runs never repeat
+        each other's shots
+    group : str
+        LAMMPS group whose velocities are redrawn
+    """
+    def __init__(self, engine, temperature, seed=None, group="all"):
+        super(LAMMPSVelocityRandomizer, self).__init__()
+        self.engine = engine
+        self.temperature = temperature
+        self.seed = seed
+        self.group = group
+        self._rng = np.random.default_rng(seed)
+
+    def __call__(self, snapshot):
+        self.engine.current_snapshot = snapshot
+        # LAMMPS seeds must be positive 32-bit integers
+        seed = int(self._rng.integers(1, 2**31 - 1))
+        self.engine.lammps.command(
+            "velocity {group} create {temp} {seed} dist gaussian "
+            "mom yes rot no".format(group=self.group, temp=self.temperature,
+                                    seed=seed)
+        )
+        return self.engine.current_snapshot
+
+
+class VectorizedVelocityRandomizer(SnapshotModifier):
+    """Draw Maxwell-Boltzmann velocities in Python, for all atoms at once.
+
+    Masses and unit constants are read from LAMMPS the first time the
+    randomizer is used; after that, each shot is a single NumPy draw.
+
+    Parameters
+    ----------
+    engine :
+        the OPS LAMMPS engine
+    temperature : float
+        temperature, in the units of the LAMMPS script
+    seed : int or None
+        seed for the NumPy random generator; if None, fresh entropy is used
+    """
+    def __init__(self, engine, temperature, seed=None):
+        super(VectorizedVelocityRandomizer, self).__init__()
+        self.engine = engine
+        self.temperature = temperature
+        self.seed = seed
+        self._rng = np.random.default_rng(seed)
+        self._masses = None
+        self._sigma = None
+
+    def _load_masses(self):
+        lmp = self.engine.lammps
+        kT = lmp.extract_global("boltz") * self.temperature
+        mvv2e = lmp.extract_global("mvv2e")
+        masses = lmp.numpy.extract_atom("rmass")
+        if masses is None:
+            types = lmp.numpy.extract_atom("type")
+            masses = lmp.numpy.extract_atom("mass")[types]
+        self._masses = np.array(masses, dtype=float)[:, np.newaxis]
+        self._sigma = np.sqrt(kT / (mvv2e * self._masses))
+
+    def __call__(self, snapshot):
+        if self._sigma is None:
+            self._load_masses()
+        shape = np.shape(snapshot.velocities)
+        velocities = self._rng.standard_normal(shape) * self._sigma
+        # remove center-of-mass motion
+        momentum = (self._masses * velocities).sum(axis=0)
+        velocities -= momentum / self._masses.sum()
+        return snapshot.copy_with_replacement(velocities=velocities)
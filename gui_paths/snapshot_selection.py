@@ -0,0 +1,181 @@
+"""
+Select transition-state snapshots from TPS output as committor initial
+conditions.
+
+The accepted paths in a TPS storage file are streamed in batches (caches
+are cleared between batches, so files larger than memory are fine). For
+each path, the CV is evaluated for all frames at once and frames inside a
+CV window are selected with a vectorized mask. Selected frames are thinned
+so that they are at least ``stride`` frames apart, since neighboring
+frames are strongly correlated. The selected snapshots are
+saved as they are found, in chunks of ``chunk_size`` snapshots. Usage::
+
+    python -m gui_paths.snapshot_selection tps.nc snapshots.nc \\
+        --cv dist --min 0.45 --max 0.55 --stride 20
+"""
+import argparse
+
+import numpy as np
+
+from .storage_tools import clear_caches, open_storage
+
+
+def window_mask(values, lambda_min, lambda_max):
+    """Mask of the frames with CV values in ``[lambda_min, lambda_max]``"""
+    values = np.asarray(values)
+    return (values >= lambda_min) & (values <= lambda_max)
+
+
+def thin_indices(mask, stride):
+    """Indices of the selected frames, at least ``stride`` frames apart.
+
+    Frames are taken from the start of the path: after each one, the next
+    is the first selected frame at least ``stride`` frames later.
+    """
+    indices = np.flatnonzero(mask)
+    thinned = []
+    pos = 0
+    while pos < len(indices):
+        thinned.append(indices[pos])
+        pos = np.searchsorted(indices, indices[pos] + stride)
+    return np.array(thinned, dtype=indices.dtype)
+
+
+def accepted_trajectories(storage, batch_size=100):
+    """Iterate over the accepted trajectories in a TPS storage file.
+
+    The initial trajectories are included, and each trajectory appears once
+    per step in which it was accepted.
+    """
+    n_steps = len(storage.steps)
+    for start in range(0, n_steps, batch_size):
+        for idx in range(start, min(start + batch_size, n_steps)):
+            step = storage.steps[idx]
+            if idx == 0:
+                samples = list(step.active)
+            elif step.change.accepted:
+                samples = step.change.trials
+            else:
+                samples = []
+            for sample in samples:
+                yield sample.trajectory
+        clear_caches(storage)
+
+
+def select_snapshots(trajectories, cv, lambda_min, lambda_max, stride=10,
+                     max_per_path=None, max_snapshots=None):
+    """Yield the snapshots with ``cv`` in the window, thinned within each
+    path.
+
+    Parameters
+    ----------
+    trajectories : iterable of :class:`openpathsampling.Trajectory`
+        the paths to select from
+    cv : :class:`openpathsampling.CollectiveVariable`
+        the CV defining the window
+    lambda_min, lambda_max : float
+        bounds of the window
+    stride : int
+        minimum number of frames between snapshots selected from a path
+    max_per_path : int or None
+        maximum number of snapshots from a single path
+    max_snapshots : int or None
+        stop after this many snapshots
+
+    Yields
+    ------
+    :class:`openpathsampling.engines.BaseSnapshot`
+    """
+    n_selected = 0
+    for traj in trajectories:
+        values = np.asarray(cv(traj))
+        indices = thin_indices(window_mask(values, lambda_min, lambda_max),
+                               stride)
+        if max_per_path is not None:
+            indices = indices[:max_per_path]
+        for idx in indices:
+            if max_snapshots is not None and n_selected >= max_snapshots:
+                return
+            n_selected += 1
+            yield traj[int(idx)]
+
+
+def _save_chunk(storage, snapshots):
+    import openpathsampling as paths
+    storage.save(paths.Trajectory(snapshots))
+    storage.sync_all()
+    clear_caches(storage)
+
+
+def write_snapshot_set(tps_file, output, cv_name, lambda_min, lambda_max,
+                       stride=10, max_per_path=None, max_snapshots=None,
+                       batch_size=100, chunk_size=1000):
+    """Select snapshots from ``tps_file`` and save them to ``output``.
+
+    The snapshots are saved as they are selected, as trajectories of
+    ``chunk_size`` snapshots, so only one chunk is ever held in memory.
+    :class:`code_writers.InitialSnapshotsWriter` loads all of them.
+    Returns the number of snapshots saved.
+    """
+    n_snapshots = 0
+    tps_storage = open_storage(tps_file, mode='r')
+    try:
+        out_storage = open_storage(output, mode='w')
+        try:
+            snapshots = select_snapshots(
+                trajectories=accepted_trajectories(tps_storage, batch_size),
+                cv=tps_storage.cvs[cv_name],
+                lambda_min=lambda_min,
+                lambda_max=lambda_max,
+                stride=stride,
+                max_per_path=max_per_path,
+                max_snapshots=max_snapshots
+            )
+            chunk = []
+            for snapshot in snapshots:
+                chunk.append(snapshot)
+                if len(chunk) == chunk_size:
+                    _save_chunk(out_storage, chunk)
+                    n_snapshots += len(chunk)
+                    chunk = []
+            if chunk:
+                _save_chunk(out_storage, chunk)
+                n_snapshots += len(chunk)
+        finally:
+            out_storage.close()
+    finally:
+        tps_storage.close()
+    return n_snapshots
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Select committor initial snapshots from TPS paths"
+    )
+    parser.add_argument('tps_file')
+    parser.add_argument('output')
+    parser.add_argument('--cv', required=True, help="name of the CV")
+    parser.add_argument('--min', type=float, required=True)
+    parser.add_argument('--max', type=float, required=True)
+    parser.add_argument('--stride', type=int, default=10)
+    parser.add_argument('--max-per-path', type=int, default=None)
+    parser.add_argument('--max-snapshots', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--chunk-size', type=int, default=1000,
+                        help="snapshots saved at a time")
+    opts = parser.parse_args()
+    n_snapshots = write_snapshot_set(tps_file=opts.tps_file,
+                                     output=opts.output,
+                                     cv_name=opts.cv,
+                                     lambda_min=opts.min,
+                                     lambda_max=opts.max,
+                                     stride=opts.stride,
+                                     max_per_path=opts.max_per_path,
+                                     max_snapshots=opts.max_snapshots,
+                                     batch_size=opts.batch_size,
+                                     chunk_size=opts.chunk_size)
+    print("Saved " + str(n_snapshots) + " snapshots to " + opts.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,127 @@
+SETUP_CACHE = """
+import json
+import hashlib
+
+
+# Finding the initial conditions checks the trajectory against every
+# ensemble, which is slow for many states. Which frames of the trajectory
+# make up each initial sample is cached in a file keyed by the setup code
+# and the input files. Only frame numbers are cached: the network, scheme,
+# and samples are always built from this script's engine and CVs. Samples
+# made by running the engine (for the minus ensembles of TIS) aren't frames
+# of the trajectory, so they are made again each time.
+def setup_cache_file(prefix, setup_hash, inputs):
+    \"\"\"Cache file for this setup and the current input files\"\"\"
+    sha = hashlib.sha1(setup_hash.encode('utf-8'))
+    for filename in inputs:
+        stat = os.stat(filename)
+        sha.update("{} {} {}\\n".format(filename, stat.st_size,
+                                       stat.st_mtime_ns).encode('utf-8'))
+    return prefix + "_" + sha.hexdigest()[:16] + ".json"
+
+
+def save_initial_conditions(cache_file, initial_conditions, ensembles,
+                            trajectory):
+    \"\"\"Save samples as frame numbers; samples that aren't made of frames
+    of the trajectory (e.g., if they were extended) are left out\"\"\"
+    frames = {snapshot: idx for idx, snapshot in enumerate(trajectory)}
+    ensemble_idx = {id(ensemble): idx
+                    for idx, ensemble in enumerate(ensembles)}
+    samples = []
+    for sample in initial_conditions:
+        if id(sample.ensemble) not in ensemble_idx:
+            continue
+        for is_reversed in [False, True]:
+            traj = sample.trajectory
+            if is_reversed:
+                traj = traj.reversed
+            sample_frames = [frames.get(snapshot) for snapshot in traj]
+            if None not in sample_frames:
+                break
+        else:
+            continue
+        samples.append({'ensemble': ensemble_idx[id(sample.ensemble)],
+                        'replica': sample.replica,
+                        'frames': sample_frames,
+                        'reversed': is_reversed})
+    # other jobs may be reading the cache, so it must never be partial
+    tmp_file = cache_file + "." + str(os.getpid()) + ".tmp"
+    with open(tmp_file, mode='w') as f:
+        json.dump(samples, f)
+    os.replace(tmp_file, cache_file)
+
+
+def load_initial_conditions(cache_file, ensembles, trajectory):
+    \"\"\"Samples from the cache, or None if any isn't in its ensemble\"\"\"
+    with open(cache_file, mode='r') as f:
+        cached = json.load(f)
+    samples = []
+    for sample in cached:
+        traj = paths.Trajectory([trajectory[idx]
+                                 for idx in sample['frames']])
+        if sample['reversed']:
+            traj = traj.reversed
+        ensemble = ensembles[sample['ensemble']]
+        if not ensemble(traj):
+            return None
+        samples.append(paths.Sample(replica=sample['replica'],
+                                    trajectory=traj, ensemble=ensemble))
+    return paths.SampleSet(samples)
+
+
+def cached_initial_conditions(prefix, setup_hash, inputs, network, scheme,
+                              trajectory, engine):
+    cache_file = setup_cache_file(prefix, setup_hash, inputs)
+    ensembles = network.all_ensembles
+    cached = None
+    if os.path.exists(cache_file):
+        try:
+            cached = load_initial_conditions(cache_file, ensembles,
+                                             trajectory)
+        except (ValueError, KeyError, IndexError, TypeError):
+            cached = None  # corrupt cache; rebuild it
+    if cached is not None and not scheme.check_initial_conditions(cached)[0]:
+        return cached
+    # the extend strategies use the engine to make samples for ensembles no
+    # part of the trajectory is in, such as the minus ensembles
+    initial_conditions = scheme.initial_conditions_from_trajectories(
+        trajectory, sample_set=cached,
+        strategies=['get', 'split', 'extend-complex', 'extend-minimal'],
+        engine=engine
+    )
+    # stop here, with OPS' report of what is missing, and cache nothing
+    scheme.assert_initial_conditions(initial_conditions)
+    if cached is None:
+        save_initial_conditions(cache_file, initial_conditions, ensembles,
+                                trajectory)
+    return initial_conditions
+"""
+
+
 TPS_SETUP = """
-if len(states) > 2:
-    initial_states = states
-    final_states = states
-else:
-    initial_states, final_states = states
+# only the selected transitions get ensembles
+network = paths.TPSNetwork.from_state_pairs(transitions)
+scheme = paths.OneWayShootingMoveScheme(network, engine=engine)
+initial_conditions = cached_initial_conditions(
+    "tps_setup", "{setup_hash}", {setup_inputs},
+    network, scheme, trajectory, engine
+)
+
+{shooting}sim = paths.PathSampling(
+    storage=storage,
+    move_scheme=scheme,
+    sample_set=initial_conditions
+)
+"""[1:-1]
 
-network = paths.TPSNetwork(initial_states, final_states)
-scheme = paths.OneWayShootingMoveScheme(network, engine)
 
-initial_conditions = scheme.initial_conditions_from_trajectories(trajectory)
+TIS_SETUP = """
+network = paths.MSTISNetwork(tis_transitions)
+scheme = paths.DefaultScheme(network, engine)
+initial_conditions = cached_initial_conditions(
+    "tis_setup", "{setup_hash}", {setup_inputs},
+    network, scheme, trajectory, engine
+)
 
 sim = paths.PathSampling(
     storage=storage,
@@ -21,6 +134,7 @@ sim = paths.PathSampling(
 COMMITTOR_SETUP = """
 sim = paths.CommittorSimulation(
     storage=storage,
+    engine=engine,
     states=states,
     randomizer=randomizer,
     initial_snapshots=initial_conditions)
@@ -56,12 +170,123 @@ class TrajectorySimulation(paths.PathSimulator):
 sim = TrajectorySimulation(storage, states, engine)
 """
 
+CONCURRENT_HALVES = """
+# two-way shooting, with the halves run at the same time on two engines
+from gui_paths.half_shots import ConcurrentTwoWayShootingMover
+backward_engine = ops_lammps.Engine(
+    inputs=data, options={options}
+).named('backward_engine')
+scheme = paths.LockedMoveScheme(
+    paths.RandomChoiceMover([
+        ConcurrentTwoWayShootingMover(
+            ensemble=ensemble,
+            selector=paths.UniformSelector(),
+            modifier=paths.NoModification(),
+            engine=engine,
+            backward_engine=backward_engine
+        )
+        for ensemble in network.sampling_ensembles
+    ]),
+    network
+)
+
+"""[1:]
+
+PROGRESS_HOOK = """
+# progress lines for the GUI run panel; not needed where gui_paths isn't
+# installed, such as on compute nodes
+try:
+    from gui_paths.progress import ProgressHook
+except ImportError:
+    pass
+else:
+    sim.attach_hook(ProgressHook())
+"""
+
 MAIN_RUN = """
 if __name__ == "__main__":
     sim.run({n_sim_steps})
 """
 
+RESUME_SETUP = """
+if len(storage.steps) > 0:
+    # continue the run saved in the storage, with its own move scheme (a
+    # new simulation would save a second one); the engine names are
+    # rebound to the engines that scheme runs
+    last_step = storage.steps[-1]
+    sim = last_step.simulation
+    sim.restart_at_step(last_step, storage=storage)
+{engines}else:
+{setup}"""[1:]
+
+RESUME_RUN = """
+if __name__ == "__main__":
+    # the storage is synced every {checkpoint_frequency} MC steps; if this
+    # run is killed, running it again continues from the last sync
+    sim.save_frequency = {checkpoint_frequency}
+    sim.run_until({n_sim_steps})
+"""
+
+WALKERS_RUN = """
+def run_walker(walker):
+    \"\"\"One TPS chain, with its own seed, storage, and log\"\"\"
+    import random
+    import numpy as np
+    try:
+        from gui_paths.progress import ProgressHook
+    except ImportError:
+        ProgressHook = None
+    seed = {seed} + walker
+    random.seed(seed)
+    np.random.seed(seed)
+    # OPS movers and selectors share one generator, made with the scheme
+    # before this runs, so it is reseeded in place
+    paths.default_rng().bit_generator.state = (
+        np.random.default_rng(seed).bit_generator.state
+    )
+    resume = {resume}
+    mode = 'a' if resume else 'w'
+    with open("{log_pattern}".format(walker), mode=mode) as log:
+        walker_storage = paths.Storage("{storage_pattern}".format(walker),
+                                       mode=mode)
+        if resume and len(walker_storage.steps) > 0:
+            # continue with the walker's own saved move scheme
+            last_step = walker_storage.steps[-1]
+            walker_sim = last_step.simulation
+            walker_sim.restart_at_step(last_step, storage=walker_storage)
+{walker_engines}        else:
+            walker_sim = paths.PathSampling(
+                storage=walker_storage,
+                move_scheme=scheme,
+                sample_set=initial_conditions
+            )
+        walker_sim.output_stream = log
+        if ProgressHook is not None:
+            walker_sim.attach_hook(ProgressHook(stream=log))
+{walker_hooks}        walker_sim.save_frequency = {checkpoint_frequency}
+        walker_sim.run_until({n_sim_steps})
+        walker_storage.close()
+    return walker
+
+if __name__ == "__main__":
+    import multiprocessing
+    # with spawn, each walker runs the setup above (with the initial
+    # conditions from the setup cache), so each has its own engine
+    context = multiprocessing.get_context("spawn")
+    pool = context.Pool({n_walkers})
+    for walker in pool.imap_unordered(run_walker, range({n_walkers})):
+        print("Walker " + str(walker) + " finished")
+    pool.close()
+    pool.join()
+"""
+
 OPS_LOAD_TRAJ = """
 inp_traj_file = paths.Storage("{traj_file}", mode='r')
 trajectory = inp_traj_file.trajectories[{traj_num}]
 """[1:-1]
+
+OPS_LOAD_SNAPSHOTS = """
+inp_snapshot_file = paths.Storage("{snapshot_file}", mode='r')
+initial_conditions = [snapshot for traj in {trajectories}
+                      for snapshot in traj]
+"""[1:-1]
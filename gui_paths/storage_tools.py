@@ -0,0 +1,185 @@
+"""
+Tools for working with OPS storage files produced by generated scripts.
+
+These are meant to be usable without the GUI, e.g.::
+
+    python -m gui_paths.storage_tools merged.nc run_*.nc --repack
+"""
+import os
+import shutil
+import subprocess
+import argparse
+
+# Stores for the "simulation objects": small, and copied in full. Order
+# matters a little, since saving later stores would save the earlier ones
+# implicitly anyway (but without us counting them).
+SIMULATION_STORES = ['engines', 'cvs', 'volumes', 'ensembles', 'pathmovers',
+                     'networks', 'schemes']
+
+# Stores that can be large; these are streamed in batches. Saving a step
+# saves its sample set and trajectories; trajectories saved by themselves
+# (e.g., from ``TrajectorySimulation.run``) are caught by the second entry.
+BULK_STORES = ['steps', 'trajectories']
+
+
+class MergeReport(object):
+    """Counts of objects copied and skipped by :func:`merge_storages`"""
+    def __init__(self):
+        self.copied = {}
+        self.skipped = {}
+
+    def add(self, store_name, copied):
+        counter = self.copied if copied else self.skipped
+        counter[store_name] = counter.get(store_name, 0) + 1
+
+    def __str__(self):
+        names = sorted(set(self.copied) | set(self.skipped))
+        lines = ["{name}: {copied} copied, {skipped} already present".format(
+            name=name,
+            copied=self.copied.get(name, 0),
+            skipped=self.skipped.get(name, 0)
+        ) for name in names]
+        return "\n".join(lines)
+
+
+def trust_gui_paths():
+    """Let OPS save and load CVs that use functions from ``gui_paths``.
+
+    OPS saves a function by module and name only if the module is in
+    ``ObjectJSON.safe_modules``; otherwise it refuses to save it, and
+    loads it as None.
+    """
+    import openpathsampling as paths
+    safe_modules = paths.netcdfplus.ObjectJSON.safe_modules
+    if 'gui_paths' not in safe_modules:
+        safe_modules.append('gui_paths')
+
+
+def open_storage(filename, mode='r'):
+    """Open an OPS storage file; see :func:`.trust_gui_paths`"""
+    import openpathsampling as paths
+    trust_gui_paths()
+    return paths.Storage(filename, mode=mode)
+
+
+def _get_store(storage, store_name):
+    return getattr(storage, store_name, None)
+
+
+def clear_caches(storage):
+    """Drop objects loaded so far, so memory use is bounded by batch size"""
+    for store in storage.objects.values():
+        cache = getattr(store, 'cache', None)
+        if cache is not None and hasattr(cache, 'clear'):
+            cache.clear()
+
+
+def _copy_store(source, target, store_name, batch_size, report):
+    in_store = _get_store(source, store_name)
+    out_store = _get_store(target, store_name)
+    if in_store is None or out_store is None:
+        return
+
+    n_objects = len(in_store)
+    for start in range(0, n_objects, batch_size):
+        stop = min(start + batch_size, n_objects)
+        for idx in range(start, stop):
+            obj = in_store[idx]
+            # OPS storage identifies objects by UUID; objects shared
+            # between shards are only written once
+            is_new = obj not in out_store
+            if is_new:
+                target.save(obj)
+            report.add(store_name, is_new)
+        target.sync_all()
+        # saved objects stay in the output's caches too
+        clear_caches(source)
+        clear_caches(target)
+
+
+def repack(filename, deflate_level=4):
+    """Rewrite a netCDF file with compression, in place.
+
+    Requires the ``nccopy`` utility from the netCDF distribution.
+    """
+    nccopy = shutil.which('nccopy')
+    if nccopy is None:
+        raise RuntimeError("Repacking requires nccopy, which was not found")
+    tmp_file = filename + ".repack"
+    subprocess.check_call([nccopy, '-d', str(deflate_level), '-s',
+                           filename, tmp_file])
+    os.replace(tmp_file, filename)
+
+
+def merge_storages(output, inputs, batch_size=100, compact=False,
+                   deflate_level=4):
+    """Merge several OPS storage files into a single file.
+
+    Objects are streamed from each input in batches of ``batch_size``, with
+    the storage synced and all caches cleared after each batch, so memory
+    use does not grow with the size of the inputs. Objects already present
+    in the output (by UUID) are not written again.
+
+    Parameters
+    ----------
+    output : str
+        filename for the merged storage; must not exist yet
+    inputs : list of str
+        filenames of the storage files to merge
+    batch_size : int
+        number of objects to copy between syncs
+    compact : bool
+        whether to repack the output with compression after merging
+    deflate_level : int
+        compression level used when ``compact`` is True
+
+    Returns
+    -------
+    :class:`.MergeReport`
+        numbers of objects copied and skipped for each store
+    """
+    if os.path.exists(output):
+        raise RuntimeError("Output file " + output + " already exists")
+
+    report = MergeReport()
+    target = open_storage(output, mode='w')
+    try:
+        for filename in inputs:
+            source = open_storage(filename, mode='r')
+            try:
+                for store_name in SIMULATION_STORES + BULK_STORES:
+                    _copy_store(source, target, store_name, batch_size,
+                                report)
+            finally:
+                source.close()
+    finally:
+        target.close()
+
+    if compact:
+        repack(output, deflate_level)
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Merge OPS storage files into a single file"
+    )
+    parser.add_argument('output', help="name of the merged file")
+    parser.add_argument('inputs', nargs='+', help="files to merge")
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help="objects copied between syncs")
+    parser.add_argument('--repack', action='store_true',
+                        help="compress the merged file (requires nccopy)")
+    parser.add_argument('--deflate-level', type=int, default=4)
+    opts = parser.parse_args()
+    report = merge_storages(output=opts.output,
+                            inputs=opts.inputs,
+                            batch_size=opts.batch_size,
+                            compact=opts.repack,
+                            deflate_level=opts.deflate_level)
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
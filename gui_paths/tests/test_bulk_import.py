@@ -0,0 +1,138 @@
+import os
+import json
+import shutil
+import tempfile
+
+import pytest
+
+from ..code_writers import CVCodeWriter, VolumeCodeWriter
+from ..bulk_import import *
+
+CSV_TABLE = """kind,name,groupid_style_args,extract_style,cv,lambda_min,lambda_max,period_min,period_max
+cv,dist,all com,0,,,,,
+state,A,,,dist,-inf,0.5,,
+state,B,,,dist,1.5,inf,,
+state,C,,,dist,0.0,1.0,-3.14,3.14
+"""
+
+
+class TestBulkImport(object):
+    def setup(self):
+        CVCodeWriter.creation_counter = 0
+        VolumeCodeWriter.creation_counter = 0
+        self.tmpdir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, name, contents):
+        filename = os.path.join(self.tmpdir, name)
+        with open(filename, 'w') as f:
+            f.write(contents)
+        return filename
+
+    def test_csv(self):
+        new_cvs, new_states = import_file(self._write('t.csv', CSV_TABLE))
+        assert [name for name, _ in new_cvs] == ['dist']
+        assert [name for name, _ in new_states] == ['A', 'B', 'C']
+        cv = new_cvs[0][1]
+        assert cv.kwargs['groupid_style_args'] == "all com"
+        assert cv.kwargs['extract_type'] == 0
+        state_a, state_c = new_states[0][1], new_states[2][1]
+        assert state_a.class_name == "CVDefinedVolume"
+        assert state_a.kwargs['collectivevariable'] == "cv_1"
+        assert str(state_a.kwargs['lambda_min']) == "float('-inf')"
+        assert state_c.class_name == "PeriodicCVDefinedVolume"
+        assert state_c.kwargs['period_max'] == 3.14
+
+    def test_json_sections(self):
+        data = {'cvs': [{'name': 'x', 'groupid_style_args': 'all com'}],
+                'states': [{'name': 'A', 'cv': 'x',
+                            'lambda_min': 0, 'lambda_max': 1}]}
+        filename = self._write('t.json', json.dumps(data))
+        new_cvs, new_states = import_file(filename)
+        assert len(new_cvs) == len(new_states) == 1
+
+    def test_existing_cvs(self):
+        existing = CVCodeWriter(name='x', class_name='LAMMPSComputeCV')
+        records = [{'kind': 'state', 'name': 'A', 'cv': 'x',
+                    'lambda_min': 0, 'lambda_max': 1}]
+        new_cvs, new_states = build_writers(records, cvs={'x': existing})
+        assert new_cvs == []
+        assert new_states[0][1].kwargs['collectivevariable'] == "cv_1"
+
+    def test_errors_reported_together(self):
+        records = [{'kind': 'cv', 'name': 'x'},
+                   {'kind': 'cv', 'name': 'x', 'groupid_style_args': 'a'},
+                   {'kind': 'state', 'name': 'A', 'cv': 'y',
+                    'lambda_min': 1, 'lambda_max': 0},
+                   {'kind': 'volume', 'name': 'B'}]
+        with pytest.raises(ValueError) as excinfo:
+            build_writers(records)
+        message = str(excinfo.value)
+        assert "missing groupid_style_args" in message
+        assert "duplicate cv name" in message
+        assert "unknown CV 'y'" in message
+        assert "minimum must be less than maximum" in message
+        assert "kind must be" in message
+        # nothing was created
+        assert CVCodeWriter.creation_counter == 0
+
+    def test_fields_checked(self):
+        records = [{'kind': 'cv', 'name': 'x', 'groupid_style_args': 'a',
+                    'extract_style': 3, 'units': 'nm'},
+                   {'kind': 'cv', 'name': 'y', 'groupid_style_args': 'a',
+                    'class_name': 'os.system'},
+                   {'kind': 'state', 'name': 'A', 'cv': 'x', 'color': 1,
+                    'lambda_min': 0, 'lambda_max': 1},
+                   "not a record"]
+        with pytest.raises(ValueError) as excinfo:
+            build_writers(records)
+        message = str(excinfo.value)
+        assert "Record 1 (x): unknown field(s) units" in message
+        assert "Record 1 (x): extract_style must be 0, 1, or 2" in message
+        assert "Record 2 (y): unknown class_name 'os.system'" in message
+        assert "Record 3 (A): unknown field(s) color" in message
+        assert "Record 4: not a mapping" in message
+
+    def test_empty_and_malformed(self):
+        assert load_records(self._write('t.json', 'null')) == []
+        with pytest.raises(ValueError):
+            load_records(self._write('t.json', '"cvs"'))
+
+    @pytest.mark.parametrize('name, contents', [
+        ('t.json', '{"cvs": [1'),
+        ('t.json', '{"cvs": 1}'),
+        ('t.yml', 'cvs: [1'),
+        ('t.csv', 'kind,name\n"cv,x\n'),
+    ])
+    def test_parse_errors(self, name, contents):
+        if name.endswith('.yml'):
+            pytest.importorskip("yaml")
+        with pytest.raises(ValueError):
+            load_records(self._write(name, contents))
+
+    def test_wrong_types(self):
+        filename = self._write('t.json', json.dumps({
+            'cvs': [1, {'name': ['x'], 'groupid_style_args': 'all com'},
+                    {'name': 'y', 'groupid_style_args': 2,
+                     'class_name': ['LAMMPSComputeCV']}],
+            'states': [{'name': 'A', 'cv': ['y'],
+                        'lambda_min': 0, 'lambda_max': 1}]
+        }))
+        with pytest.raises(ValueError) as excinfo:
+            import_file(filename)
+        message = str(excinfo.value)
+        assert "Record 1: not a mapping" in message
+        assert "Record 2 (['x']): name must be a string" in message
+        assert "Record 3 (y): groupid_style_args must be a string" in message
+        assert "Record 3 (y): unknown class_name" in message
+        assert "Record 4 (A): unknown CV ['y']" in message
+
+    def test_empty_yaml(self):
+        pytest.importorskip("yaml")
+        assert import_file(self._write('t.yml', '')) == ([], [])
+
+    def test_unknown_extension(self):
+        with pytest.raises(ValueError):
+            load_records(self._write('t.txt', ''))
@@ -42,6 +42,24 @@ class TestCVCodeWriter(AbstractCodeWriterTester):
         self.expected_code = ('cv_1 = paths.SomeClassOfCV(' + kwarg_part
                               + ')' + "\n" + diskcache_1)
 
+def test_cv_code_writer_value_store():
+    CVCodeWriter.creation_counter = 0
+    writer = CVCodeWriter(name="dist", class_name="LAMMPSComputeCV",
+                          groupid_style_args="all com", engine="engine",
+                          value_store="cv_values.db")
+    definition = 'LAMMPSComputeCV(engine=engine, groupid_style_args="all com")'
+    assert writer.definition == definition
+    lines = writer.code.split("\n")
+    assert lines[0] == ('cv_1 = ops_lammps.LAMMPSComputeCV('
+                        'groupid_style_args="all com", engine=engine, '
+                        'name="dist (computed)")')
+    assert lines[1].startswith("cv_1 = paths.FunctionCV('dist', "
+                               "stored_cv_value, cv=cv_1, "
+                               "store_file='cv_values.db',")
+    assert lines[2] == ("    cv_key=cv_store_key(" + repr(definition)
+                        + ", data))")
+    assert "enable_diskcache" not in writer.code
+
 class TestVolumeCodeWriter(AbstractCodeWriterTester):
     def setup(self):
         VolumeCodeWriter.creation_counter = 0  # reset before each test
@@ -84,3 +102,200 @@ class TestVolumeCodeWriter(AbstractCodeWriterTester):
         expected = ("volume_2 = paths.PeriodicCVDefinedVolume("
                     + kwarg_part + ")")
         assert self.second.code == expected
+
+class TestTransitionsWriter(object):
+    def setup(self):
+        VolumeCodeWriter.creation_counter = 0
+        self.states = [VolumeCodeWriter(class_name="CVDefinedVolume",
+                                        is_state=True, name=name)
+                       for name in ["A", "B", "C"]]
+
+    def test_selected_pairs(self):
+        writer = TransitionsWriter([(self.states[0], self.states[2]),
+                                    (self.states[2], self.states[1])])
+        expected = "transitions = [(volume_1, volume_3), (volume_3, volume_2)]"
+        assert writer.code == expected
+
+    @pytest.mark.parametrize('n_states, expected', [
+        (2, [("A", "B")]),
+        (3, [("A", "B"), ("A", "C"), ("B", "A"), ("B", "C"), ("C", "A"),
+             ("C", "B")])
+    ])
+    def test_default(self, n_states, expected):
+        namespace = {'states': ["A", "B", "C"][:n_states]}
+        exec(TransitionsWriter().code, namespace)
+        assert namespace['transitions'] == expected
+
+class TestInterfaceSetWriter(object):
+    def setup(self):
+        VolumeCodeWriter.creation_counter = 0
+        InterfaceSetWriter.creation_counter = 0
+        self.state = VolumeCodeWriter(class_name="CVDefinedVolume",
+                                      is_state=True, name="A")
+
+    def test_code(self):
+        writer = InterfaceSetWriter(self.state, "cv_1", [0.2, 0.35])
+        expected = "\n".join([
+            "volume_2 = paths.CVDefinedVolume(collectivevariable=cv_1, "
+            "lambda_min=float('-inf'), lambda_max=float('0.2'))"
+            ".named('A interface 0')",
+            "volume_3 = paths.CVDefinedVolume(collectivevariable=cv_1, "
+            "lambda_min=float('-inf'), lambda_max=float('0.35'))"
+            ".named('A interface 1')",
+            "interfaces_1 = paths.InterfaceSet([volume_2, volume_3], "
+            "cv=cv_1, lambdas=[0.2, 0.35])"
+        ])
+        assert writer.code == expected
+
+    def test_decreasing(self):
+        writer = InterfaceSetWriter(self.state, "cv_1", [0.8],
+                                    increasing=False)
+        volume = writer.volumes[0]
+        assert str(volume.kwargs['lambda_min']) == "float('0.8')"
+        assert str(volume.kwargs['lambda_max']) == "float('inf')"
+        assert not volume.is_state
+
+def test_storage_writer_none():
+    assert StorageWriter(None, mode='w').code == "storage = None"
+
+def test_storage_writer_append():
+    code = StorageWriter("tps.nc", mode='a').code
+    compile(code, "run.py", 'exec')
+    assert code == ("if os.path.exists('tps.nc'):\n"
+                    "    storage = paths.Storage('tps.nc', mode='a')\n"
+                    "else:\n"
+                    "    storage = paths.Storage('tps.nc', mode='w')")
+
+def test_checkpoint_writer():
+    code = CheckpointWriter(n_sim_steps=100, checkpoint_frequency=5).code
+    compile(code, "run.py", 'exec')
+    assert "sim.save_frequency = 5" in code
+    assert "sim.run_until(100)" in code
+
+def test_checkpoint_writer_setup():
+    writer = CheckpointWriter(n_sim_steps=100)
+    code = writer.setup_code("scheme = 1\n\nsim = 2",
+                             ["engine", "backward_engine"])
+    compile(code, "run.py", 'exec')
+    assert "sim.restart_at_step(last_step, storage=storage)" in code
+    assert "    engine = storage.engines['engine']\n" in code
+    assert ("    backward_engine = storage.engines['backward_engine']\n"
+            "else:\n    scheme = 1\n\n    sim = 2") in code
+
+def test_walkers_writer():
+    writer = WalkersWriter(n_walkers=4, output_file="tps.nc", n_sim_steps=10,
+                           seed=7)
+    code = writer.code
+    compile(code, "run.py", 'exec')
+    assert 'paths.Storage("tps_walker_{}.nc".format(walker)' in code
+    assert 'open("tps_walker_{}.log".format(walker)' in code
+    assert "seed = 7 + walker" in code
+    assert "walker_sim.run_until(10)" in code
+    assert "context.Pool(4)" in code
+    assert "resume = False" in code
+
+
+def test_walkers_writer_resume():
+    writer = WalkersWriter(n_walkers=4, output_file="tps.nc", n_sim_steps=10,
+                           resume=True, checkpoint_frequency=5)
+    code = writer.code
+    compile(code, "run.py", 'exec')
+    assert 'resume = os.path.exists("tps_walker_{}.nc".format(walker))' in code
+    assert "walker_sim.save_frequency = 5" in code
+
+def test_concurrent_halves_writer():
+    engine = EngineWriter("script.lammps", n_steps_per_frame=10)
+    code = ConcurrentHalvesWriter(engine).code
+    compile(code, "run.py", 'exec')
+    assert ("backward_engine = ops_lammps.Engine(\n    inputs=data, "
+            "options=" + str(engine.options) + "\n"
+            ").named('backward_engine')") in code
+    assert "backward_engine=backward_engine" in code
+
+class TestFusedComputeCVsWriter(object):
+    def setup(self):
+        CVCodeWriter.creation_counter = 0
+        FusedComputeCVsWriter.creation_counter = 0
+        self.cvs = [CVCodeWriter(name="my dist",
+                                 class_name="LAMMPSComputeCV",
+                                 groupid_style_args="all com",
+                                 extract_style=0, extract_type=1,
+                                 engine="engine"),
+                    CVCodeWriter(name="rg", class_name="LAMMPSComputeCV",
+                                 groupid_style_args="all gyration",
+                                 extract_style=0, extract_type=0,
+                                 engine="engine")]
+        self.writer = FusedComputeCVsWriter(self.cvs)
+
+    def test_bound_name(self):
+        assert self.writer.bound_name == "fused_computes_1"
+
+    def test_code(self):
+        expected = "\n".join([
+            "fused_computes_1 = [",
+            "    ['cv_1', 'all com', 0, 1],",
+            "    ['cv_2', 'all gyration', 0, 0],",
+            "]",
+            "cv_1 = paths.FunctionCV('my dist', fused_compute, "
+            "computes=fused_computes_1, compute_id='cv_1')",
+            "cv_1.enable_diskcache()",
+            "cv_2 = paths.FunctionCV('rg', fused_compute, "
+            "computes=fused_computes_1, compute_id='cv_2')",
+            "cv_2.enable_diskcache()",
+        ])
+        assert self.writer.code == expected
+
+def test_initial_snapshots_writer():
+    writer = InitialSnapshotsWriter("snapshots.nc")
+    expected = "\n".join([
+        "inp_snapshot_file = paths.Storage(\"snapshots.nc\", mode='r')",
+        "initial_conditions = [snapshot for traj in "
+        "inp_snapshot_file.trajectories",
+        "                      for snapshot in traj]",
+        ""
+    ])
+    assert writer.code == expected
+    code = InitialSnapshotsWriter("snapshots.nc", traj_num=-1).code
+    assert "for traj in [inp_snapshot_file.trajectories[-1]]" in code
+
+@pytest.mark.parametrize('in_engine, class_name', [
+    (True, "LAMMPSVelocityRandomizer"),
+    (False, "VectorizedVelocityRandomizer")
+])
+def test_randomizer_writer(in_engine, class_name):
+    writer = RandomizerWriter(temperature=300.0, seed=42, in_engine=in_engine)
+    expected = ("from gui_paths.randomizers import " + class_name + "\n"
+                + "randomizer = " + class_name
+                + "(engine, temperature=300.0, seed=42)")
+    assert writer.code == expected
+
+@pytest.mark.parametrize('kwargs, extra', [
+    ({}, {}),
+    ({'n_steps_per_frame': 10}, {'n_steps_per_frame': 10}),
+    ({'n_frames_max': 1000}, {'n_frames_max': 1000}),
+])
+def test_engine_writer_options(kwargs, extra):
+    writer = EngineWriter("script.lammps", **kwargs)
+    expected = {'n_steps_per_frame': 200, 'n_frames_max': 500000}
+    expected.update(extra)
+    assert writer.options == expected
+    assert "options=" + str(expected) + ").named('engine')" in writer.code
+
+
+def test_trial_length_writer():
+    writer = TrialLengthWriter(multiple=2.5,
+                               engines=["engine", "backward_engine"])
+    code = writer.code
+    compile(code, "run.py", 'exec')
+    assert ("sim.attach_hook(AdaptiveMaxLength([engine, backward_engine], "
+            "multiple=2.5, percentile=95.0, min_samples=20))") in code
+    walkers = WalkersWriter(n_walkers=4, output_file="tps.nc",
+                            n_sim_steps=10, trial_length=writer).code
+    compile(walkers, "run.py", 'exec')
+    assert "min_samples=20, stream=log)" in walkers
+    # a resumed walker caps the engines of its saved scheme
+    assert "global engine, backward_engine\n" in walkers
+    assert ("backward_engine = walker_storage.engines['backward_engine']"
+            in walkers)
+    assert "AdaptiveMaxLength" not in WalkersWriter(
+        n_walkers=4, output_file="tps.nc", n_sim_steps=10).code
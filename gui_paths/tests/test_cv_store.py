@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import multiprocessing
+
+import pytest
+
+from ..cv_store import *
+
+
+class FakeSnapshot(object):
+    def __init__(self, uuid):
+        self.__uuid__ = uuid
+
+
+def _fill_store(args):
+    filename, start = args
+    store = CVValueStore(filename, batch_size=7)
+    for idx in range(start, start + 50):
+        store.put('key', idx, float(idx))
+    store.close()
+
+
+class TestCVValueStore(object):
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "cv_values.db")
+        self.store = CVValueStore(self.filename, max_entries=20,
+                                  batch_size=5)
+
+    def teardown(self):
+        self.store.close()
+        close_stores()
+        shutil.rmtree(self.tmpdir)
+
+    def test_put_get(self):
+        snapshot = FakeSnapshot(2**100)  # UUIDs don't fit in 64 bits
+        self.store.put('key', snapshot, 1.5)
+        self.store.put('other', snapshot, [1, 2])
+        assert self.store.get('key', snapshot) == 1.5  # still pending
+        assert len(self.store) == 0
+        self.store.flush()
+        assert len(self.store) == 2
+        reopened = CVValueStore(self.filename)
+        assert reopened.get('key', snapshot) == 1.5
+        assert reopened.get('other', snapshot) == [1, 2]
+        with pytest.raises(KeyError):
+            reopened.get('key', FakeSnapshot(3))
+        reopened.close()
+
+    def test_batches(self):
+        for idx in range(12):
+            self.store.put('key', idx, float(idx))
+        assert len(self.store) == 10  # two full batches written
+
+    def test_eviction(self):
+        for idx in range(30):
+            self.store.put('key', idx, float(idx))
+        self.store.flush()
+        assert len(self.store) <= 20
+        assert self.store.get('key', 29) == 29.0
+        with pytest.raises(KeyError):
+            self.store.get('key', 0)
+
+    def test_concurrent_writers(self):
+        jobs = [(self.filename, start) for start in range(0, 200, 50)]
+        pool = multiprocessing.Pool(4)
+        try:
+            pool.map(_fill_store, jobs)
+        finally:
+            pool.close()
+            pool.join()
+        store = CVValueStore(self.filename)
+        assert len(store) == 200
+        store.close()
+
+
+def test_cv_store_key():
+    key = cv_store_key("LAMMPSComputeCV(groupid_style_args='all com')",
+                       "script 1")
+    assert key == cv_store_key("LAMMPSComputeCV(groupid_style_args='all com')",
+                               "script 1")
+    assert key != cv_store_key("LAMMPSComputeCV(groupid_style_args='all com')",
+                               "script 2")
+
+
+def test_stored_cv_value():
+    tmpdir = tempfile.mkdtemp()
+    calls = []
+
+    def cv(snapshot):
+        calls.append(snapshot)
+        return 2.0 * snapshot.__uuid__
+
+    try:
+        filename = os.path.join(tmpdir, "cv_values.db")
+        snapshot = FakeSnapshot(21)
+        for _ in range(3):
+            assert stored_cv_value(snapshot, cv, filename, 'key') == 42.0
+        assert calls == [snapshot]
+    finally:
+        close_stores()
+        shutil.rmtree(tmpdir)
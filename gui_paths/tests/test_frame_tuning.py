@@ -0,0 +1,81 @@
+import pytest
+np = pytest.importorskip("numpy")
+
+from ..frame_tuning import *
+
+# state A = 0, state B = 1, no state = -1
+LABELS = np.array([0] * 10 + [-1] * 8 + [1] * 30 + [-1] * 3 + [1] * 6
+                  + [-1] * 12 + [0] * 20 + [1] * 2 + [-1] * 4)
+
+
+def test_state_labels():
+    masks = [[True, False, False, True], [False, False, True, True]]
+    np.testing.assert_array_equal(state_labels(masks), [0, -1, 1, 0])
+
+
+def test_residence_and_transit_times():
+    residences, transits = residence_and_transit_times(LABELS)
+    # first and last runs are cut off by the ends of the trajectory
+    np.testing.assert_array_equal(residences, [30, 6, 20, 2])
+    # 8: A to B; 3: B to B (recrossing, not a transit); 12: B to A;
+    # 0: direct jump from A to B
+    np.testing.assert_array_equal(sorted(transits), [0, 8, 12])
+
+
+def test_autocorrelation():
+    acf = autocorrelation(np.sin(np.linspace(0, 20 * np.pi, 1000)), 100)
+    assert acf[0] == pytest.approx(1.0)
+    assert acf[25] == pytest.approx(0.0, abs=0.05)  # quarter period
+    assert acf[50] == pytest.approx(-1.0, abs=0.1)  # half period
+
+
+def test_integrated_autocorrelation_time():
+    rng = np.random.default_rng(0)
+    noise = rng.standard_normal(10000)
+    assert integrated_autocorrelation_time(noise) < 2
+    smooth = np.repeat(noise[:1000], 10)  # correlated over 10 frames
+    assert 3 < integrated_autocorrelation_time(smooth) < 10
+
+
+class TestRecommendFrames(object):
+    def setup(self):
+        # a ramp is correlated over many frames, so its minimum stride is
+        # above the maximum from the transits, which wins
+        self.recommendation = recommend_frames(
+            cv_values=[np.repeat(np.arange(len(LABELS) // 5 + 1), 5)],
+            labels=np.array([0] * 10 + [-1] * 10 + [1] * 10 + [-1] * 20
+                            + [0] * 10 + [-1] * 5),
+            ref_steps_per_frame=10,
+            min_transit_frames=2,
+            safety_factor=4.0
+        )
+
+    def test_stride(self):
+        limits = self.recommendation.limits
+        assert limits['state residence'] == 10
+        assert limits['transit length'] == 5
+        assert limits['CV autocorrelation'] > 5
+        assert self.recommendation.stride == 5
+        assert (self.recommendation.n_steps_per_frame
+                == 10 * self.recommendation.stride)
+
+    def test_n_frames_max(self):
+        stride = self.recommendation.stride
+        expected = int(np.ceil(4.0 * 22 / stride))
+        assert self.recommendation.n_frames_max == expected
+
+    def test_no_transitions(self):
+        recommendation = recommend_frames([], np.zeros(10, dtype=int), 7)
+        assert recommendation.stride == 1
+        assert recommendation.n_steps_per_frame == 7
+        assert recommendation.n_frames_max == 500000
+
+    def test_autocorrelation_without_transitions(self):
+        rng = np.random.default_rng(0)
+        smooth = np.repeat(rng.standard_normal(1000), 10)
+        recommendation = recommend_frames([smooth],
+                                          np.zeros(10000, dtype=int), 1)
+        tau = int(integrated_autocorrelation_time(smooth))
+        assert recommendation.limits['CV autocorrelation'] == tau
+        assert recommendation.stride == tau > 1
+        assert "min stride from CV autocorrelation" in str(recommendation)
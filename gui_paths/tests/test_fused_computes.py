@@ -0,0 +1,170 @@
+import pytest
+np = pytest.importorskip("numpy")
+
+from ..fused_computes import *
+
+
+class FakeNumpyLAMMPS(object):
+    def __init__(self, lmp):
+        self.lmp = lmp
+
+    def extract_compute(self, compute_id, style, type_):
+        # values depend on the loaded frame, and LAMMPS reuses its memory
+        self.lmp.memory[compute_id][:] = self.lmp.frame
+        if type_ == 0:
+            return float(self.lmp.frame)
+        return self.lmp.memory[compute_id]
+
+
+class FakeLAMMPS(object):
+    def __init__(self):
+        self.commands = []
+        self.frame = None
+        self.memory = {'cv_1': np.zeros(3), 'cv_2': np.zeros(1)}
+        self.numpy = FakeNumpyLAMMPS(self)
+
+    def command(self, cmd):
+        self.commands.append(cmd)
+
+
+class FakeEngine(object):
+    def __init__(self):
+        self.lammps = FakeLAMMPS()
+        self.n_loads = 0
+
+    @property
+    def current_snapshot(self):
+        return self.lammps.frame
+
+    @current_snapshot.setter
+    def current_snapshot(self, snapshot):
+        self.n_loads += 1
+        self.lammps.frame = snapshot.value
+
+
+class FakeSnapshot(object):
+    def __init__(self, engine, value):
+        self.engine = engine
+        self.value = value
+
+
+class TestFusedComputes(object):
+    def setup(self):
+        self.engine = FakeEngine()
+        self.computes = [['cv_1', 'all com', 0, 1],
+                         ['cv_2', 'all gyration', 0, 0]]
+        FusedComputes._instances = {}
+
+    def test_computes_defined_once(self):
+        snap = FakeSnapshot(self.engine, 1.0)
+        fused_compute(snap, self.computes, 'cv_1')
+        fused_compute(snap, self.computes, 'cv_2')
+        commands = self.engine.lammps.commands
+        assert commands[:2] == ["compute cv_1 all com",
+                                "compute cv_2 all gyration"]
+        assert len(FusedComputes._instances) == 1
+
+    def test_single_pass_per_snapshot(self):
+        snap = FakeSnapshot(self.engine, 1.0)
+        assert fused_compute(snap, self.computes, 'cv_2') == 1.0
+        np.testing.assert_array_equal(
+            fused_compute(snap, self.computes, 'cv_1'), [1.0, 1.0, 1.0]
+        )
+        assert self.engine.n_loads == 1
+        assert self.engine.lammps.commands.count("run 0 post no") == 1
+
+    def test_values_not_overwritten(self):
+        snap_1 = FakeSnapshot(self.engine, 1.0)
+        snap_2 = FakeSnapshot(self.engine, 2.0)
+        value_1 = fused_compute(snap_1, self.computes, 'cv_1')
+        value_2 = fused_compute(snap_2, self.computes, 'cv_1')
+        np.testing.assert_array_equal(value_1, [1.0, 1.0, 1.0])
+        np.testing.assert_array_equal(value_2, [2.0, 2.0, 2.0])
+
+
+class ComputingLAMMPS(object):
+    """Fake LAMMPS whose computes depend on the loaded coordinates.
+
+    Like LAMMPS, computes are evaluated by ``run 0`` into memory that is
+    reused for every evaluation.
+    """
+    styles = {
+        'com': lambda x: x.mean(axis=0),
+        'gyration': lambda x: np.sqrt(
+            ((x - x.mean(axis=0))**2).sum(axis=1).mean()
+        ),
+    }
+
+    def __init__(self):
+        self.coordinates = None
+        self.computes = {}
+        self.memory = {}
+        self.numpy = self
+
+    def command(self, cmd):
+        words = cmd.split()
+        if words[0] == 'compute':
+            self.computes[words[1]] = words[3]
+        elif words[:2] == ['run', '0']:
+            for compute_id, style in self.computes.items():
+                value = np.atleast_1d(self.styles[style](self.coordinates))
+                self.memory.setdefault(compute_id, np.empty_like(value))
+                self.memory[compute_id][:] = value
+
+    def extract_compute(self, compute_id, style, type_):
+        if type_ == 0:
+            return float(self.memory[compute_id][0])
+        return self.memory[compute_id]
+
+
+class ComputingEngine(object):
+    def __init__(self):
+        self.lammps = ComputingLAMMPS()
+
+    @property
+    def current_snapshot(self):
+        return None
+
+    @current_snapshot.setter
+    def current_snapshot(self, snapshot):
+        self.lammps.coordinates = snapshot.coordinates
+
+
+class CoordinatesSnapshot(object):
+    def __init__(self, engine, coordinates):
+        self.engine = engine
+        self.coordinates = coordinates
+
+
+def separate_compute(snapshot, compute_id, groupid_style_args, type_):
+    """Value from a compute extracted on its own, as each
+    LAMMPSComputeCV does without fusing"""
+    lmp = snapshot.engine.lammps
+    separate_id = "separate_" + compute_id
+    if separate_id not in lmp.computes:
+        lmp.command("compute " + separate_id + " " + groupid_style_args)
+    snapshot.engine.current_snapshot = snapshot
+    lmp.command("run 0")
+    value = lmp.extract_compute(separate_id, 0, type_)
+    return np.copy(value) if type_ else value
+
+
+def test_fused_matches_separate():
+    FusedComputes._instances = {}
+    engine = ComputingEngine()
+    computes = [['cv_1', 'all com', 0, 1],
+                ['cv_2', 'all gyration', 0, 0]]
+    rng = np.random.RandomState(3)
+    snapshots = [CoordinatesSnapshot(engine, rng.normal(size=(20, 3)))
+                 for _ in range(4)]
+    # revisit snapshots, and mix in separate extractions, which move
+    # LAMMPS on underneath the fused values
+    order = [0, 1, 0, 2, 3, 1]
+    for idx in order:
+        snap = snapshots[idx]
+        for compute_id, groupid_style_args, _, type_ in computes:
+            fused = fused_compute(snap, computes, compute_id)
+            separate = separate_compute(snap, compute_id,
+                                        groupid_style_args, type_)
+            np.testing.assert_allclose(fused, separate)
+            assert np.ndim(fused) == np.ndim(separate)
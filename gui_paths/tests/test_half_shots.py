@@ -0,0 +1,311 @@
+import os
+import sys
+import time
+import types
+import threading
+import importlib
+
+import pytest
+
+
+class FakeStorableObject(object):
+    pass
+
+
+class FakeTwoWayShootingMover(FakeStorableObject):
+    pass
+
+
+@pytest.fixture
+def half_shots(monkeypatch):
+    """The half_shots module, with a stand-in for OPS if it's missing"""
+    try:
+        import openpathsampling
+    except ImportError:
+        fake_ops = types.ModuleType("openpathsampling")
+        fake_movers = types.ModuleType("openpathsampling.pathmover")
+        fake_movers.AbstractTwoWayShootingMover = FakeTwoWayShootingMover
+        fake_netcdfplus = types.ModuleType("openpathsampling.netcdfplus")
+        fake_netcdfplus.StorableObject = FakeStorableObject
+        fake_netcdfplus.ObjectJSON = object
+        fake_ops.pathmover = fake_movers
+        fake_ops.netcdfplus = fake_netcdfplus
+        monkeypatch.setitem(sys.modules, 'openpathsampling', fake_ops)
+        for module in [fake_movers, fake_netcdfplus]:
+            monkeypatch.setitem(sys.modules, module.__name__, module)
+        name = __package__.rsplit('.', 1)[0] + ".half_shots"
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    return importlib.import_module("..half_shots", __package__)
+
+
+class FakeEngine(object):
+    """Integer "snapshots"; steps by ``direction`` until told to stop.
+
+    If ``wait_for`` is given, each step waits for it, so a test can hold
+    one half while the other finishes. If ``barrier`` is given, generating
+    waits there first.
+    """
+    def __init__(self, wait_for=None, barrier=None):
+        self.wait_for = wait_for
+        self.barrier = barrier
+
+    def generate(self, snapshot, running, direction=+1):
+        if self.barrier is not None:
+            self.barrier.wait()
+        traj = [snapshot]
+        while all(cond(traj, True) for cond in running):
+            if self.wait_for is not None:
+                self.wait_for.wait(timeout=5.0)
+            if direction > 0:
+                traj.append(traj[-1] + 1)
+            else:
+                traj.insert(0, traj[0] - 1)
+        return traj
+
+
+def until(stop):
+    return lambda traj, trusted=False: stop not in traj
+
+
+class TestGenerateHalves(object):
+    @pytest.fixture(autouse=True)
+    def setup_halves(self, half_shots):
+        self.generate_halves = half_shots.generate_halves
+        self.forward = FakeEngine()
+        self.backward = FakeEngine()
+
+    def test_both_halves(self):
+        # this barrier is only passed if both halves run at the same time
+        barrier = threading.Barrier(2, timeout=5.0)
+        self.forward.barrier = barrier
+        self.backward.barrier = barrier
+        backward, forward, cancelled = self.generate_halves(
+            0, self.forward, self.backward,
+            forward_running=until(3), backward_running=until(-2)
+        )
+        assert backward == [-2, -1, 0]
+        assert forward == [0, 1, 2, 3]
+        assert not cancelled
+
+    def test_failed_half_cancels_other(self):
+        # the backward half never finishes on its own; once the forward
+        # half fails, it is cancelled
+        release = threading.Event()
+        backward_engine = FakeEngine(wait_for=release)
+        def forward_ok(traj):
+            release.set()
+            return False
+
+        backward, forward, cancelled = self.generate_halves(
+            0, self.forward, backward_engine,
+            forward_running=until(3), backward_running=until(None),
+            forward_ok=forward_ok
+        )
+        assert cancelled
+        assert forward == [0, 1, 2, 3]
+        assert backward[-1] == 0
+
+    def test_ok_halves_not_cancelled(self):
+        backward, forward, cancelled = self.generate_halves(
+            0, self.forward, self.backward,
+            forward_running=until(2), backward_running=until(-2),
+            forward_ok=lambda traj: True, backward_ok=lambda traj: True
+        )
+        assert not cancelled
+        assert backward + forward[1:] == [-2, -1, 0, 1, 2]
+
+
+class StatefulEngine(FakeEngine):
+    """Holds one state, like a LAMMPS instance.
+
+    Counts the CV evaluations made from another thread while a half is
+    integrating on it, which would change the state under that half.
+    """
+    def __init__(self, barrier=None):
+        super(StatefulEngine, self).__init__(barrier=barrier)
+        self.integrating = None
+        self.clashes = 0
+
+    def generate(self, snapshot, running, direction=+1):
+        self.integrating = threading.get_ident()
+
+        def slow(traj, trusted=False):
+            time.sleep(0.001)  # integrating, without the GIL
+            return True
+
+        try:
+            return super(StatefulEngine, self).generate(
+                snapshot, list(running) + [slow], direction
+            )
+        finally:
+            self.integrating = None
+
+    def evaluate(self, snapshot):
+        if self.integrating not in (None, threading.get_ident()):
+            self.clashes += 1
+        return snapshot
+
+
+class EngineCV(object):
+    def __init__(self, engine):
+        self.engine = engine
+
+    def __call__(self, snapshot):
+        return self.engine.evaluate(snapshot)
+
+
+class FakeEnsemble(object):
+    """Paths with the CV between ``lower`` and ``upper``"""
+    def __init__(self, cv, lower, upper):
+        self.cv = cv
+        self.lower = lower
+        self.upper = upper
+
+    def can_append(self, traj, trusted=False):
+        return self.cv(traj[-1]) < self.upper
+
+    def can_prepend(self, traj, trusted=False):
+        return self.cv(traj[0]) > self.lower
+
+
+class TestSharedEngine(object):
+    def setup(self):
+        barrier = threading.Barrier(2, timeout=5.0)
+        self.forward = StatefulEngine(barrier)
+        self.backward = StatefulEngine(barrier)
+        self.ensemble = FakeEnsemble(EngineCV(self.forward), -10, 10)
+
+    def _shoot(self, half_shots, backward_ensemble):
+        backward, forward, cancelled = half_shots.generate_halves(
+            0, self.forward, self.backward,
+            forward_running=lambda traj, trusted=False:
+                self.ensemble.can_append(traj),
+            backward_running=lambda traj, trusted=False:
+                backward_ensemble.can_prepend(traj)
+        )
+        assert backward + forward[1:] == list(range(-10, 11))
+
+    def test_shared_ensemble_clashes(self, half_shots):
+        # the test engine catches the backward half using the forward
+        # engine's CVs
+        self._shoot(half_shots, self.ensemble)
+        assert self.forward.clashes > 0
+
+    def test_rebound_ensemble(self, half_shots):
+        backward_ensemble = half_shots.rebind_engine(
+            self.ensemble, self.forward, self.backward
+        )
+        assert backward_ensemble.cv.engine is self.backward
+        assert self.ensemble.cv.engine is self.forward
+        self._shoot(half_shots, backward_ensemble)
+        assert self.forward.clashes == self.backward.clashes == 0
+
+
+class TestConcurrentTwoWayShootingMover(object):
+    def setup(self):
+        self.paths = pytest.importorskip("openpathsampling")
+        np = pytest.importorskip("numpy")
+        toys = pytest.importorskip("openpathsampling.engines.toy")
+        from ..half_shots import ConcurrentTwoWayShootingMover
+        self.mover_class = ConcurrentTwoWayShootingMover
+        paths = self.paths
+        # a 1D double well, and a path from A to B over the barrier
+        pes = (toys.OuterWalls([1.0], [0.0])
+               + toys.Gaussian(2.0, [4.0], [0.0]))
+        topology = toys.Topology(n_spatial=1, masses=[1.0], pes=pes)
+        self.engine, self.backward_engine = [
+            toys.Engine({'integ': toys.LeapfrogVerletIntegrator(0.02),
+                         'n_frames_max': 5000, 'n_steps_per_frame': 5},
+                        topology).named(name)
+            for name in ["engine", "backward_engine"]
+        ]
+        # fast enough to cross the barrier from any frame
+        self.trajectory = paths.Trajectory([
+            toys.Snapshot(coordinates=np.array([[x]]),
+                          velocities=np.array([[3.0]]), engine=self.engine)
+            for x in np.arange(-0.65, 0.7, 0.1)
+        ])
+        # like a LAMMPS compute CV, this is evaluated on an engine
+        x = paths.FunctionCV("x", lambda snap, engine: snap.xyz[0][0],
+                             engine=self.engine)
+        state_a = paths.CVDefinedVolume(x, float("-inf"), -0.6).named("A")
+        state_b = paths.CVDefinedVolume(x, 0.6, float("inf")).named("B")
+        self.network = paths.TPSNetwork(state_a, state_b)
+
+    @staticmethod
+    def _cv_engine(tps_ensemble):
+        # the CV of state A, through the all-out-of-A-and-B part
+        volume = tps_ensemble.ensembles[1].volume.volume1
+        return volume.collectivevariable.kwargs['engine']
+
+    def _mover(self, ensemble, engine=None, backward_engine=None):
+        return self.mover_class(
+            ensemble=ensemble, selector=self.paths.UniformSelector(),
+            modifier=self.paths.NoModification(),
+            engine=engine or self.engine,
+            backward_engine=backward_engine or self.backward_engine
+        )
+
+    def test_backward_ensemble(self):
+        paths = self.paths
+        engine, backward_engine = FakeEngine(), FakeEngine()
+        cv = paths.FunctionCV("x", lambda snap, engine: 0.0, engine=engine)
+        ensemble = paths.AllInXEnsemble(paths.CVDefinedVolume(cv, 0.0, 1.0))
+        mover = self._mover(ensemble, engine, backward_engine)
+        backward_cv = mover.backward_ensemble.volume.collectivevariable
+        assert backward_cv.kwargs['engine'] is backward_engine
+        assert cv.kwargs['engine'] is engine
+        assert mover.to_dict()['ensemble'] is ensemble
+
+    def test_shot(self):
+        [ensemble] = self.network.sampling_ensembles
+        mover = self._mover(ensemble)
+        sample = self.paths.Sample(replica=0, trajectory=self.trajectory,
+                                   ensemble=ensemble)
+        [trial], details = mover(sample)
+        assert self._cv_engine(mover.backward_ensemble) is self.backward_engine
+        assert ensemble(trial.trajectory)
+        assert not details['cancelled']
+        # the halves meet at the shooting point
+        assert details['modified_shooting_snapshot'] in trial.trajectory
+
+    def test_storable(self, tmpdir):
+        # saved with the move scheme, and loaded again to resume a run
+        [ensemble] = self.network.sampling_ensembles
+        filename = str(tmpdir.join("mover.nc"))
+        storage = self.paths.Storage(filename, mode='w')
+        storage.save(self._mover(ensemble))
+        storage.close()
+        storage = self.paths.Storage(filename, mode='r')
+        [mover] = [mover for mover in storage.pathmovers
+                   if isinstance(mover, self.mover_class)]
+        assert mover.engine.name == "engine"
+        assert mover.backward_engine.name == "backward_engine"
+        assert self._cv_engine(mover.ensemble) is mover.engine
+        assert (self._cv_engine(mover.backward_ensemble)
+                is mover.backward_engine)
+        storage.close()
+
+    def test_path_sampling(self, tmpdir):
+        paths = self.paths
+        scheme = paths.LockedMoveScheme(
+            paths.RandomChoiceMover([
+                self._mover(ensemble)
+                for ensemble in self.network.sampling_ensembles
+            ]),
+            self.network
+        )
+        initial_conditions = scheme.initial_conditions_from_trajectories(
+            self.trajectory
+        )
+        storage = paths.Storage(str(tmpdir.join("tps.nc")), mode='w')
+        sim = paths.PathSampling(storage=storage, move_scheme=scheme,
+                                 sample_set=initial_conditions)
+        sim.output_stream = open(os.devnull, 'w')
+        sim.run(3)
+        assert len(storage.steps) == 4
+        for step in storage.steps[1:]:
+            mover = step.change.canonical.mover
+            assert isinstance(mover, self.mover_class)
+        sim.output_stream.close()
+        storage.close()
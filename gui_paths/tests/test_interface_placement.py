@@ -0,0 +1,55 @@
+import pytest
+np = pytest.importorskip("numpy")
+
+from ..interface_placement import *
+
+
+@pytest.mark.parametrize('values, expected', [
+    ([0, 0, 1, 2, 1, 0, 3, 5, 0, 0, 2], [2, 5, 2]),
+    ([1, 2, 0, 4], [4]),  # starts outside the state: not an excursion
+    ([0, 0, 0], []),
+    ([1, 1, 1], []),
+])
+def test_excursion_maxima(values, expected):
+    np.testing.assert_array_equal(excursion_maxima(values, 0.5), expected)
+    np.testing.assert_array_equal(
+        excursion_maxima(-np.array(values), -0.5, increasing=False),
+        -np.array(expected)
+    )
+
+
+def test_crossing_probability():
+    maxima = [0.5, 1.5, 1.5, 3.0]
+    edges = np.array([0.0, 1.0, 2.0, 3.0])
+    np.testing.assert_allclose(crossing_probability(maxima, edges),
+                               [1.0, 0.75, 0.25, 0.25])
+    np.testing.assert_array_equal(crossing_probability([], edges),
+                                  [0, 0, 0, 0])
+
+
+class TestPlaceInterfaces(object):
+    def setup(self):
+        # P(lambda) = exp(-lambda): equal steps in ln P are equal steps in
+        # lambda
+        rng = np.random.default_rng(1)
+        self.maxima = rng.exponential(1.0, 100000)
+
+    def test_exponential(self):
+        interfaces = place_interfaces(self.maxima, 0.0, 5, lambda_final=5.0)
+        assert interfaces[0] == 0.0
+        np.testing.assert_allclose(np.diff(interfaces), 1.0, atol=0.05)
+
+    def test_decreasing(self):
+        increasing = place_interfaces(self.maxima, 0.0, 5, lambda_final=5.0)
+        decreasing = place_interfaces(-self.maxima, 0.0, 5,
+                                      lambda_final=-5.0, increasing=False)
+        np.testing.assert_allclose(decreasing, -np.array(increasing))
+
+    def test_final_beyond_data(self):
+        interfaces = place_interfaces([0.5, 1.0], 0.0, 3,
+                                      lambda_final=100.0)
+        assert max(interfaces) < 1.0
+
+    def test_no_excursions(self):
+        with pytest.raises(ValueError):
+            place_interfaces([], 0.0, 3)
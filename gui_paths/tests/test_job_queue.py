@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+
+import pytest
+
+from ..job_queue import *
+
+GOOD_SCRIPT = """
+import os
+with open("threads.txt", mode='w') as f:
+    f.write(os.environ['OMP_NUM_THREADS'])
+"""
+
+BAD_SCRIPT = "raise RuntimeError('crashed')\n"
+
+SLOW_SCRIPT = "import time\ntime.sleep(60)\n"
+
+
+class TestJobQueue(object):
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name, script in [('good', GOOD_SCRIPT), ('bad', BAD_SCRIPT)]:
+            os.mkdir(os.path.join(self.tmpdir, name))
+            with open(os.path.join(self.tmpdir, name, "run.py"), 'w') as f:
+                f.write(script)
+        self.queue_file = os.path.join(self.tmpdir, "queue.json")
+        self.queue = JobQueue(self.queue_file, max_cores=2, max_retries=1)
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_find_scripts(self):
+        scripts = find_scripts(self.tmpdir)
+        assert scripts == [os.path.join(self.tmpdir, "bad", "run.py"),
+                           os.path.join(self.tmpdir, "good", "run.py")]
+
+    def test_add_sweep_directory(self):
+        jobs = self.queue.add(self.tmpdir, n_cores=1, n_threads=3)
+        assert len(jobs) == 2
+        assert all(job.n_threads == 3 for job in jobs)
+        # adding again does not duplicate jobs
+        assert self.queue.add(self.tmpdir) == []
+        with open(self.queue_file) as f:
+            assert len(json.load(f)) == 2
+
+    def test_add_too_many_cores(self):
+        with pytest.raises(ValueError):
+            self.queue.add(self.tmpdir, n_cores=3)
+
+    def test_run(self):
+        self.queue.add(self.tmpdir, n_threads=4)
+        self.queue.run(poll_interval=0.01)
+        status = {os.path.basename(job.directory): job
+                  for job in self.queue.jobs}
+        assert status['good'].status == DONE
+        assert status['bad'].status == FAILED
+        assert status['bad'].attempts == 2  # one retry
+        with open(os.path.join(self.tmpdir, "good", "threads.txt")) as f:
+            assert f.read() == "4"
+
+    def test_reload_resets_running(self):
+        self.queue.add(self.tmpdir)
+        self.queue.jobs[0].status = RUNNING
+        self.queue.save()
+        reloaded = JobQueue(self.queue_file)
+        assert [job.status for job in reloaded.jobs] == [QUEUED, QUEUED]
+        assert "queued: 2" in reloaded.status_table()
+
+    def test_reload_keeps_live_jobs(self):
+        slow = os.path.join(self.tmpdir, "slow.py")
+        with open(slow, 'w') as f:
+            f.write(SLOW_SCRIPT)
+        self.queue.add(slow, n_cores=2)
+        job = self.queue.jobs[0]
+        job.start(self.queue.cores)
+        self.queue.save()
+        # until the child execs, its command line is still ours
+        for _ in range(500):
+            if job.is_alive():
+                break
+            time.sleep(0.01)
+        try:
+            reloaded = JobQueue(self.queue_file, max_cores=2, max_retries=0)
+            assert reloaded.jobs[0].status == RUNNING
+            assert reloaded.jobs[0].pid == job.pid
+            # the old scheduler's job still holds its cores
+            reloaded.add(os.path.join(self.tmpdir, "good", "run.py"))
+            reloaded.step()
+            assert reloaded.jobs[1].status == QUEUED
+        finally:
+            job.process.kill()
+            job.process.wait()
+        # its exit code is lost, so it counts as a crash
+        reloaded.step()
+        assert reloaded.jobs[0].status == FAILED
+        assert reloaded.jobs[1].status == RUNNING
+        reloaded.run(poll_interval=0.01)
+        assert reloaded.jobs[1].status == DONE
+
+    def test_reload_finished_jobs(self):
+        # jobs that finished while no scheduler was watching keep their
+        # exit status: successes aren't run again
+        self.queue.add(self.tmpdir)
+        for job in self.queue.jobs:
+            job.start([])
+            job.process.wait()
+        self.queue.save()
+        reloaded = JobQueue(self.queue_file, max_cores=2, max_retries=1)
+        status = {os.path.basename(job.directory): job
+                  for job in reloaded.jobs}
+        assert status['good'].status == DONE
+        assert status['good'].returncode == 0
+        assert status['bad'].status == QUEUED
+        assert status['bad'].returncode == 1
+
+    def test_exit_status(self):
+        script = os.path.join(self.tmpdir, "exit.py")
+        for code, expected in [("sys.exit(3)", 3), ("sys.exit()", 0),
+                               ("sys.exit('message')", 1)]:
+            with open(script, 'w') as f:
+                f.write("import sys\n" + code + "\n")
+            job = Job(script)
+            job.start([])
+            assert job.process.wait() == expected
+            assert job.exit_status() == expected
+
+    def test_add_while_running(self):
+        self.queue.add(os.path.join(self.tmpdir, "bad", "run.py"))
+        # another process adds a job to the same file
+        other = JobQueue(self.queue_file, max_cores=2)
+        other.add(os.path.join(self.tmpdir, "good", "run.py"))
+        # saving our changes keeps it, and the scheduler runs it
+        self.queue.save()
+        with open(self.queue_file) as f:
+            assert len(json.load(f)) == 2
+        self.queue.run(poll_interval=0.01)
+        assert [job.status for job in self.queue.jobs] == [FAILED, DONE]
+
+
+def test_pinning(tmpdir):
+    cpus = allowed_cpus()
+    if cpus is None:
+        pytest.skip("CPU affinity not supported")
+    queue = JobQueue(str(tmpdir.join("queue.json")), max_cores=1)
+    assert queue.pin
+    assert queue.cores == cpus[:1]
+    with pytest.warns(UserWarning):
+        queue = JobQueue(queue.queue_file, max_cores=len(cpus) + 1)
+    assert not queue.pin
+    assert queue.cores == list(range(len(cpus) + 1))
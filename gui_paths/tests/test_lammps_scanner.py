@@ -0,0 +1,126 @@
+import os
+import json
+import shutil
+import tempfile
+
+import pytest
+
+from ..lammps_scanner import *
+
+SCRIPT = """
+# test input
+units lj
+read_data system.data
+include groups.in
+compute c_com solvent com
+compute c_rg solvent gyration
+compute tmp all temp
+uncompute tmp
+fix 1 all nve
+fix 2 all langevin 1.0 1.0 &
+    1.0 12345
+fix 3 solvent spring/self 1.0
+unfix 3
+"""
+
+GROUPS = """
+group solvent type 1
+group solute type 2  # comment
+group solute delete
+"""
+
+DATA = """LAMMPS data file
+
+1000 atoms
+2 atom types
+0.0 10.0 xlo xhi
+
+Masses
+
+1 1.0
+2 1.0
+
+Atoms
+
+1 1 0.0 0.0 0.0
+"""
+
+
+class TestLAMMPSIndex(object):
+    def setup(self):
+        self.tmpdir = tempfile.mkdtemp()
+        for name, contents in [('script.lammps', SCRIPT),
+                               ('groups.in', GROUPS),
+                               ('system.data', DATA)]:
+            with open(os.path.join(self.tmpdir, name), 'w') as f:
+                f.write(contents)
+        self.script = os.path.join(self.tmpdir, 'script.lammps')
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_scan_data_header(self):
+        counts = scan_data_header(os.path.join(self.tmpdir, 'system.data'))
+        assert counts == {'atoms': 1000, 'atom types': 2}
+
+    def test_from_script(self):
+        index = LAMMPSIndex.from_script(self.script)
+        assert index.groups == ['all', 'solvent']
+        assert index.computes == {'c_com': "solvent com",
+                                  'c_rg': "solvent gyration"}
+        assert index.fixes == {'1': "all nve",
+                               '2': "all langevin 1.0 1.0 1.0 12345"}
+        assert index.parameter_choices() == ["all ", "solvent ",
+                                             "solvent com",
+                                             "solvent gyration"]
+        assert index.n_atoms == 1000
+        assert len(index.files) == 3
+
+    def test_include_cycle(self):
+        # groups.in includes itself and the main script; each is scanned
+        # once, rather than recursing forever
+        with open(os.path.join(self.tmpdir, 'groups.in'), 'a') as f:
+            f.write("include groups.in\ninclude script.lammps\n")
+        index = LAMMPSIndex.from_script(self.script)
+        assert index.groups == ['all', 'solvent']
+        assert index.n_atoms == 1000
+
+    def test_cache(self):
+        cache_file = default_cache_file(self.script)
+        index = scan_lammps_script(self.script)
+        assert os.path.exists(cache_file)
+        cached = scan_lammps_script(self.script)
+        assert cached.to_dict() == index.to_dict()
+
+        # changing an included file invalidates the cache
+        with open(os.path.join(self.tmpdir, 'groups.in'), 'a') as f:
+            f.write("group extra type 2\n")
+        assert not cached.is_current()
+        assert scan_lammps_script(self.script).groups[-1] == 'extra'
+
+    def test_touch_keeps_cache(self, monkeypatch):
+        index = scan_lammps_script(self.script)
+        os.utime(self.script, ns=(0, 0))
+        assert index.is_current()
+        # the new mtime is cached, so the file isn't hashed again
+        scan_lammps_script(self.script)
+        hashed = []
+        monkeypatch.setattr(
+            "gui_paths.lammps_scanner._file_key",
+            lambda filename, hash_bytes=None: hashed.append(filename)
+        )
+        scan_lammps_script(self.script)
+        assert hashed == []
+
+    @pytest.mark.parametrize('cached', [
+        {'computes': {'c_com': ['solvent', 'com']}, 'fixes': {}},
+        {'computes': {}},  # from before fixes were scanned
+    ])
+    def test_outdated_cache(self, cached):
+        cache_file = default_cache_file(self.script)
+        cached.update(groups=['all'], files={}, data_files=[], n_atoms=None)
+        with open(cache_file, 'w') as f:
+            json.dump(cached, f)
+        index = scan_lammps_script(self.script)
+        assert index.groups == ['all', 'solvent']
+        assert sorted(index.fixes) == ['1', '2']
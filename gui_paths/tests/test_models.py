@@ -0,0 +1,53 @@
+import pytest
+
+from PyQt5.QtCore import Qt
+
+from ..models import *
+
+
+class TestNamedObjectListModel(object):
+    def setup(self):
+        self.dct = {'foo': 1, 'bar': 2}
+        self.model = NamedObjectListModel(self.dct)
+        self.inserted = []
+        self.changed = []
+        self.model.rowsInserted.connect(
+            lambda parent, first, last: self.inserted.append((first, last))
+        )
+        self.model.dataChanged.connect(
+            lambda first, last: self.changed.append((first.row(),
+                                                     last.row()))
+        )
+
+    def test_data(self):
+        assert self.model.rowCount() == 2
+        assert self.model.data(self.model.index(1)) == 'bar'
+        assert self.model.data(self.model.index(1), Qt.UserRole) == 2
+        assert self.model.data(self.model.index(2)) is None
+
+    def test_add_many(self):
+        items = [('name' + str(i), i) for i in range(100)]
+        self.model.add_many(items)
+        assert self.model.rowCount() == 102
+        assert self.inserted == [(2, 101)]  # single notification
+        assert self.changed == []
+        assert self.dct['name99'] == 99
+
+    def test_add_replaces(self):
+        self.model.add('bar', 3)
+        self.model.add('baz', 4)
+        assert self.inserted == [(2, 2)]
+        assert self.changed == [(1, 1)]
+        assert self.dct == {'foo': 1, 'bar': 3, 'baz': 4}
+
+    def test_remove(self):
+        self.model.remove('foo')
+        assert self.model.rowCount() == 1
+        assert self.model.name(0) == 'bar'
+        assert self.dct == {'bar': 2}
+
+    def test_filtered(self):
+        self.model.add('food', 5)
+        proxy = filtered(self.model)
+        proxy.setFilterFixedString('FOO')
+        assert proxy.rowCount() == 2
@@ -0,0 +1,339 @@
+import re
+import sys
+import types
+
+import pytest
+
+from ..code_writers import *
+from ..output_run_py import *
+
+
+def _assert_storable(code, func_name):
+    """Run the gui_paths lines of a script, and check OPS can store the
+    function ``func_name`` they import"""
+    from openpathsampling.netcdfplus import ObjectJSON
+    lines = [line for line in code.splitlines()
+             if line.startswith(("from gui_paths", "trust_gui_paths"))]
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    func = namespace[func_name]
+    dct = ObjectJSON.callable_to_dict(func)
+    assert dct == {'_module': func.__module__, '_name': func_name}
+
+
+class TestRunPyFile(object):
+    def setup(self):
+        CVCodeWriter.creation_counter = 0
+        VolumeCodeWriter.creation_counter = 0
+        self.cv = CVCodeWriter(name="dist", class_name="LAMMPSComputeCV",
+                               groupid_style_args="all com")
+        self.states = [
+            VolumeCodeWriter(class_name="CVDefinedVolume", is_state=True,
+                             name=name, collectivevariable="cv_1",
+                             lambda_min=l_min, lambda_max=l_max)
+            for (name, l_min, l_max) in [("A", 0.0, 1.0), ("B", 2.0, 3.0)]
+        ]
+        self.engine = EngineWriter("script.lammps")
+        self.storage = StorageWriter("tps.nc", mode='w')
+
+    def _run_py(self, run_type, **extra_info):
+        extra_info.setdefault('n_sim_steps', 10)
+        return RunPyFile(run_type=run_type,
+                         cvs=[self.cv],
+                         volumes=self.states,
+                         engine=self.engine,
+                         other_writers=[self.storage],
+                         extra_info_dict=extra_info)
+
+    @pytest.mark.parametrize('run_type', ['TPS', 'TIS', 'committor',
+                                          'trajectory'])
+    def test_code_compiles(self, run_type):
+        code = self._run_py(run_type).code
+        compile(code, "run.py", 'exec')
+        assert "states = [volume_1, volume_2]" in code
+
+    @pytest.mark.parametrize('run_type, has_hook', [
+        ('TPS', True), ('committor', True), ('trajectory', False)
+    ])
+    def test_progress_hook(self, run_type, has_hook):
+        code = self._run_py(run_type).code
+        assert ("sim.attach_hook(ProgressHook())" in code) == has_hook
+
+    def test_setup_hash(self):
+        def setup_hash(code):
+            return re.search(r'"tps_setup", "([0-9a-f]+)"', code).group(1)
+
+        code = self._run_py('TPS').code
+        # same setup, same hash; different setup, different hash
+        assert setup_hash(self._run_py('TPS').code) == setup_hash(code)
+        self.cv.kwargs['groupid_style_args'] = "all gyration"
+        assert setup_hash(self._run_py('TPS').code) != setup_hash(code)
+
+    def test_setup_inputs(self):
+        code = RunPyFile(run_type='TPS', cvs=[self.cv], volumes=self.states,
+                         engine=self.engine,
+                         other_writers=[self.storage,
+                                        InitialTrajectoryWriter("init.nc")],
+                         extra_info_dict={'n_sim_steps': 10}).code
+        assert "['script.lammps', 'init.nc'],\n    network" in code
+        assert "def cached_initial_conditions(" in code
+        assert "def cached_initial_conditions(" not in self._run_py(
+            'committor'
+        ).code
+
+    def test_tis(self):
+        InterfaceSetWriter.creation_counter = 0
+        interface_sets = [
+            InterfaceSetWriter(self.states[0], "cv_1", [1.0, 1.2, 1.5]),
+            InterfaceSetWriter(self.states[1], "cv_1", [2.0, 1.8],
+                               increasing=False)
+        ]
+        code = RunPyFile(run_type='TIS', cvs=[self.cv], volumes=self.states,
+                         engine=self.engine, other_writers=[self.storage],
+                         extra_info_dict={'n_sim_steps': 10},
+                         interface_sets=interface_sets).code
+        compile(code, "run.py", 'exec')
+        assert ("tis_transitions = [(volume_1, interfaces_1), "
+                "(volume_2, interfaces_2)]") in code
+        assert "paths.MSTISNetwork(tis_transitions)" in code
+        # same frame cache as TPS, with its own file prefix
+        assert "def cached_initial_conditions(" in code
+        assert '"tis_setup", "' in code
+        assert "setup_storage" not in code
+        assert "\ntransitions = " not in code  # that's only for TPS
+
+    def test_walkers(self):
+        walkers = WalkersWriter(n_walkers=2, output_file="tps.nc",
+                                n_sim_steps=10)
+        code = RunPyFile(run_type='TPS', cvs=[self.cv], volumes=self.states,
+                         engine=self.engine,
+                         other_writers=[StorageWriter(None, mode='w')],
+                         extra_info_dict={'n_sim_steps': 10},
+                         walkers=walkers).code
+        compile(code, "run.py", 'exec')
+        assert "storage = None" in code
+        assert "pool.imap_unordered(run_walker" in code
+        assert "    sim.run(10)" not in code  # no single-chain run
+
+    def test_concurrent_halves(self):
+        code = RunPyFile(run_type='TPS', cvs=[self.cv], volumes=self.states,
+                         engine=self.engine, other_writers=[self.storage],
+                         extra_info_dict={'n_sim_steps': 10},
+                         concurrent_halves=ConcurrentHalvesWriter(
+                             self.engine)).code
+        compile(code, "run.py", 'exec')
+        # the two-way scheme replaces the one-way scheme (used to find the
+        # initial conditions) before the sim is made
+        scheme_idx = code.index("scheme = paths.LockedMoveScheme(")
+        assert code.index("= cached_initial_conditions(") < scheme_idx
+        assert scheme_idx < code.index("sim = paths.PathSampling(")
+        # no two-way shooting unless asked for
+        assert "ConcurrentTwoWay" not in self._run_py('TPS').code
+
+    @pytest.mark.parametrize('run_type, resumes', [
+        ('TPS', True), ('TIS', True), ('committor', False)
+    ])
+    def test_checkpoints(self, run_type, resumes):
+        code = RunPyFile(run_type=run_type, cvs=[self.cv],
+                         volumes=self.states, engine=self.engine,
+                         other_writers=[StorageWriter("tps.nc", mode='a')],
+                         extra_info_dict={'n_sim_steps': 10},
+                         checkpoints=CheckpointWriter(10, 5)).code
+        compile(code, "run.py", 'exec')
+        assert ("sim.run_until(10)" in code) == resumes
+        assert ("    sim.run(10)" in code) != resumes
+
+    def test_trial_length(self):
+        code = RunPyFile(run_type='TPS', cvs=[self.cv], volumes=self.states,
+                         engine=self.engine, other_writers=[self.storage],
+                         extra_info_dict={'n_sim_steps': 10},
+                         trial_length=TrialLengthWriter()).code
+        compile(code, "run.py", 'exec')
+        hook_idx = code.index("sim.attach_hook(AdaptiveMaxLength([engine]")
+        assert code.index("sim = paths.PathSampling(") < hook_idx
+        assert hook_idx < code.index("sim.run(10)")
+
+    def test_fuse_cvs(self):
+        code = RunPyFile(run_type='trajectory', cvs=[self.cv],
+                         volumes=self.states, engine=self.engine,
+                         extra_info_dict={'n_sim_steps': ''},
+                         fuse_cvs=True).code
+        compile(code, "run.py", 'exec')
+        assert "from gui_paths.fused_computes import fused_compute" in code
+        assert "cv_1 = paths.FunctionCV('dist', fused_compute" in code
+        assert "\ntrust_gui_paths()\n" in code
+        # reading the code doesn't change the writers' counters
+        FusedComputeCVsWriter.creation_counter = 5
+        run_py = RunPyFile(run_type='trajectory', cvs=[self.cv],
+                           volumes=self.states, engine=self.engine,
+                           extra_info_dict={'n_sim_steps': ''},
+                           fuse_cvs=True)
+        assert run_py.code == run_py.code == code
+        assert FusedComputeCVsWriter.creation_counter == 5
+
+    def test_fused_cvs_storable(self, monkeypatch):
+        pytest.importorskip("openpathsampling")
+        from openpathsampling.netcdfplus import ObjectJSON
+        monkeypatch.setattr(ObjectJSON, 'safe_modules',
+                            list(ObjectJSON.safe_modules))
+        code = RunPyFile(run_type='trajectory', cvs=[self.cv],
+                         volumes=self.states, engine=self.engine,
+                         extra_info_dict={'n_sim_steps': ''},
+                         fuse_cvs=True).code
+        _assert_storable(code, 'fused_compute')
+
+    def test_stored_cvs(self, monkeypatch):
+        cv = CVCodeWriter(name="x", class_name="LAMMPSComputeCV",
+                          groupid_style_args="all com", engine="engine",
+                          value_store="cv_values.db")
+        code = RunPyFile(run_type='trajectory', cvs=[cv],
+                         volumes=self.states, engine=self.engine,
+                         extra_info_dict={'n_sim_steps': ''}).code
+        compile(code, "run.py", 'exec')
+        assert ("from gui_paths.cv_store import stored_cv_value, "
+                "cv_store_key\n") in code
+        assert "\ntrust_gui_paths()\n" in code
+        pytest.importorskip("openpathsampling")
+        from openpathsampling.netcdfplus import ObjectJSON
+        monkeypatch.setattr(ObjectJSON, 'safe_modules',
+                            list(ObjectJSON.safe_modules))
+        _assert_storable(code, 'stored_cv_value')
+
+
+class Recorder(object):
+    """Stand-in OPS object that remembers its arguments"""
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Recorder()
+
+    def __call__(self, *args, **kwargs):
+        return Recorder(*args, **kwargs)
+
+    def __getitem__(self, key):
+        return Recorder()
+
+    def __iter__(self):
+        return iter([])
+
+    def named(self, name):
+        return self
+
+
+class FakeEngine(object):
+    def __init__(self, inputs, options):
+        self.options = dict(options)
+
+    def named(self, name):
+        self.name = name
+        return self
+
+
+class FakeNetwork(Recorder):
+    @classmethod
+    def from_state_pairs(cls, transitions):
+        network = cls(transitions)
+        network.sampling_ensembles = [Recorder()]
+        return network
+
+
+class FakeStorableObject(object):
+    pass
+
+
+class FakeMover(FakeStorableObject):
+    def __init__(self, ensemble, selector, modifier, engine):
+        self.engine = engine
+
+
+class FakeSimulation(Recorder):
+    def __init__(self, *args, **kwargs):
+        super(FakeSimulation, self).__init__(*args, **kwargs)
+        self.hooks = []
+
+    def attach_hook(self, hook):
+        self.hooks.append(hook)
+
+
+def _fake_ops(monkeypatch):
+    paths = types.ModuleType("openpathsampling")
+    for name in ['Storage', 'CVDefinedVolume', 'OneWayShootingMoveScheme',
+                 'LockedMoveScheme', 'RandomChoiceMover', 'UniformSelector',
+                 'NoModification']:
+        setattr(paths, name, Recorder)
+    paths.TPSNetwork = FakeNetwork
+    paths.PathSampling = FakeSimulation
+    paths.pathmover = types.ModuleType("openpathsampling.pathmover")
+    paths.pathmover.AbstractTwoWayShootingMover = FakeMover
+    paths.netcdfplus = types.ModuleType("openpathsampling.netcdfplus")
+    paths.netcdfplus.StorableObject = FakeStorableObject
+    paths.netcdfplus.ObjectJSON = object
+    ops_lammps = types.ModuleType("openpathsampling.engines.lammps")
+    ops_lammps.Engine = FakeEngine
+    ops_lammps.LAMMPSComputeCV = Recorder
+    paths.engines = types.ModuleType("openpathsampling.engines")
+    paths.engines.lammps = ops_lammps
+    for module in [paths, paths.pathmover, paths.netcdfplus, paths.engines,
+                   ops_lammps]:
+        monkeypatch.setitem(sys.modules, module.__name__, module)
+    # reimported with the fake OPS; the setitem makes monkeypatch put back
+    # the real module (or none) afterwards
+    monkeypatch.setitem(sys.modules, "gui_paths.half_shots", None)
+    monkeypatch.delitem(sys.modules, "gui_paths.half_shots")
+
+
+class TestTrialLengthEngines(object):
+    """The cap is set on the engines the shooting movers use"""
+    def setup(self):
+        TestRunPyFile.setup(self)
+
+    def _run_setup(self, monkeypatch, tmpdir, concurrent_halves):
+        pytest.importorskip("numpy")
+        from ..trial_length import AdaptiveMaxLength
+        _fake_ops(monkeypatch)
+        monkeypatch.chdir(tmpdir)
+        tmpdir.join("script.lammps").write("run 0\n")
+        tmpdir.join("init.nc").write("")
+        engines = ["engine"]
+        if concurrent_halves:
+            engines.append("backward_engine")
+            concurrent_halves = ConcurrentHalvesWriter(self.engine)
+        else:
+            concurrent_halves = None
+        code = RunPyFile(run_type='TPS', cvs=[self.cv], volumes=self.states,
+                         engine=self.engine,
+                         other_writers=[self.storage,
+                                        InitialTrajectoryWriter("init.nc")],
+                         extra_info_dict={'n_sim_steps': 10},
+                         concurrent_halves=concurrent_halves,
+                         trial_length=TrialLengthWriter(
+                             min_samples=5, engines=engines
+                         )).code
+        namespace = {'__name__': "run"}
+        exec(compile(code, "run.py", 'exec'), namespace)
+        [hook] = [hook for hook in namespace['sim'].hooks
+                  if isinstance(hook, AdaptiveMaxLength)]
+        for _ in range(5):
+            hook.record_trial(100, accepted=True)
+        assert hook.update_cap()
+        return namespace
+
+    def test_one_way(self, monkeypatch, tmpdir):
+        namespace = self._run_setup(monkeypatch, tmpdir, False)
+        scheme = namespace['sim'].kwargs['move_scheme']
+        engine = scheme.kwargs['engine']
+        assert engine is namespace['engine']
+        assert engine.options['n_frames_max'] == 300
+
+    def test_concurrent_halves(self, monkeypatch, tmpdir):
+        namespace = self._run_setup(monkeypatch, tmpdir, True)
+        scheme = namespace['sim'].kwargs['move_scheme']
+        [mover] = scheme.args[0].args[0]
+        assert mover.engine is namespace['engine']
+        assert mover.backward_engine is namespace['backward_engine']
+        assert mover.engine.options['n_frames_max'] == 300
+        assert mover.backward_engine.options['n_frames_max'] == 300
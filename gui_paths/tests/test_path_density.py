@@ -0,0 +1,163 @@
+import os
+import sys
+import shutil
+import tempfile
+from collections import namedtuple
+
+import pytest
+np = pytest.importorskip("numpy")
+
+from ..path_density import *
+from ..cv_store import CVValueStore
+
+Sample = namedtuple("Sample", ["ensemble", "trajectory"])
+Step = namedtuple("Step", ["active"])
+
+
+class FakeStorage(object):
+    def __init__(self, steps):
+        self.steps = steps
+        self.objects = {}
+
+
+class TestPathHistogram(object):
+    def setup(self):
+        self.edges = [np.linspace(0.0, 4.0, 5)]
+        self.density = PathHistogram(self.edges, per_path=True)
+        self.frames = PathHistogram(self.edges, per_path=False)
+
+    def test_add_path(self):
+        values = [0.5, 0.6, 1.5, 4.0, 5.0, -1.0]
+        self.density.add_path(values, weight=2)
+        self.frames.add_path(values)
+        # out-of-range frames are dropped; 4.0 is in the last bin
+        np.testing.assert_array_equal(self.density.counts, [2, 2, 0, 2])
+        np.testing.assert_array_equal(self.frames.counts, [2, 1, 0, 1])
+        np.testing.assert_allclose(self.density.density(), [1, 1, 0, 1])
+
+    def test_2d(self):
+        hist = PathHistogram([[0.0, 1.0, 2.0], [0.0, 1.0]], per_path=False)
+        hist.add_path([[0.5, 0.5], [1.5, 0.5], [1.5, 0.2]])
+        np.testing.assert_array_equal(hist.counts, [[1], [2]])
+        with pytest.raises(ValueError):
+            hist.add_path([0.5, 1.5])
+
+    def test_free_energy(self):
+        self.frames.add_path([0.5, 1.5, 1.5, 1.5, 1.5])
+        energy = self.frames.free_energy(kT=2.0)
+        np.testing.assert_allclose(energy[:2], [2.0 * np.log(4.0), 0.0])
+        assert np.isinf(energy[2:]).all()
+
+    def test_merge(self):
+        other = PathHistogram(self.edges, per_path=True)
+        self.density.add_path([0.5])
+        self.density.add_steps(0, 10)
+        other.add_path([1.5])
+        other.add_steps(10, 15)
+        merged = self.density + other
+        np.testing.assert_array_equal(merged.counts, [1, 1, 0, 0])
+        assert merged.step_ranges == [(0, 15)]
+        assert merged.n_steps == 15
+        # steps can't be counted twice, and bins must match
+        with pytest.raises(ValueError):
+            merged += other
+        with pytest.raises(ValueError):
+            merged += self.frames
+
+    def test_save_load(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, "hist.npz")
+            self.density.add_path([0.5, 2.5], weight=3)
+            self.density.add_steps(0, 3)
+            self.density.save(filename)
+            loaded = PathHistogram.load(filename)
+        finally:
+            shutil.rmtree(tmpdir)
+        np.testing.assert_array_equal(loaded.counts, self.density.counts)
+        np.testing.assert_array_equal(loaded.edges[0], self.edges[0])
+        assert loaded.per_path
+        assert loaded.n_paths == 3
+        assert loaded.step_ranges == [(0, 3)]
+
+
+def _steps(trajectories):
+    return [Step([Sample("ens", traj)]) for traj in trajectories]
+
+
+def test_active_path_weights():
+    path_a, path_b = [0.5, 1.5], [2.5]
+    steps = _steps([path_a, path_a, path_a, path_b, path_a])
+    weights = list(active_path_weights(steps))
+    assert weights == [(path_a, 3), (path_b, 1), (path_a, 1)]
+
+
+def test_cv_values():
+    values = cv_values([lambda traj: [2 * x for x in traj],
+                        lambda traj: [[x] for x in traj]],
+                       list(range(5)), chunk_size=2)
+    np.testing.assert_array_equal(values[:, 0], [0, 2, 4, 6, 8])
+    np.testing.assert_array_equal(values[:, 1], [0, 1, 2, 3, 4])
+
+
+class StoredCV(object):
+    """Like the wrapper a generated script writes for a value store"""
+    def __init__(self, cv_key):
+        self.computed = []
+        self.kwargs = {'cv_key': cv_key, 'cv': self.compute}
+
+    def compute(self, snapshots):
+        self.computed.extend(snapshots)
+        return [10 * x for x in snapshots]
+
+    def __call__(self, snapshots):
+        raise AssertionError("the wrapper should not be called")
+
+
+def test_cv_values_store(tmpdir):
+    store = CVValueStore(str(tmpdir.join("cv_values.db")), batch_size=2)
+    store.put('key', 1, 99.0)  # a value from the run
+    cv = StoredCV('key')
+    values = cv_values([cv, lambda traj: traj], list(range(5)),
+                       chunk_size=2, store=store)
+    np.testing.assert_array_equal(values[:, 0], [0, 99, 20, 30, 40])
+    np.testing.assert_array_equal(values[:, 1], [0, 1, 2, 3, 4])
+    assert cv.computed == [0, 2, 3, 4]
+    # new values went into the store
+    cv_values([cv], list(range(5)), store=store)
+    assert cv.computed == [0, 2, 3, 4]
+    assert store.get('key', 3) == 30
+    store.close()
+
+
+def test_update_needs_same_bins(monkeypatch, tmpdir, capsys):
+    output = str(tmpdir.join("hist"))
+    PathHistogram([np.linspace(0.0, 1.0, 11)]).save(output + "_density")
+    for bins, limits in [("10", ["0", "2"]), ("20", ["0", "1"])]:
+        monkeypatch.setattr(sys, 'argv', [
+            "path_density", "tps.nc", output, "--cv", "x", "--bins", bins,
+            "--range"] + limits + ["--update"])
+        with pytest.raises(SystemExit):
+            main()
+        assert "differ from the histograms" in capsys.readouterr().err
+
+
+def test_histogram_steps_split():
+    # histograms of step ranges add up to the histogram of all steps,
+    # even with a path active across the split
+    paths = [[0.5, 1.5], [0.5, 1.5], [2.5, 3.5], [2.5, 3.5], [1.5]]
+    storage = FakeStorage(_steps(paths))
+    cvs = [lambda traj: traj]
+    edges = [np.linspace(0.0, 4.0, 5)]
+    density, frames = histogram_steps(storage, cvs, edges, 0, 5,
+                                      batch_size=2)
+    split = [histogram_steps(storage, cvs, edges, lo, hi)
+             for lo, hi in step_chunks(0, 5, 2)]
+    assert step_chunks(0, 5, 2) == [(0, 2), (2, 5)]
+    np.testing.assert_array_equal(density.counts, [2, 3, 2, 2])
+    np.testing.assert_array_equal(frames.counts, [2, 3, 2, 2])
+    np.testing.assert_array_equal((split[0][0] + split[1][0]).counts,
+                                  density.counts)
+    np.testing.assert_array_equal((split[0][1] + split[1][1]).counts,
+                                  frames.counts)
+    assert density.n_paths == 5
@@ -0,0 +1,185 @@
+import os
+import ast
+import shutil
+import inspect
+import tempfile
+
+import pytest
+
+from ..code_writers import *
+from ..output_run_py import RunPyFile
+from ..preflight import *
+from .. import preflight as preflight_module
+
+
+class TestPreflight(object):
+    def setup(self):
+        CVCodeWriter.creation_counter = 0
+        VolumeCodeWriter.creation_counter = 0
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, "script.lammps"), 'w') as f:
+            f.write("group mobile type 1\nrun 0\n")
+        for name in ["trajectory.nc", "initial_snapshots.nc"]:
+            open(os.path.join(self.tmpdir, name), 'w').close()
+        self.cv = CVCodeWriter(name="dist", class_name="LAMMPSComputeCV",
+                               groupid_style_args="mobile com",
+                               extract_style=0, extract_type=1)
+        self.states = [
+            VolumeCodeWriter(class_name="CVDefinedVolume", is_state=True,
+                             name=name, collectivevariable="cv_1",
+                             lambda_min=l_min, lambda_max=l_max)
+            for (name, l_min, l_max) in [("A", 0.0, 1.0), ("B", 2.0, 3.0)]
+        ]
+        self.engine = EngineWriter("script.lammps")
+
+    def teardown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _code(self, run_type, n_sim_steps=10, init_cond=None, **kwargs):
+        if init_cond is None:
+            init_cond = {
+                'committor': InitialSnapshotsWriter("initial_snapshots.nc"),
+            }.get(run_type, InitialTrajectoryWriter("trajectory.nc"))
+        other_writers = [StorageWriter("out.nc", mode='w'), init_cond]
+        if run_type == 'committor':
+            other_writers.append(RandomizerWriter(1.0))
+        if run_type == 'TIS':
+            InterfaceSetWriter.creation_counter = 0
+            kwargs['interface_sets'] = [
+                InterfaceSetWriter(self.states[0], "cv_1", [1.0, 1.5])
+            ]
+        return RunPyFile(run_type=run_type, cvs=[self.cv],
+                         volumes=self.states, engine=self.engine,
+                         other_writers=other_writers,
+                         extra_info_dict={'n_sim_steps': n_sim_steps},
+                         **kwargs).code
+
+    @pytest.mark.parametrize('run_type', ['TPS', 'TIS', 'committor',
+                                          'trajectory'])
+    def test_generated_code_passes(self, run_type):
+        n_sim_steps = '' if run_type == 'trajectory' else 10
+        code = self._code(run_type, n_sim_steps=n_sim_steps)
+        assert preflight(code, self.tmpdir) == []
+
+    def test_options_pass(self):
+        trial_length = TrialLengthWriter(
+            engines=["engine", "backward_engine"]
+        )
+        code = self._code(
+            'TPS', fuse_cvs=True,
+            walkers=WalkersWriter(2, "tps.nc", 10, resume=True,
+                                  trial_length=trial_length),
+            concurrent_halves=ConcurrentHalvesWriter(self.engine),
+            trial_length=trial_length
+        )
+        assert preflight(code, self.tmpdir) == []
+
+    def test_nothing_written(self):
+        code = self._code('TPS', checkpoints=CheckpointWriter(10))
+        preflight(code, self.tmpdir)
+        assert sorted(os.listdir(self.tmpdir)) == [
+            "initial_snapshots.nc", "script.lammps", "trajectory.nc"
+        ]
+
+    def test_undefined_name(self):
+        problems = preflight(self._code('committor', n_sim_steps="TODO"),
+                             self.tmpdir)
+        assert problems == ["name 'TODO' is never defined"]
+
+    def test_missing_files(self):
+        code = self._code(
+            'committor', init_cond=InitialSnapshotsWriter("missing.nc")
+        )
+        problems = preflight(code, self.tmpdir)
+        assert len(problems) == 1
+        assert problems[0].endswith("file not found: missing.nc")
+
+        self.engine.script = "missing.lammps"
+        problems = preflight(self._code('TPS'), self.tmpdir)
+        assert problems == ["line 4: file not found: missing.lammps"]
+
+    def test_invalid_parameters(self):
+        self.cv.kwargs['groupid_style_args'] = "solvent com"
+        self.cv.kwargs['extract_type'] = 3
+        self.states[1].kwargs['lambda_max'] = 1.5
+        self.engine.options['n_frames_max'] = 0
+        problems = preflight(self._code('TPS'), self.tmpdir)
+        assert len(problems) == 4
+        assert "n_frames_max must be a positive integer" in problems[0]
+        assert "group 'solvent' is not defined" in problems[1]
+        assert "extract_type must be 0, 1, or 2" in problems[2]
+        assert "volume is empty" in problems[3]
+
+    def test_unknown_engine_option(self):
+        self.engine.options['snapshot_exchange'] = 'view'
+        problems = preflight(self._code('TPS'), self.tmpdir)
+        assert len(problems) == 1
+        assert "unknown option 'snapshot_exchange'" in problems[0]
+
+    def test_committor_engine(self):
+        code = self._code('committor')
+        assert "    engine=engine,\n" in code
+        problems = preflight(code.replace("    engine=engine,\n", ""),
+                             self.tmpdir)
+        assert len(problems) == 1
+        assert "CommittorSimulation: no engine" in problems[0]
+
+    def test_storage_default_mode(self):
+        # without a mode, OPS appends, so the file must exist
+        code = "import openpathsampling as paths\n"
+        code += "storage = paths.Storage('trajectory.nc')\n"
+        code += "output = paths.Storage('out.nc')\n"
+        problems = preflight(code, self.tmpdir)
+        assert problems == ["line 3: file not found: out.nc"]
+
+    def test_signatures(self):
+        code = "import openpathsampling as paths\n"
+        code += "storage = paths.Storage('out.nc', mode='w', extra=1)\n"
+        code += "from gui_paths.progress import ProgressHook\n"
+        code += "hook = ProgressHook(min_interval=1.0, color=True)\n"
+        code += "network = paths.NoSuchNetwork()\n"
+        problems = preflight(code, self.tmpdir)
+        assert len(problems) == 3
+        assert problems[0].startswith("line 2: openpathsampling.Storage")
+        assert problems[1].startswith("line 4: gui_paths.progress.Progre")
+        assert "NoSuchNetwork" in problems[2]
+
+
+def _parameters(signature):
+    """Names, kinds, and whether there is a default, for comparisons"""
+    return [(param.name, param.kind, param.default is param.empty)
+            for param in signature.parameters.values()]
+
+
+@pytest.mark.parametrize('source', [
+    "def f(a, b=[1], *args, c, d=2, **kwargs): pass",
+    "def f(a, *, b=None): pass",
+    "def f(): pass",
+])
+def test_ast_params(source):
+    namespace = {}
+    exec(source, namespace)
+    node = ast.parse(source).body[0]
+    assert (_parameters(preflight_module._signature(
+        preflight_module._ast_params(node.args)
+    )) == _parameters(inspect.signature(namespace['f'])))
+
+
+@pytest.mark.parametrize('module_name, api', [
+    ('openpathsampling', OPS_API),
+    ('openpathsampling.engines.lammps', OPS_LAMMPS_API),
+])
+def test_api_matches_ops(module_name, api):
+    module = pytest.importorskip(module_name)
+    mismatched = []
+    for name, params in api.items():
+        obj = module
+        for attr in name.split("."):
+            obj = getattr(obj, attr, None)
+        if obj is None:
+            mismatched.append(name + ": missing")
+            continue
+        expected = _parameters(preflight_module._signature(params))
+        if _parameters(inspect.signature(obj)) != expected:
+            mismatched.append(name + ": " + str(inspect.signature(obj)))
+    assert mismatched == []
@@ -0,0 +1,75 @@
+import io
+
+import pytest
+
+from ..progress import *
+
+
+class FakeSample(object):
+    def __init__(self, length):
+        self.trajectory = [None] * length
+
+
+class FakeChange(object):
+    def __init__(self, trials):
+        self.trials = [FakeSample(length) for length in trials]
+
+
+class FakeStep(object):
+    def __init__(self, trials, active=(50,)):
+        self.change = FakeChange(trials)
+        self.active = [FakeSample(length) for length in active]
+
+
+def test_format_and_parse():
+    line = format_progress(120, 0.53, 245)
+    assert line == "#progress step=120 rate=0.53 length=245"
+    assert parse_progress(line) == {'step': 120, 'rate': 0.53,
+                                    'length': 245}
+
+
+@pytest.mark.parametrize('line', [
+    "Working on Monte Carlo cycle number 3",
+    "#progressive step=1 rate=1 length=1",
+    "#progress step=1 length=1",
+    "#progress step=one rate=1 length=1",
+])
+def test_parse_other_lines(line):
+    assert parse_progress(line) is None
+
+
+class TestProgressHook(object):
+    def setup(self):
+        self.stream = io.StringIO()
+
+    def _run(self, hook, steps):
+        hook.before_simulation(sim=None)
+        for number, step in enumerate(steps):
+            hook.after_step(None, number, (number, len(steps)), None, step,
+                            None)
+        return [parse_progress(line)
+                for line in self.stream.getvalue().splitlines()]
+
+    def test_path_length(self):
+        hook = ProgressHook(stream=self.stream, min_interval=0.0)
+        progress = self._run(hook, [FakeStep([80, 120]), FakeStep([])])
+        assert [p['step'] for p in progress] == [0, 1]
+        assert progress[0]['length'] == 120  # longest trial
+        assert progress[1]['length'] == 50  # no trials: active path
+
+    def test_min_interval(self):
+        hook = ProgressHook(stream=self.stream, min_interval=3600.0)
+        progress = self._run(hook, [FakeStep([10])] * 5)
+        assert len(progress) == 1
+
+
+def test_history_is_bounded():
+    history = ProgressHistory(max_points=10)
+    for step in range(1000):
+        history.append(step, 2 * step)
+    assert len(history) <= 10
+    assert history.steps[0] == 0
+    assert history.values == [2 * step for step in history.steps]
+    # points stay evenly spaced
+    spacing = set(b - a for a, b in zip(history.steps, history.steps[1:]))
+    assert spacing == {history.stride}
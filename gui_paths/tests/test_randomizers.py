@@ -0,0 +1,160 @@
+import sys
+import types
+import importlib
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+
+class FakeSnapshotModifier(object):
+    pass
+
+
+@pytest.fixture
+def randomizers(monkeypatch):
+    """The randomizers module, with a stand-in for OPS if it's missing"""
+    try:
+        import openpathsampling
+    except ImportError:
+        fake_ops = types.ModuleType("openpathsampling")
+        fake_modifiers = types.ModuleType("openpathsampling.snapshot_modifier")
+        fake_modifiers.SnapshotModifier = FakeSnapshotModifier
+        fake_ops.snapshot_modifier = fake_modifiers
+        monkeypatch.setitem(sys.modules, 'openpathsampling', fake_ops)
+        monkeypatch.setitem(sys.modules, fake_modifiers.__name__,
+                            fake_modifiers)
+        name = __package__.rsplit('.', 1)[0] + ".randomizers"
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    return importlib.import_module("..randomizers", __package__)
+
+
+class FakeSnapshot(object):
+    def __init__(self, velocities):
+        self.velocities = velocities
+
+    def copy_with_replacement(self, velocities):
+        return FakeSnapshot(velocities)
+
+
+class FakeLAMMPS(object):
+    """Two atom types, with masses 1 and 4; the types alternate"""
+    def __init__(self, n_atoms):
+        self.commands = []
+        self.numpy = self
+        self.atoms = {'rmass': None,
+                      'type': np.arange(n_atoms) % 2 + 1,
+                      'mass': np.array([0.0, 1.0, 4.0])}
+
+    def command(self, cmd):
+        self.commands.append(cmd)
+
+    def extract_global(self, name):
+        return {'boltz': 2.0, 'mvv2e': 0.5}[name]
+
+    def extract_atom(self, name):
+        return self.atoms[name]
+
+
+class FakeEngine(object):
+    def __init__(self, n_atoms=4):
+        self.lammps = FakeLAMMPS(n_atoms)
+        self.loads = []
+        self.n_reads = 0
+
+    @property
+    def current_snapshot(self):
+        self.n_reads += 1
+        return "state after " + self.lammps.commands[-1]
+
+    @current_snapshot.setter
+    def current_snapshot(self, snapshot):
+        self.loads.append(snapshot)
+
+
+def _seeds(commands):
+    return [int(cmd.split()[4]) for cmd in commands]
+
+
+class TestLAMMPSVelocityRandomizer(object):
+    def test_commands(self, randomizers):
+        engine = FakeEngine()
+        randomizer = randomizers.LAMMPSVelocityRandomizer(
+            engine, temperature=300.0, seed=1, group="mobile"
+        )
+        result = randomizer("snap")
+        # one load and one read-back per shot, nothing per atom
+        assert engine.loads == ["snap"]
+        assert engine.n_reads == 1
+        [cmd] = engine.lammps.commands
+        assert result == "state after " + cmd
+        assert cmd.startswith("velocity mobile create 300.0 ")
+        assert cmd.endswith(" dist gaussian mom yes rot no")
+        assert 0 < _seeds([cmd])[0] < 2**31
+
+    def test_seeds(self, randomizers):
+        def seeds(seed, n_shots=5):
+            engine = FakeEngine()
+            randomizer = randomizers.LAMMPSVelocityRandomizer(
+                engine, temperature=1.0, seed=seed
+            )
+            for _ in range(n_shots):
+                randomizer("snap")
+            return _seeds(engine.lammps.commands)
+
+        # reproducible for a given seed
+        assert seeds(1) == seeds(1)
+        assert len(set(seeds(1))) == 5
+        # neighbouring seeds don't share shots, unlike seed + shot
+        assert not set(seeds(1)) & set(seeds(2))
+        # without a seed, every run is different
+        assert seeds(None) != seeds(None)
+
+
+@pytest.mark.parametrize('class_name, kwargs', [
+    ('LAMMPSVelocityRandomizer', {'seed': 3, 'group': "mobile"}),
+    ('VectorizedVelocityRandomizer', {'seed': 3}),
+])
+def test_storable(class_name, kwargs):
+    # saved with the move scheme or committor simulation that uses it
+    pytest.importorskip("openpathsampling")
+    from .. import randomizers
+    cls = getattr(randomizers, class_name)
+    randomizer = cls(engine="engine", temperature=2.0, **kwargs)
+    dct = randomizer.to_dict()
+    assert not any(key.startswith('_') for key in dct)
+    reloaded = cls.from_dict(dct)
+    for key, value in dict(kwargs, temperature=2.0).items():
+        assert getattr(reloaded, key) == value
+
+
+class TestVectorizedVelocityRandomizer(object):
+    def test_maxwell_boltzmann(self, randomizers):
+        n_atoms = 20000
+        engine = FakeEngine(n_atoms)
+        randomizer = randomizers.VectorizedVelocityRandomizer(
+            engine, temperature=3.0, seed=5
+        )
+        snapshot = FakeSnapshot(np.zeros((n_atoms, 3)))
+        velocities = randomizer(snapshot).velocities
+        assert velocities.shape == (n_atoms, 3)
+        assert engine.lammps.commands == []
+        # variance kT / (mvv2e * m) = 2.0 * 3.0 / (0.5 * m)
+        for atom_type, mass in [(1, 1.0), (2, 4.0)]:
+            variance = velocities[atom_type - 1::2].var()
+            assert variance == pytest.approx(12.0 / mass, rel=0.03)
+        masses = np.where(np.arange(n_atoms) % 2, 4.0, 1.0)[:, np.newaxis]
+        momentum = (masses * velocities).sum(axis=0)
+        np.testing.assert_allclose(momentum, 0.0, atol=1e-8)
+        # the original snapshot is not changed
+        assert not snapshot.velocities.any()
+
+    def test_seeds(self, randomizers):
+        def velocities(seed):
+            randomizer = randomizers.VectorizedVelocityRandomizer(
+                FakeEngine(), temperature=1.0, seed=seed
+            )
+            return randomizer(FakeSnapshot(np.zeros((4, 3)))).velocities
+
+        np.testing.assert_array_equal(velocities(3), velocities(3))
+        assert not np.array_equal(velocities(3), velocities(4))
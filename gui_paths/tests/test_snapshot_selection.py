@@ -0,0 +1,110 @@
+import sys
+import types
+
+import pytest
+np = pytest.importorskip("numpy")
+
+from ..snapshot_selection import *
+
+
+def test_window_mask():
+    mask = window_mask([0.1, 0.5, 0.9, 0.4], 0.3, 0.6)
+    np.testing.assert_array_equal(mask, [False, True, False, True])
+
+
+def test_thin_indices():
+    mask = np.array([True, True, False, True, False, True, True, True])
+    np.testing.assert_array_equal(thin_indices(mask, 1), [0, 1, 3, 5, 6, 7])
+    np.testing.assert_array_equal(thin_indices(mask, 3), [0, 3, 6])
+    # spacing counts from the last frame kept, not from block boundaries
+    mask = np.zeros(30, dtype=bool)
+    mask[[9, 10, 18, 19, 29]] = True
+    np.testing.assert_array_equal(thin_indices(mask, 10), [9, 19, 29])
+    assert len(thin_indices(np.zeros(5, dtype=bool), 2)) == 0
+
+
+def cv(traj):
+    return [float(frame) for frame in traj]
+
+
+def test_select_snapshots():
+    trajectories = [list(range(10)), list(range(5, 15))]
+    selected = select_snapshots(trajectories, cv, 4, 8, stride=2)
+    assert list(selected) == [4, 6, 8, 5, 7]
+    assert list(select_snapshots(trajectories, cv, 4, 8, stride=2,
+                                 max_per_path=1)) == [4, 5]
+    assert list(select_snapshots(trajectories, cv, 4, 8, stride=2,
+                                 max_snapshots=4)) == [4, 6, 8, 5]
+
+
+def test_select_snapshots_streams():
+    def trajectories():
+        yield list(range(10))
+        raise AssertionError("read past max_snapshots")
+
+    selected = select_snapshots(trajectories(), cv, 0, 9, stride=1,
+                                max_snapshots=3)
+    assert list(selected) == [0, 1, 2]
+
+
+class FakeObject(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeStorage(object):
+    opened = {}
+
+    def __init__(self, filename, mode='r'):
+        self.filename = filename
+        self.saved = []
+        self.events = []
+        self.objects = {}
+        self.opened[filename] = self
+
+    def save(self, obj):
+        self.saved.append(list(obj))
+        self.events.append('save')
+
+    def sync_all(self):
+        self.events.append('sync')
+
+    def close(self):
+        self.events.append('close')
+
+
+def test_write_snapshot_set(monkeypatch):
+    def step(trajectory, accepted=True):
+        sample = FakeObject(trajectory=trajectory)
+        return FakeObject(active=[sample],
+                          change=FakeObject(accepted=accepted,
+                                            trials=[sample]))
+
+    steps = [step(list(range(10))), step(list(range(20, 30))),
+             step(list(range(5)), accepted=False)]
+
+    class TPSStorage(FakeStorage):
+        def __init__(self, filename, mode='r'):
+            super(TPSStorage, self).__init__(filename, mode)
+            self.steps = steps
+            self.cvs = {'x': cv}
+
+    def storage(filename, mode='r'):
+        cls = TPSStorage if mode == 'r' else FakeStorage
+        return cls(filename, mode)
+
+    fake_ops = types.ModuleType("openpathsampling")
+    fake_ops.Storage = storage
+    fake_ops.Trajectory = list
+    object_json = types.SimpleNamespace(safe_modules=[])
+    fake_ops.netcdfplus = types.SimpleNamespace(ObjectJSON=object_json)
+    monkeypatch.setitem(sys.modules, 'openpathsampling', fake_ops)
+    n_snapshots = write_snapshot_set("tps.nc", "snapshots.nc", 'x',
+                                     lambda_min=2, lambda_max=25,
+                                     stride=2, chunk_size=3)
+    assert n_snapshots == 7
+    out = FakeStorage.opened["snapshots.nc"]
+    assert out.saved == [[2, 4, 6], [8, 20, 22], [24]]
+    # each chunk is synced as soon as it is full
+    assert out.events == ['save', 'sync'] * 3 + ['close']
+    assert FakeStorage.opened["tps.nc"].events == ['close']
@@ -0,0 +1,327 @@
+import os
+import sys
+import json
+import types
+
+import pytest
+
+from ..snippets import SETUP_CACHE, PROGRESS_HOOK, TPS_SETUP
+from ..code_writers import (StorageWriter, CheckpointWriter, WalkersWriter,
+                            TrialLengthWriter)
+
+
+class FakeSnapshot(object):
+    def __init__(self, name, reversed_=None):
+        self.name = name
+        self._reversed = reversed_
+
+    @property
+    def reversed(self):
+        if self._reversed is None:
+            self._reversed = FakeSnapshot(self.name + "'", self)
+        return self._reversed
+
+
+class FakeTrajectory(list):
+    @property
+    def reversed(self):
+        return FakeTrajectory(snap.reversed for snap in reversed(self))
+
+
+class FakeSample(object):
+    def __init__(self, replica, trajectory, ensemble):
+        self.replica = replica
+        self.trajectory = trajectory
+        self.ensemble = ensemble
+
+
+class FakeEnsemble(object):
+    def __init__(self):
+        self.accepts = True
+
+    def __call__(self, trajectory):
+        return self.accepts
+
+
+class FakeScheme(object):
+    """Needs a sample for each ensemble, and finds the given ones"""
+    def __init__(self, ensembles, samples):
+        self.ensembles = ensembles
+        self.samples = samples
+        self.n_calls = 0
+
+    def _missing(self, sample_set):
+        found = [sample.ensemble for sample in sample_set]
+        return [ens for ens in self.ensembles if ens not in found]
+
+    def check_initial_conditions(self, sample_set):
+        return [[ens] for ens in self._missing(sample_set)], []
+
+    def assert_initial_conditions(self, sample_set):
+        assert self._missing(sample_set) == [], "Bad initial conditions."
+
+    def initial_conditions_from_trajectories(self, trajectory,
+                                             sample_set=None,
+                                             strategies=None, engine=None):
+        assert engine == "engine"
+        assert 'extend-complex' in strategies
+        self.n_calls += 1
+        sample_set = list(sample_set or [])
+        missing = self._missing(sample_set)
+        return sample_set + [sample for sample in self.samples
+                             if sample.ensemble in missing]
+
+
+class TestSetupCache(object):
+    def setup(self):
+        fake_ops = types.ModuleType("openpathsampling")
+        fake_ops.Trajectory = FakeTrajectory
+        fake_ops.Sample = FakeSample
+        fake_ops.SampleSet = list
+        self.namespace = {'os': os, 'paths': fake_ops}
+        exec(SETUP_CACHE, self.namespace)
+        self.trajectory = FakeTrajectory(FakeSnapshot(str(idx))
+                                         for idx in range(6))
+        self.network = types.SimpleNamespace(
+            all_ensembles=[FakeEnsemble(), FakeEnsemble()]
+        )
+        ens_0, ens_1 = self.network.all_ensembles
+        self.scheme = FakeScheme(self.network.all_ensembles, [
+            FakeSample(0, FakeTrajectory(self.trajectory[1:4]), ens_0),
+            # e.g., a reversed copy for the reverse transition
+            FakeSample(1, FakeTrajectory(self.trajectory[2:5]).reversed,
+                       ens_1),
+        ])
+
+    def _initial_conditions(self, inputs):
+        return self.namespace['cached_initial_conditions'](
+            "tps_setup", "abc", inputs, self.network, self.scheme,
+            self.trajectory, "engine"
+        )
+
+    def _frames(self, sample):
+        return [snap.name for snap in sample.trajectory]
+
+    def test_cache_round_trip(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        tmpdir.join("script.lammps").write("units lj\n")
+        built = self._initial_conditions(["script.lammps"])
+        cache_files = tmpdir.listdir("tps_setup_*.json")
+        assert len(cache_files) == 1
+        assert json.loads(cache_files[0].read())[1] == {
+            'ensemble': 1, 'replica': 1, 'frames': [2, 3, 4],
+            'reversed': True
+        }
+        loaded = self._initial_conditions(["script.lammps"])
+        assert self.scheme.n_calls == 1
+        assert [self._frames(s) for s in loaded] == [
+            self._frames(s) for s in built
+        ] == [['1', '2', '3'], ["4'", "3'", "2'"]]
+        assert [s.ensemble for s in loaded] == [s.ensemble for s in built]
+        assert [s.replica for s in loaded] == [0, 1]
+        # only frames from this script's trajectory are used
+        assert loaded[0].trajectory[0] is self.trajectory[1]
+
+    def test_changed_input(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        tmpdir.join("script.lammps").write("units lj\n")
+        self._initial_conditions(["script.lammps"])
+        tmpdir.join("script.lammps").write("units real\n")
+        self._initial_conditions(["script.lammps"])
+        assert self.scheme.n_calls == 2
+        assert len(tmpdir.listdir("tps_setup_*.json")) == 2
+
+    def test_sample_not_in_ensemble(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        self._initial_conditions([])
+        self.network.all_ensembles[0].accepts = False
+        self._initial_conditions([])
+        assert self.scheme.n_calls == 2
+
+    def test_not_from_trajectory(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        # e.g., a minus ensemble sample, extended with the engine
+        minus = FakeEnsemble()
+        self.network.all_ensembles.append(minus)
+        extended = FakeTrajectory(self.trajectory[4:] + [FakeSnapshot("x")])
+        self.scheme.samples.append(FakeSample(2, extended, minus))
+        built = self._initial_conditions([])
+        assert len(built) == 3
+        # the other samples are cached; that one is made again
+        [cache_file] = tmpdir.listdir("tps_setup_*")
+        assert len(json.loads(cache_file.read())) == 2
+        loaded = self._initial_conditions([])
+        assert self.scheme.n_calls == 2
+        assert [s.ensemble for s in loaded] == [s.ensemble for s in built]
+
+    def test_incomplete(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        del self.scheme.samples[1]
+        with pytest.raises(AssertionError):
+            self._initial_conditions([])
+        assert tmpdir.listdir("tps_setup_*") == []
+
+
+def _double_well():
+    """OPS, a toy engine on a 1D double well, a trajectory from A to B,
+    and the states A and B, defined with the CV x"""
+    paths = pytest.importorskip("openpathsampling")
+    np = pytest.importorskip("numpy")
+    toys = pytest.importorskip("openpathsampling.engines.toy")
+    pes = (toys.OuterWalls([1.0], [0.0])
+           + toys.Gaussian(2.0, [4.0], [0.0]))
+    topology = toys.Topology(n_spatial=1, masses=[1.0], pes=pes)
+    engine = toys.Engine(
+        {'integ': toys.LeapfrogVerletIntegrator(0.02),
+         'n_frames_max': 5000, 'n_steps_per_frame': 5},
+        topology
+    ).named('engine')
+    # from A to B, slowly enough that paths leaving a state fall back
+    trajectory = paths.Trajectory([
+        toys.Snapshot(coordinates=np.array([[x]]),
+                      velocities=np.array([[0.3]]), engine=engine)
+        for x in np.arange(-0.85, 0.9, 0.1)
+    ])
+    x = paths.FunctionCV("x", lambda snap: snap.xyz[0][0])
+    state_a = paths.CVDefinedVolume(x, float("-inf"), -0.6).named("A")
+    state_b = paths.CVDefinedVolume(x, 0.6, float("inf")).named("B")
+    return paths, engine, trajectory, x, state_a, state_b
+
+
+class TestSetupCacheMSTIS(object):
+    """The setup cache with OPS, for TIS on a 1D double well"""
+    def setup(self):
+        paths, self.engine, self.trajectory, x, state_a, state_b = \
+            _double_well()
+        self.network = paths.MSTISNetwork([
+            (state_a, paths.VolumeInterfaceSet(x, float("-inf"),
+                                               [-0.6, -0.4])),
+            (state_b, paths.VolumeInterfaceSet(x, [0.6, 0.4],
+                                               float("inf"))),
+        ])
+        self.scheme = paths.DefaultScheme(self.network, self.engine)
+        self.namespace = {'os': os, 'paths': paths}
+        exec(SETUP_CACHE, self.namespace)
+
+    def test_minus_ensembles(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        for _ in range(2):
+            initial_conditions = self.namespace['cached_initial_conditions'](
+                "tis_setup", "abc", [], self.network, self.scheme,
+                self.trajectory, self.engine
+            )
+            # the minus ensembles can only be filled by running the engine
+            self.scheme.assert_initial_conditions(initial_conditions)
+        [cache_file] = tmpdir.listdir("tis_setup_*")
+        n_ensembles = len(self.scheme.list_initial_ensembles())
+        n_minus = len(self.network.minus_ensembles)
+        assert len(json.loads(cache_file.read())) == n_ensembles - n_minus
+
+
+class TestResumeTPS(object):
+    """A TPS run with checkpoints, killed and run again, with OPS"""
+    def setup(self):
+        (self.paths, self.engine, self.trajectory, _,
+         state_a, state_b) = _double_well()
+        self.transitions = [(state_a, state_b)]
+        checkpoints = CheckpointWriter(n_sim_steps=0, checkpoint_frequency=2)
+        setup = TPS_SETUP.format(setup_hash="abc", setup_inputs="[]",
+                                 shooting="")
+        self.code = (StorageWriter("tps.nc", mode='a').code + "\n"
+                     + SETUP_CACHE + checkpoints.setup_code(setup, ["engine"]))
+        self.checkpoints = checkpoints
+
+    def _run(self, n_sim_steps):
+        namespace = {'__name__': "__main__", 'os': os, 'paths': self.paths,
+                     'engine': self.engine, 'trajectory': self.trajectory,
+                     'transitions': self.transitions}
+        self.checkpoints.n_sim_steps = n_sim_steps
+        exec(self.code + self.checkpoints.code, namespace)
+        namespace['storage'].close()
+        return namespace
+
+    def test_resume(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        self._run(3)
+        namespace = self._run(5)
+        storage = self.paths.Storage("tps.nc", mode='r')
+        # one scheme, and the steps of both runs, in order
+        assert len(storage.schemes) == 1
+        assert [step.mccycle for step in storage.steps] == list(range(6))
+        storage.close()
+        # the engine name is the engine the loaded scheme runs
+        sim = namespace['sim']
+        assert sim.move_scheme.network.initial_states[0].name == "A"
+        movers = sim.move_scheme.movers['shooting']
+        assert all(mover.engine is namespace['engine'] for mover in movers)
+        assert namespace['engine'] is not self.engine
+
+
+class TestWalkersTPS(object):
+    """TPS walkers, each run in this process, with OPS"""
+    def setup(self):
+        TestResumeTPS.setup(self)
+        setup = TPS_SETUP.format(setup_hash="abc", setup_inputs="[]",
+                                 shooting="")
+        self.code = "storage = None\n" + SETUP_CACHE + setup
+
+    def _walker(self, walker, n_sim_steps, resume=False):
+        walkers = WalkersWriter(n_walkers=2, output_file="tps.nc",
+                                n_sim_steps=n_sim_steps, seed=3,
+                                resume=resume,
+                                trial_length=TrialLengthWriter())
+        namespace = {'__name__': "run", 'os': os, 'paths': self.paths,
+                     'engine': self.engine, 'trajectory': self.trajectory,
+                     'transitions': self.transitions}
+        exec(self.code + walkers.code, namespace)
+        namespace['run_walker'](walker)
+        return namespace
+
+    def _shooting_points(self, walker):
+        storage = self.paths.Storage("tps_walker_{}.nc".format(walker),
+                                     mode='r')
+        # rounded, since the storage saves single precision
+        points = [round(float(step.change.canonical.details
+                              .shooting_snapshot.xyz[0][0]), 5)
+                  for step in storage.steps[1:]]
+        storage.close()
+        return points
+
+    def test_seeds(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        points = []
+        for walker in [0, 1, 0]:
+            self._walker(walker, 8)
+            points.append(self._shooting_points(walker))
+        assert points[0] == points[2]
+        assert points[0] != points[1]
+
+    def test_resume(self, tmpdir, monkeypatch):
+        monkeypatch.chdir(tmpdir)
+        self._walker(0, 3)
+        namespace = self._walker(0, 5, resume=True)
+        storage = self.paths.Storage("tps_walker_0.nc", mode='r')
+        assert len(storage.schemes) == 1
+        assert [step.mccycle for step in storage.steps] == list(range(6))
+        storage.close()
+        # rebound to the saved engine, for the trial length hook
+        assert namespace['engine'] is not self.engine
+        assert namespace['engine'].name == "engine"
+
+
+class FakeSim(object):
+    def __init__(self):
+        self.hooks = []
+
+    def attach_hook(self, hook):
+        self.hooks.append(hook)
+
+
+@pytest.mark.parametrize('installed', [True, False])
+def test_progress_hook_optional(monkeypatch, installed):
+    if not installed:
+        # makes the import fail, as it does where gui_paths isn't installed
+        monkeypatch.setitem(sys.modules, 'gui_paths.progress', None)
+    sim = FakeSim()
+    exec(PROGRESS_HOOK, {'sim': sim})
+    assert len(sim.hooks) == int(installed)
@@ -0,0 +1,170 @@
+import os
+import sys
+import types
+
+import pytest
+
+from ..storage_tools import *
+from .. import storage_tools
+
+
+class FakeCache(dict):
+    pass
+
+
+class FakeStore(list):
+    def __init__(self, objects=()):
+        super(FakeStore, self).__init__(objects)
+        self.cache = FakeCache()
+
+    def __getitem__(self, idx):
+        obj = super(FakeStore, self).__getitem__(idx)
+        self.cache[idx] = obj
+        return obj
+
+
+class FakeStorage(object):
+    """In-memory stand-in for an OPS storage, shared between "files"."""
+    files = {}
+
+    def __init__(self, filename, mode='r'):
+        self.filename = filename
+        if mode == 'w':
+            self.files[filename] = {name: FakeStore()
+                                    for name in (SIMULATION_STORES
+                                                 + BULK_STORES)}
+        self.objects = self.files[filename]
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['objects'][name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def save(self, obj):
+        store_name, _ = obj
+        store = self.objects[store_name]
+        store.cache[len(store)] = obj
+        store.append(obj)
+
+    def sync_all(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _fake_ops(storage_class):
+    fake_ops = types.ModuleType("openpathsampling")
+    fake_ops.Storage = storage_class
+    object_json = types.SimpleNamespace(safe_modules=['numpy'])
+    fake_ops.netcdfplus = types.SimpleNamespace(ObjectJSON=object_json)
+    return fake_ops
+
+
+class TestMergeStorages(object):
+    def setup(self):
+        FakeStorage.files = {}
+        self.fake_ops = _fake_ops(FakeStorage)
+        self.shared = ('engines', 'engine')
+        for filename, n_steps in [("a.nc", 3), ("b.nc", 2)]:
+            storage = FakeStorage(filename, mode='w')
+            storage.save(self.shared)
+            for step in range(n_steps):
+                storage.save(('steps', filename + str(step)))
+
+    def _merge(self, monkeypatch, tmpdir, **kwargs):
+        monkeypatch.setitem(sys.modules, 'openpathsampling', self.fake_ops)
+        output = str(tmpdir.join("merged.nc"))
+        report = merge_storages(output, ["a.nc", "b.nc"], **kwargs)
+        return FakeStorage.files[output], report
+
+    def test_dedup_across_inputs(self, monkeypatch, tmpdir):
+        merged, report = self._merge(monkeypatch, tmpdir)
+        assert list(merged['engines']) == [self.shared]
+        assert len(merged['steps']) == 5
+        assert report.copied == {'engines': 1, 'steps': 5}
+        assert report.skipped == {'engines': 1}
+        assert "engines: 1 copied, 1 already present" in str(report)
+        # CVs using gui_paths functions can be copied
+        safe_modules = self.fake_ops.netcdfplus.ObjectJSON.safe_modules
+        assert safe_modules == ['numpy', 'gui_paths']
+
+    def test_existing_output(self, monkeypatch, tmpdir):
+        tmpdir.join("merged.nc").write("")
+        with pytest.raises(RuntimeError):
+            self._merge(monkeypatch, tmpdir)
+
+    def test_compact(self, monkeypatch, tmpdir):
+        repacked = []
+        monkeypatch.setattr(storage_tools, 'repack',
+                            lambda filename, level: repacked.append(level))
+        self._merge(monkeypatch, tmpdir, compact=True, deflate_level=7)
+        assert repacked == [7]
+
+
+def test_trust_gui_paths():
+    paths = pytest.importorskip("openpathsampling")
+    from openpathsampling.netcdfplus import ObjectJSON
+    from ..fused_computes import fused_compute
+    from ..cv_store import stored_cv_value
+    trust_gui_paths()
+    trust_gui_paths()
+    assert ObjectJSON.safe_modules.count('gui_paths') == 1
+    # functions are stored by name, and loaded by importing them
+    for func in [fused_compute, stored_cv_value]:
+        dct = ObjectJSON.callable_to_dict(func)
+        assert dct == {'_module': func.__module__, '_name': func.__name__}
+        assert ObjectJSON.callable_from_dict(dct) is func
+
+
+def test_copy_store_batches():
+    source = FakeStorage("in.nc", mode='w')
+    for idx in range(5):
+        source.save(('steps', idx))
+    source.steps.cache.clear()
+    target = FakeStorage("out.nc", mode='w')
+
+    cache_sizes = []
+    target.sync_all = lambda: cache_sizes.append(
+        (len(source.steps.cache), len(target.steps.cache))
+    )
+    report = MergeReport()
+    storage_tools._copy_store(source, target, 'steps', 2, report)
+    assert len(target.steps) == 5
+    # synced after each batch, with both caches cleared afterwards
+    assert cache_sizes == [(2, 2), (2, 2), (1, 1)]
+    assert len(source.steps.cache) == 0
+    assert len(target.steps.cache) == 0
+    # stores missing from either file are skipped
+    del target.objects['trajectories']
+    storage_tools._copy_store(source, target, 'trajectories', 2, report)
+    assert report.copied == {'steps': 5}
+
+
+class TestRepack(object):
+    def test_repack(self, monkeypatch, tmpdir):
+        filename = str(tmpdir.join("merged.nc"))
+        with open(filename, 'w') as f:
+            f.write("uncompressed")
+        calls = []
+
+        def nccopy(cmd):
+            calls.append(cmd)
+            with open(cmd[-1], 'w') as f:
+                f.write("compressed")
+
+        monkeypatch.setattr(storage_tools.shutil, 'which',
+                            lambda name: "/usr/bin/" + name)
+        monkeypatch.setattr(storage_tools.subprocess, 'check_call', nccopy)
+        repack(filename, deflate_level=2)
+        assert calls == [["/usr/bin/nccopy", "-d", "2", "-s", filename,
+                          filename + ".repack"]]
+        with open(filename) as f:
+            assert f.read() == "compressed"
+        assert not os.path.exists(filename + ".repack")
+
+    def test_no_nccopy(self, monkeypatch, tmpdir):
+        monkeypatch.setattr(storage_tools.shutil, 'which', lambda name: None)
+        with pytest.raises(RuntimeError):
+            repack(str(tmpdir.join("merged.nc")))
@@ -0,0 +1,103 @@
+import io
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from ..trial_length import *
+
+
+class FakeEngine(object):
+    def __init__(self, n_frames_max):
+        self.options = {'n_frames_max': n_frames_max}
+
+
+class FakeDetails(object):
+    def __init__(self, rejection_reason):
+        self.rejection_reason = rejection_reason
+
+
+class FakeSample(object):
+    def __init__(self, length):
+        self.trajectory = [None] * length
+
+
+class FakeChange(object):
+    def __init__(self, length, accepted, rejection_reason=None):
+        self.trials = [FakeSample(length)]
+        self.accepted = accepted
+        self.details = FakeDetails(rejection_reason)
+
+
+class FakeResults(object):
+    def __init__(self, length, accepted, rejection_reason=None):
+        self.change = FakeChange(length, accepted, rejection_reason)
+
+
+class TestAdaptiveMaxLength(object):
+    def setup(self):
+        self.engines = [FakeEngine(10000), FakeEngine(10000)]
+        self.stream = io.StringIO()
+        self.hook = AdaptiveMaxLength(self.engines, multiple=2.0,
+                                      percentile=50.0, min_samples=5,
+                                      report_every=1000, stream=self.stream)
+
+    def _step(self, number, *args):
+        self.hook.after_step(None, number, None, None, FakeResults(*args),
+                             None)
+
+    def _lines(self):
+        return self.stream.getvalue().splitlines()
+
+    def test_no_cap_before_min_samples(self):
+        for number in range(1, 5):
+            self._step(number, 300, True)
+        assert self.hook.cap == 10000
+        assert self._lines() == []
+
+    def test_cap_follows_accepted_lengths(self):
+        for number in range(1, 6):
+            self._step(number, 300, True)
+        assert [e.options['n_frames_max'] for e in self.engines] == [600,
+                                                                     600]
+        assert self._lines() == [
+            "#maxlen step=5 cap=600 accepted=1 aborted=0 near_cap=0"
+        ]
+        # small changes don't move the cap
+        self._step(6, 310, True)
+        assert self.hook.cap == 600
+        assert len(self._lines()) == 1
+
+    def test_cap_limits(self):
+        for number in range(1, 6):
+            self._step(number, 10, True)
+        assert self.hook.cap == 100  # min_frames
+        for number in range(6, 30):
+            self._step(number, 9000, True)
+        assert self.hook.cap == 10000  # initial n_frames_max
+
+    def test_aborted(self):
+        for number in range(1, 6):
+            self._step(number, 300, True)
+        self._step(6, 600, False, 'max_length')
+        self._step(7, 50, False, 'some other reason')
+        assert self.hook.n_aborted == 1
+        assert self._lines()[-1] == "#maxlen aborted step=6 length=600 cap=600"
+        # without a reason, long rejected trials count as aborted
+        self.hook.record_trial(600, accepted=False)
+        self.hook.record_trial(200, accepted=False)
+        assert self.hook.n_aborted == 2
+
+    def test_near_cap(self):
+        self.hook.record_trial(8500, accepted=True)
+        self.hook.record_trial(7500, accepted=True)
+        assert self.hook.n_near_cap == 1
+
+    def test_summary(self):
+        for number in range(1, 5):
+            self._step(number, 300, True)
+        self._step(5, 10000, False)
+        self.hook.after_simulation(None)
+        summary = self._lines()[-1]
+        assert summary.startswith("Trial length cap: 10000 frames")
+        assert "5 trials: 80.0% accepted, 20.0% aborted" in summary
@@ -0,0 +1,182 @@
+"""
+Adaptive cap on the length of TPS trial paths.
+
+The engine's ``n_frames_max`` is a fixed cap, usually far above the length
+of any real transition path, so a trial stuck in a metastable intermediate
+runs for a long time before it is rejected. :class:`.AdaptiveMaxLength` is
+an OPS hook that lowers the engine's cap to a multiple of a high percentile
+of the lengths of the paths accepted so far. Trials reaching the cap are
+stopped there, and rejected by OPS.
+
+Each change of the cap, and a summary every ``report_every`` steps, is
+written as a line like::
+
+    #maxlen step=500 cap=1830 accepted=0.31 aborted=0.04 near_cap=0
+
+``aborted`` is the fraction of trials stopped by the cap, and ``near_cap``
+the number of accepted paths longer than ``near_fraction`` of the cap. If
+either is more than a few percent, the cap is probably cutting real
+transition paths, and ``multiple`` should be raised. Each aborted trial is
+also written, with the cap it ran into::
+
+    #maxlen aborted step=512 length=1830 cap=1830
+
+Like the other modules used by generated scripts, this must not import
+anything from the GUI (or OPS).
+"""
+import sys
+import collections
+
+import numpy as np
+
+MAXLEN_TAG = "#maxlen"
+
+
+def _rejection_reason(change):
+    details = getattr(getattr(change, 'canonical', change), 'details', None)
+    return getattr(details, 'rejection_reason', None)
+
+
+class AdaptiveMaxLength(object):
+    """OPS path simulator hook capping trial length from accepted paths.
+
+    Parameters
+    ----------
+    engines : list
+        the engines whose ``n_frames_max`` option is set; the cap never
+        goes above the first engine's initial value
+    multiple : float
+        the cap is this multiple of the percentile of accepted lengths
+    percentile : float
+        percentile (0-100) of the accepted path lengths
+    min_samples : int
+        number of accepted paths needed before the cap is lowered
+    window : int
+        only the lengths of this many most recent accepted paths are used
+    min_frames : int
+        the cap never goes below this
+    tolerance : float
+        the cap is only changed if the new value differs by more than this
+        fraction, so it doesn't change (and get logged) on every step
+    report_every : int
+        MC steps between summary lines
+    near_fraction : float
+        accepted paths longer than this fraction of the cap are counted as
+        near the cap
+    stream : file-like or None
+        where to write; default is ``sys.stdout`` at the time of writing
+    """
+    implemented_for = ['after_step', 'after_simulation']
+
+    def __init__(self, engines, multiple=3.0, percentile=95.0,
+                 min_samples=20, window=1000, min_frames=100, tolerance=0.05,
+                 report_every=100, near_fraction=0.8, stream=None):
+        self.engines = engines
+        self.multiple = multiple
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_frames = min_frames
+        self.tolerance = tolerance
+        self.report_every = report_every
+        self.near_fraction = near_fraction
+        self.stream = stream
+        self.max_cap = engines[0].options['n_frames_max']
+        self.lengths = collections.deque(maxlen=window)
+        self.n_trials = 0
+        self.n_accepted = 0
+        self.n_aborted = 0
+        self.n_near_cap = 0
+
+    @property
+    def cap(self):
+        return self.engines[0].options['n_frames_max']
+
+    def record_trial(self, length, accepted, aborted=None):
+        """Count a trial of ``length`` frames; True if it was aborted.
+
+        If ``aborted`` is None, a rejected trial counts as aborted by the
+        cap if it is at least as long as the cap.
+        """
+        self.n_trials += 1
+        if accepted:
+            self.n_accepted += 1
+            self.lengths.append(length)
+            if length > self.near_fraction * self.cap:
+                self.n_near_cap += 1
+        else:
+            if aborted is None:
+                aborted = length >= self.cap
+            if aborted:
+                self.n_aborted += 1
+        return bool(not accepted and aborted)
+
+    def target_cap(self):
+        """Cap from the accepted lengths so far"""
+        if len(self.lengths) < self.min_samples:
+            return self.max_cap
+        cap = int(np.ceil(self.multiple
+                          * np.percentile(self.lengths, self.percentile)))
+        return min(max(cap, self.min_frames), self.max_cap)
+
+    def update_cap(self):
+        """Set the engines' cap if the target moved; True if changed"""
+        cap = self.target_cap()
+        if abs(cap - self.cap) <= self.tolerance * self.cap:
+            return False
+        for engine in self.engines:
+            engine.options['n_frames_max'] = cap
+        return True
+
+    def _fraction(self, count):
+        return float(count) / self.n_trials if self.n_trials else 0.0
+
+    def status(self, step):
+        return ("{tag} step={step} cap={cap} accepted={accepted:.3g} "
+                "aborted={aborted:.3g} near_cap={near}").format(
+                    tag=MAXLEN_TAG, step=step, cap=self.cap,
+                    accepted=self._fraction(self.n_accepted),
+                    aborted=self._fraction(self.n_aborted),
+                    near=self.n_near_cap
+                )
+
+    def aborted_line(self, step, length):
+        return "{tag} aborted step={step} length={length} cap={cap}".format(
+            tag=MAXLEN_TAG, step=step, length=length, cap=self.cap
+        )
+
+    def summary(self):
+        return ("Trial length cap: {cap} frames ({multiple:g} x percentile "
+                "{percentile:g} of {n_lengths} accepted lengths). "
+                "{n_trials} trials: {accepted:.1%} accepted, {aborted:.1%} "
+                "aborted at the cap; {near} accepted paths were longer "
+                "than {near_fraction:.0%} of the cap.").format(
+                    cap=self.cap, multiple=self.multiple,
+                    percentile=self.percentile, n_lengths=len(self.lengths),
+                    n_trials=self.n_trials,
+                    accepted=self._fraction(self.n_accepted),
+                    aborted=self._fraction(self.n_aborted),
+                    near=self.n_near_cap, near_fraction=self.near_fraction
+                )
+
+    def _write(self, line):
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write(line + "\n")
+        stream.flush()
+
+    def after_step(self, sim, step_number, step_info, state, results,
+                   hook_state):
+        change = results.change
+        accepted = bool(getattr(change, 'accepted', False))
+        reason = _rejection_reason(change)
+        aborted = None if reason is None else reason == 'max_length'
+        for sample in getattr(change, 'trials', []):
+            length = len(sample.trajectory)
+            if self.record_trial(length, accepted, aborted):
+                # logged with the cap the trial ran into
+                self._write(self.aborted_line(step_number, length))
+        changed = self.update_cap()
+        if changed or step_number % self.report_every == 0:
+            self._write(self.status(step_number))
+
+    def after_simulation(self, sim, *args, **kwargs):
+        self._write(self.summary())
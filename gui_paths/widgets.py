@@ -0,0 +1,49 @@
+from PyQt5.QtCore import Qt, QPointF
+from PyQt5.QtGui import QPainter, QPen, QPolygonF
+from PyQt5.QtWidgets import QWidget
+
+
+class ProgressPlot(QWidget):
+    """Line plot of a :class:`.progress.ProgressHistory`.
+
+    Nothing is redrawn when data arrives; the owner calls ``update()`` when
+    it wants a redraw (e.g., on a timer), so fast output can't flood the
+    event loop.
+    """
+    margin = 40
+
+    def __init__(self, history, label="", parent=None):
+        super(ProgressPlot, self).__init__(parent)
+        self.history = history
+        self.label = label
+        self.setMinimumHeight(120)
+
+    def _polygon(self, width, height):
+        steps, values = self.history.steps, self.history.values
+        x_min, x_max = steps[0], steps[-1]
+        y_min, y_max = min(values), max(values)
+        x_range = float(x_max - x_min) or 1.0
+        y_range = float(y_max - y_min) or 1.0
+        return QPolygonF([
+            QPointF(self.margin + (x - x_min) / x_range * width,
+                    self.margin / 2 + (y_max - y) / y_range * height)
+            for x, y in zip(steps, values)
+        ])
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.white)
+        width = self.width() - 1.5 * self.margin
+        height = self.height() - 1.5 * self.margin
+        painter.drawRect(self.margin, self.margin // 2, int(width),
+                         int(height))
+        painter.drawText(self.margin, self.height() - 5, self.label)
+        if len(self.history) < 2:
+            return
+        values = self.history.values
+        painter.drawText(2, self.margin // 2 + 10, str(max(values)))
+        painter.drawText(2, self.margin // 2 + int(height), str(min(values)))
+        painter.drawText(self.width() - self.margin * 2, self.height() - 5,
+                         str(self.history.steps[-1]))
+        painter.setPen(QPen(Qt.blue, 1))
+        painter.drawPolyline(self._polygon(width, height))
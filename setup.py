@@ -38,7 +38,6 @@ Intended Audience :: Science/Research
 License :: OSI Approved :: MIT License
 Operating System :: POSIX
 Operating System :: Microsoft :: Windows
-Programming Language :: Python :: 2.7
 Programming Language :: Python :: 3
 Topic :: Scientific/Engineering :: Bio-Informatics
 Topic :: Scientific/Engineering :: Chemistry